@@ -29,9 +29,29 @@ class NotFoundResourceError(ApiException):
 # class UserNotFoundError(NotFoundResourceError):
 
 
+class TokensDisabledError(NotFoundResourceError):
+    code = 'tokens-disabled'
+    message = 'Token authentication is not configured'
+
+
+class SearchDisabledError(NotFoundResourceError):
+    code = 'search-disabled'
+    message = 'Full-text search is not set up (flask init-db --indexes-only --search)'
+
+
+# ---------------------------------- Код 503 --------------------------------- #
+class ServiceUnavailableError(ApiException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    code = 'service-unavailable'
+    message = 'No free database connection, try again later'
+
+
 api_exceptions = (
     BadRequestResourceError,
     NoInputDataError,
     NotFoundResourceError,
     NotUniqueDataError,
+    SearchDisabledError,
+    ServiceUnavailableError,
+    TokensDisabledError,
 )
\ No newline at end of file
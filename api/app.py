@@ -17,12 +17,35 @@ def create_app(config_filename):
         for exc in api_exceptions
     ]
 
-    # from .db import get_db
-    # with app.app_context():
-    #     get_db()
-    # db.init_app(app)
+    from .models import prepared_statements
+    prepared_statements.enabled = app.config.get('PG_PREPARED_STATEMENTS', False)
+
+    from .models import reference_cache
+    reference_cache.ttl = app.config.get('REFERENCE_CACHE_TTL', reference_cache.ttl)
+    reference_cache.maxsize = app.config.get('REFERENCE_CACHE_MAXSIZE', reference_cache.maxsize)
+
+    from .models import auth_cache
+    auth_cache.ttl = app.config.get('AUTH_CACHE_TTL', auth_cache.ttl)
+    auth_cache.maxsize = app.config.get('AUTH_CACHE_MAXSIZE', auth_cache.maxsize)
+
+    from .tokens import token_revocations
+    if not app.config.get('TOKEN_SECRET_KEY'):
+        app.logger.warning('TOKEN_SECRET_KEY не задан: токены доступа (/api/tokens/) выключены')
+    token_revocations.ttl = app.config.get('TOKEN_TTL', token_revocations.ttl)
+    token_revocations.sync_interval = app.config.get(
+        'TOKEN_REVOCATIONS_SYNC', token_revocations.sync_interval
+    )
+
+    from .db import init_pool
+    init_pool(app)
 
     from .views import api_bp
     app.register_blueprint(api_bp, url_prefix='/api')
 
+    from .models.depreciation import depreciation_command
+    app.cli.add_command(depreciation_command)
+
+    from .models.matviews import matviews_command
+    app.cli.add_command(matviews_command)
+
     return app
@@ -0,0 +1,58 @@
+"""Асинхронное приложение (Quart + asyncpg) с тем же API /api, что и create_app
+
+Запуск: hypercorn "api.asyncapp:create_async_app('api.config')"
+или quart --app "api.asyncapp:create_async_app('api.config')" run
+"""
+from quart import Quart, jsonify
+
+
+def create_async_app(config_filename):
+    app = Quart(__name__)
+    app.config.from_object(config_filename)
+
+    from flask_apiexceptions import ApiException
+
+    @app.errorhandler(ApiException)
+    async def api_exception_handler(api_exception):
+        return jsonify(api_exception.serialize()), api_exception.status_code
+
+    from .models import PoolTimeoutError
+    from .api_exceptions import ServiceUnavailableError
+
+    @app.errorhandler(PoolTimeoutError)
+    async def pool_timeout_handler(error):
+        return await api_exception_handler(ServiceUnavailableError())
+
+    from .models import reference_cache
+    reference_cache.ttl = app.config.get('REFERENCE_CACHE_TTL', reference_cache.ttl)
+    reference_cache.maxsize = app.config.get('REFERENCE_CACHE_MAXSIZE', reference_cache.maxsize)
+
+    from .models import auth_cache
+    auth_cache.ttl = app.config.get('AUTH_CACHE_TTL', auth_cache.ttl)
+    auth_cache.maxsize = app.config.get('AUTH_CACHE_MAXSIZE', auth_cache.maxsize)
+
+    from .tokens import token_revocations
+    if not app.config.get('TOKEN_SECRET_KEY'):
+        app.logger.warning('TOKEN_SECRET_KEY не задан: токены доступа (/api/tokens/) выключены')
+    token_revocations.ttl = app.config.get('TOKEN_TTL', token_revocations.ttl)
+    token_revocations.sync_interval = app.config.get(
+        'TOKEN_REVOCATIONS_SYNC', token_revocations.sync_interval
+    )
+
+    from .models.asyncdb import create_pool
+
+    @app.before_serving
+    async def open_pool():
+        app.extensions['asyncpg_pool'] = await create_pool(
+            min_size=app.config.get('PG_POOL_MIN', 1),
+            max_size=app.config.get('PG_POOL_MAX', 10),
+        )
+
+    @app.after_serving
+    async def close_pool():
+        await app.extensions.pop('asyncpg_pool').close()
+
+    from .asyncviews import api_bp
+    app.register_blueprint(api_bp, url_prefix='/api')
+
+    return app
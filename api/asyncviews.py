@@ -0,0 +1,503 @@
+"""Ресурсы /api для асинхронного приложения (Quart, см. asyncapp.py)
+
+Маршруты, параметры запросов и ответы - те же, что в views.py: разбор запроса,
+проверки и ошибки - общие (resources.py), здесь только чтение запроса
+и ожидание (await) асинхронных моделей. Токены доступа (/tokens/, Bearer)
+и их отзывы - общие с синхронным приложением (та же таблица token_revocations).
+Отличия: POST массива (массовое создание) и /reports/depreciation есть только
+в синхронном приложении.
+"""
+import functools
+import time
+
+import asyncpg
+from quart import Blueprint, Response, current_app, g, make_response, request, url_for
+from quart.views import MethodView
+
+from .models.asyncdb import AsyncPGCursor
+from .models.asyncmodels import (
+    AsyncBuildingModel,
+    AsyncChiefModel,
+    AsyncDepartmentModel,
+    AsyncHallModel,
+    AsyncMaterialModel,
+    AsyncSearchModel,
+    AsyncTargetModel,
+    AsyncTokenRevocationModel,
+    AsyncUnitModel,
+    AsyncUserModel,
+)
+from .models import auth_cache, reference_cache
+from .schemas import (
+    building_schema,
+    chief_schema,
+    department_schema,
+    hall_schema,
+    material_schema,
+    target_schema,
+    unit_schema,
+    user_schema,
+)
+from .filters import parse_fields, parse_filters
+from .pagination import KeysetPaginationHelper
+from .resources import (
+    bulk_deleted,
+    bulk_updated,
+    check_deleted,
+    check_entry,
+    check_found,
+    check_unique,
+    cost_report_response,
+    get_bulk_delete_ids,
+    get_token_secret,
+    get_unique_value,
+    get_user_role,
+    load_bulk_patch,
+    load_entry,
+    parse_cost_report_args,
+    parse_list_args,
+    parse_search_args,
+    return_minimal,
+    revoke_tokens,
+    search_response,
+    token_response,
+)
+from .streaming import aiter_json_array
+from .tokens import token_revocations, verify_token
+from .api_exceptions import (
+    BadRequestResourceError,
+    NoInputDataError,
+    SearchDisabledError,
+)
+from . import status
+from extras import identify_error
+
+
+def get_pool():
+    return current_app.extensions['asyncpg_pool']
+
+
+def get_db():
+    if 'db' not in g:
+        g.db = AsyncPGCursor(get_pool(), current_app.config.get('PG_POOL_TIMEOUT', 5.0))
+    return g.db
+
+
+def auth_error(code, scheme='Basic'):
+    """Ответ на неудачную аутентификацию (как у flask_httpauth)"""
+    headers = {}
+    if code == status.HTTP_401_UNAUTHORIZED:
+        headers['WWW-Authenticate'] = f'{scheme} realm="Authentication Required"'
+    return Response('Unauthorized Access', code, headers)
+
+
+async def check_token(token):
+    """Пользователь по токену Bearer (как views.check_token)"""
+    if not current_app.config.get('TOKEN_SECRET_KEY'):
+        # Токены выключены: заголовок Bearer не принимается
+        return None
+    if token_revocations.needs_sync():
+        # Отзывы, сделанные другими процессами
+        token_revocations.apply(await AsyncTokenRevocationModel(get_db()).select_active(time.time()))
+    return verify_token(get_token_secret(current_app.config), token, token_revocations)
+
+
+async def check_user_password(authorization):
+    """Пользователь по учетным данным Basic (повторный запрос - из кеша, без БД)"""
+    header = request.headers.get('Authorization', '')
+    if (user := auth_cache.get(header)) is None:
+        user = await AsyncUserModel(get_db()).sign_in(authorization.username, authorization.password)
+        if identify_error(user):
+            return None
+        auth_cache.set(header, user)
+    return user
+
+
+def login_required(role=None, bearer=True):
+    """Аутентификация Basic или Bearer (bearer=False - только Basic) с проверкой роли
+
+    :param role: admin или user (None - любая роль)
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            authorization = request.authorization
+            if bearer and authorization is not None and authorization.type == 'bearer':
+                if (user := await check_token(authorization.token)) is None:
+                    return auth_error(status.HTTP_401_UNAUTHORIZED, 'Bearer')
+            elif authorization is None or authorization.type != 'basic':
+                return auth_error(status.HTTP_401_UNAUTHORIZED)
+            elif (user := await check_user_password(authorization)) is None:
+                return auth_error(status.HTTP_401_UNAUTHORIZED)
+            if role is not None and get_user_role(user) != role:
+                return auth_error(status.HTTP_403_FORBIDDEN)
+            g.user = user
+            return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def forget_users(*ids):
+    """Сбросить кеш аутентификации и отозвать токены пользователей (как views.forget_users)"""
+    auth_cache.invalidate_user(*ids)
+    if ids and current_app.config.get('TOKEN_SECRET_KEY'):
+        await save_revocations(token_revocations.revoke_user(*ids))
+
+
+async def save_revocations(rows):
+    """Записать отзывы токенов в общую таблицу (для остальных процессов)"""
+    await AsyncTokenRevocationModel(get_db()).insert_many(rows, time.time())
+
+
+async def minimal_response():
+    """Пустой ответ на запрос с Prefer: return=minimal"""
+    response = await make_response('', status.HTTP_204_NO_CONTENT)
+    response.headers['Preference-Applied'] = 'return=minimal'
+    return response
+
+
+class AsyncKeysetPaginationHelper(KeysetPaginationHelper):
+    """Постраничная выдача коллекции для асинхронной модели"""
+    def get_config(self):
+        return current_app.config
+
+    def url_for(self, endpoint, **values):
+        return url_for(endpoint, **values)
+
+    async def paginate(self):
+        """Сериализованная страница и ссылка на следующую"""
+        limit = self.get_limit()
+        rows = await self.model.select_page(
+            limit + 1, self.get_after(), self.only, self.load, self.filters, self.sort
+        )
+        return self.get_page(rows, limit)
+
+
+async def stream_json_array(rows, schema):
+    """Ответ с JSON-массивом, передаваемым порциями"""
+    async def encode(chunks):
+        async for chunk in chunks:
+            yield chunk.encode()
+    chunk_size = current_app.config.get('STREAM_CHUNK_SIZE', 500)
+    return Response(encode(aiter_json_array(rows, schema, chunk_size)), mimetype='application/json')
+
+
+api_bp = Blueprint('api', __name__)
+
+
+class AdminAuthRequired:
+    """Добавляет аутентификацию администратора admin (как конфиг)"""
+    decorators = [login_required(role='admin')]
+
+
+class UserAuthRequiredResource(MethodView):
+    """Добавляет аутентификацию пользователя user (как ресурс)"""
+    decorators = [login_required(role='user')]
+
+
+# -------------------------- Базовые классы ресурса -------------------------- #
+class BaseResource(UserAuthRequiredResource):
+    """Базовый класс ресурса (get, patch, delete)"""
+    async def get(self, id):
+        model = self._model(get_db())
+        only = parse_fields(request.args, model, self._schema)
+        return self._schema.dump(check_found(await model.select_by_id(id, only), id))
+
+    async def patch(self, id):
+        model = self._model(get_db())
+        request_dict = await request.get_json(silent=True)
+        result = load_entry(self._schema, request_dict, partial=True)
+        if (value := get_unique_value(self._unique_key, request_dict)) is not None:
+            check_unique(self._unique_key, await model.is_unique(id, value))
+
+        entry = check_entry(await model.update_by_id(id, **result), id)
+        if return_minimal(request.headers):
+            return await minimal_response()
+        return self._schema.dump(entry)
+
+    async def delete(self, id):
+        check_deleted(await self._model(get_db()).delete(id), id)
+        return '', status.HTTP_204_NO_CONTENT
+
+
+class BaseListResource(UserAuthRequiredResource):
+    """Базовый класс ресурса для списка (get, post, массовые patch и delete)"""
+    async def get(self):
+        model = self._model(get_db())
+        params = parse_list_args(
+            request.args, model, self._schema,
+            current_app.config.get('LIST_RELATIONS_LOAD', 'selectin'),
+        )
+        if params.pop('stream'):
+            return await stream_json_array(model.iter_all(**params), self._schema)
+        return await AsyncKeysetPaginationHelper(request, model, self._schema, **params).paginate()
+
+    async def post(self):
+        if not request.is_json:
+            raise NoInputDataError()
+        try:
+            request_dict = await request.get_json()
+        except Exception as e:
+            raise BadRequestResourceError(info={'errors': str(e)})
+        if isinstance(request_dict, list):
+            raise BadRequestResourceError(info={'errors': 'Bulk create is not supported by the async API'})
+        result = load_entry(self._schema, request_dict)
+
+        model = self._model(get_db())
+        if (value := get_unique_value(self._unique_key, request_dict)) is not None:
+            check_unique(self._unique_key, await model.is_unique(None, value))
+
+        entry_create = check_entry(await model.create(**result))
+        if return_minimal(request.headers):
+            return await minimal_response()
+        return self._schema.dump(entry_create)
+
+    async def patch(self):
+        """Массовое изменение: {"ids": [...], "patch": {поля}}"""
+        ids, result, value = load_bulk_patch(
+            self._schema, self._unique_key, await request.get_json(silent=True)
+        )
+        model = self._model(get_db())
+        if value is not None:
+            check_unique(self._unique_key, await model.is_unique(ids[0], value))
+        return bulk_updated(ids, await model.bulk_update(ids, **result))
+
+    async def delete(self):
+        """Массовое удаление: {"ids": [...]} в теле или ?ids=1,2,3"""
+        ids = get_bulk_delete_ids(await request.get_json(silent=True), request.args)
+        return bulk_deleted(ids, await self._model(get_db()).bulk_delete(ids))
+
+
+# ---------------------- Инициализация целевых ресурсов ---------------------- #
+class UserBaseConfig(AdminAuthRequired):
+    _model = AsyncUserModel
+    _schema = user_schema
+    _unique_key = 'login'
+
+
+class UserResource(UserBaseConfig, BaseResource):
+    """Изменение и удаление пользователя сбрасывают его кеш аутентификации и токены"""
+    async def patch(self, id):
+        try:
+            return await super().patch(id)
+        finally:
+            await forget_users(id)
+
+    async def delete(self, id):
+        try:
+            return await super().delete(id)
+        finally:
+            await forget_users(id)
+
+
+class UserListResource(UserBaseConfig, BaseListResource):
+    """Массовые изменение и удаление сбрасывают кеш аутентификации и токены пользователей"""
+    async def patch(self):
+        result = await super().patch()
+        await forget_users(*result['updated'])
+        return result
+
+    async def delete(self):
+        result = await super().delete()
+        await forget_users(*result['deleted'])
+        return result
+
+
+class TargetBaseConfig:
+    _model = AsyncTargetModel
+    _schema = target_schema
+    _unique_key = 'target'
+
+
+class TargetResource(TargetBaseConfig, BaseResource):
+    """."""
+
+
+class TargetListResource(TargetBaseConfig, BaseListResource):
+    """."""
+
+
+class MaterialBaseConfig:
+    _model = AsyncMaterialModel
+    _schema = material_schema
+    _unique_key = 'material'
+
+
+class MaterialResource(MaterialBaseConfig, BaseResource):
+    """."""
+
+
+class MaterialListResource(MaterialBaseConfig, BaseListResource):
+    """."""
+
+
+class DepartmentBaseConfig:
+    _model = AsyncDepartmentModel
+    _schema = department_schema
+    _unique_key = None
+
+
+class DepartmentResource(DepartmentBaseConfig, BaseResource):
+    """."""
+
+
+class DepartmentListResource(DepartmentBaseConfig, BaseListResource):
+    """."""
+
+
+class BuildingBaseConfig:
+    _model = AsyncBuildingModel
+    _schema = building_schema
+    _unique_key = None
+
+
+class BuildingResource(BuildingBaseConfig, BaseResource):
+    """."""
+
+
+class BuildingListResource(BuildingBaseConfig, BaseListResource):
+    """."""
+
+
+class HallBaseConfig:
+    _model = AsyncHallModel
+    _schema = hall_schema
+    _unique_key = None
+
+
+class HallResource(HallBaseConfig, BaseResource):
+    """."""
+
+
+class HallListResource(HallBaseConfig, BaseListResource):
+    """."""
+
+
+class ChiefBaseConfig:
+    _model = AsyncChiefModel
+    _schema = chief_schema
+    _unique_key = None
+
+
+class ChiefResource(ChiefBaseConfig, BaseResource):
+    """."""
+
+
+class ChiefListResource(ChiefBaseConfig, BaseListResource):
+    """."""
+
+
+class UnitBaseConfig:
+    _model = AsyncUnitModel
+    _schema = unit_schema
+    _unique_key = None
+
+
+class UnitResource(UnitBaseConfig, BaseResource):
+    """."""
+
+
+class UnitListResource(UnitBaseConfig, BaseListResource):
+    """."""
+
+
+class StatsResource(AdminAuthRequired, MethodView):
+    """Статистика пула соединений asyncpg и кеша справочников"""
+    async def get(self):
+        pool = get_pool()
+        return {
+            'pool': {
+                'min': pool.get_min_size(),
+                'max': pool.get_max_size(),
+                'open': pool.get_size(),
+                'idle': pool.get_idle_size(),
+            },
+            'reference_cache': reference_cache.stats(),
+            'auth_cache': auth_cache.stats(),
+            'token_revocations': token_revocations.stats(),
+        }
+
+
+class TokenResource(MethodView):
+    """Токены доступа (как views.TokenResource)
+
+    post - обмен учетных данных Basic (любая роль) на токен Bearer;
+    delete (администратор) - отзыв: {"token": ...}, {"user": id} или {"all": true}.
+    """
+    @login_required(bearer=False)
+    async def post(self):
+        return token_response(current_app.config, g.user)
+
+    @login_required(role='admin')
+    async def delete(self):
+        await save_revocations(
+            revoke_tokens(current_app.config, await request.get_json(silent=True), token_revocations)
+        )
+        return '', status.HTTP_204_NO_CONTENT
+
+
+class CostReportResource(UserAuthRequiredResource):
+    """Итоги стоимости имущества (параметры - как у views.CostReportResource)"""
+    async def get(self):
+        model = AsyncUnitModel(get_db())
+        dimensions, mode, args = parse_cost_report_args(request.args, model)
+        if current_app.config.get('REPORTS_FROM_VIEWS'):
+            model = model.get_view_model()
+        rows = await model.select_cost_report(
+            dimensions,
+            grouping_sets=mode == 'sets',
+            filters=parse_filters(args, model, unit_schema),
+        )
+        return cost_report_response(dimensions, mode, rows)
+
+
+class SearchResource(UserAuthRequiredResource):
+    """Полнотекстовый поиск (параметры - как у views.SearchResource)"""
+    _resources = {
+        'buildings': BuildingResource,
+        'halls': HallResource,
+        'units': UnitResource,
+        'chiefs': ChiefResource,
+        'departments': DepartmentResource,
+    }
+
+    async def get(self):
+        query, limit, entities = parse_search_args(request.args, current_app.config, self._resources)
+        try:
+            rows = await AsyncSearchModel(get_db()).search(query, limit, entities)
+        except asyncpg.exceptions.UndefinedTableError:
+            raise SearchDisabledError()
+        return search_response(
+            query, entities, self._resources, rows,
+            lambda entity, id: url_for(
+                f'api.{self._resources[entity].__name__.lower()}', id=id, _external=True
+            ),
+        )
+
+
+# --------------------------------- Маршруты --------------------------------- #
+def add_resource(resource, rule):
+    """Маршрут ресурса с именем точки входа, как у Flask-RESTful (имя класса строчными)"""
+    api_bp.add_url_rule(rule, view_func=resource.as_view(resource.__name__.lower()))
+
+
+add_resource(UserListResource, '/users/')
+add_resource(UserResource, '/users/<int:id>')
+add_resource(TargetListResource, '/targets/')
+add_resource(TargetResource, '/targets/<int:id>')
+add_resource(MaterialListResource, '/materials/')
+add_resource(MaterialResource, '/materials/<int:id>')
+add_resource(DepartmentListResource, '/departments/')
+add_resource(DepartmentResource, '/departments/<int:id>')
+add_resource(BuildingListResource, '/buildings/')
+add_resource(BuildingResource, '/buildings/<int:id>')
+add_resource(HallListResource, '/halls/')
+add_resource(HallResource, '/halls/<int:id>')
+add_resource(ChiefListResource, '/chiefs/')
+add_resource(ChiefResource, '/chiefs/<int:id>')
+add_resource(UnitListResource, '/units/')
+add_resource(UnitResource, '/units/<int:id>')
+add_resource(StatsResource, '/stats/')
+add_resource(TokenResource, '/tokens/')
+add_resource(SearchResource, '/search')
+add_resource(CostReportResource, '/reports/costs')
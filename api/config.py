@@ -6,6 +6,42 @@ DEBUG = True
 PORT = 5000
 HOST = '127.0.0.1'
 
+# True - частые запросы (select_by_id, sign_in) готовятся на сервере (PREPARE)
+# один раз на соединение и дальше выполняются через EXECUTE
+PG_PREPARED_STATEMENTS = False
+
+# True - повторные чтения одной и той же строки в пределах запроса
+# берутся из карты идентичности, а не из БД (включается явно: чтение после
+# записи в том же запросе может вернуть строку из карты)
+IDENTITY_MAP = False
+
+# Кеш справочников (материалы, типы помещений, кафедры, ответственные)
+# Время жизни записи (сек.) и максимальное количество записей
+REFERENCE_CACHE_TTL = 300.0
+REFERENCE_CACHE_MAXSIZE = 1024
+
+# Кеш успешной Basic-аутентификации (без запроса к БД и хеширования пароля)
+# Время жизни записи (сек., 0 - выключен) и максимальное количество записей
+AUTH_CACHE_TTL = 60.0
+AUTH_CACHE_MAXSIZE = 1024
+
+# Токены доступа /api/tokens/: ключ подписи (общий для всех процессов; None - токены
+# выключены, работает только Basic) и время жизни токена (сек.)
+TOKEN_SECRET_KEY = os.environ.get('API_TOKEN_SECRET_KEY')
+TOKEN_TTL = 900
+# Отзывы токенов пишутся в таблицу token_revocations; раз в столько секунд процесс
+# перечитывает ее (отзыв, сделанный другим процессом, действует не позже чем через это время)
+TOKEN_REVOCATIONS_SYNC = 5.0
+
+# Пул соединений с Postgres
+# Сколько соединений открыть при старте и максимум одновременно открытых
+PG_POOL_MIN = 1
+PG_POOL_MAX = 10
+# Сколько секунд ждать свободного соединения (потом - 503)
+PG_POOL_TIMEOUT = 5.0
+# Через сколько секунд простоя соединение проверяется перед выдачей (SELECT 1)
+PG_POOL_CHECK_INTERVAL = 30.0
+
 # False - не регистрирует операторы, отправленные в stderr
 # SQLALCHEMY_ECHO = False
 # True - отслеживать модификацию объектов
@@ -20,7 +56,34 @@ HOST = '127.0.0.1'
 # SQLALCHEMY_MIGRATE_REPO = os.path.join(basedir, 'db_repository')
 
 # Глобальные параметры разбиения на страницы пагинации
-# Количество записей на странице
-# PAGINATION_PAGE_SIZE = 5
-# Название настройки в запросах для указания страницы, которую нужно получить
-# PAGINATION_PAGE_ARGUMENT_NAME = 'page'
+# Количество записей на странице (если в запросе не передан limit)
+PAGINATION_PAGE_SIZE = 100
+# Максимально допустимый limit в запросе
+PAGINATION_MAX_PAGE_SIZE = 1000
+
+# Потоковая выдача коллекции (?stream=1): сколько записей отправлять одной порцией
+STREAM_CHUNK_SIZE = 500
+
+# Массовое создание (POST массива): сколько строк проверять и вставлять за раз
+BULK_BATCH_SIZE = 500
+
+# Загрузка связанных записей в списках по умолчанию (?load= в запросе). Сами модели
+# по умолчанию связи не загружают (none); списки API отдают поля связанных записей,
+# поэтому включают загрузку явно:
+# none - без связей, joined - через JOIN, selectin - отдельный запрос на связь,
+# view - из материализованного представления (у моделей без него - как joined;
+# данные обновляет команда flask matviews, поэтому они отстают на несколько секунд)
+LIST_RELATIONS_LOAD = 'selectin'
+
+# True - отчет /api/reports/costs считается по материализованному представлению имущества
+REPORTS_FROM_VIEWS = False
+
+# Полнотекстовый поиск /api/search: сколько результатов на тип сущности
+# (если в запросе не передан limit) и максимально допустимый limit
+SEARCH_LIMIT = 5
+SEARCH_MAX_LIMIT = 50
+
+# Амортизация /api/reports/depreciation: на сколько месяцев строить график списания
+# (если в запросе не передан months) и максимально допустимое значение
+DEPRECIATION_MONTHS = 12
+DEPRECIATION_MAX_MONTHS = 120
@@ -1,17 +1,47 @@
 from flask import g, current_app
 
-from .models import PGCursor
+from .models import ConnectionPool, IdentityMap, PGCursor, PoolTimeoutError
+from .api_exceptions import ServiceUnavailableError
+
+
+def init_pool(app):
+    """Создать пул соединений приложения (настройки PG_POOL_* из конфига)
+
+    Соединения пул открывает при первом запросе, а не здесь.
+    """
+    app.extensions['pg_pool'] = ConnectionPool(
+        minconn=app.config.get('PG_POOL_MIN', 1),
+        maxconn=app.config.get('PG_POOL_MAX', 10),
+        timeout=app.config.get('PG_POOL_TIMEOUT', 5.0),
+        check_interval=app.config.get('PG_POOL_CHECK_INTERVAL', 30.0),
+    )
+    app.teardown_appcontext(teardown_db)
+
+
+def get_pool():
+    return current_app.extensions['pg_pool']
 
 
 def get_db():
     if 'db' not in g:
-        g.db = PGCursor()
+        try:
+            g.db = PGCursor(
+                pool=get_pool(),
+                identity_map=IdentityMap() if current_app.config.get('IDENTITY_MAP') else None,
+            )
+        except PoolTimeoutError:
+            raise ServiceUnavailableError()
 
     return g.db
 
-# @current_app.teardown_appcontext
-# def teardown_db(exception):
-#     db = g.pop('db', None)
 
-#     if db is not None:
-#         db.close()
\ No newline at end of file
+def teardown_db(exception):
+    db = g.pop('db', None)
+
+    if db is not None:
+        if db.identity_map is not None:
+            current_app.logger.debug(
+                'identity map: сэкономлено запросов %(hits)d, выполнено %(misses)d',
+                db.identity_map.stats()
+            )
+        db.close()
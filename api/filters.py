@@ -0,0 +1,122 @@
+from marshmallow import ValidationError, fields
+
+from .api_exceptions import BadRequestResourceError
+from .models import LOAD_STRATEGIES
+
+
+# Параметры запроса коллекции, которые не являются фильтрами
+RESERVED_ARGS = {'fields', 'load', 'stream', 'limit', 'cursor', 'sort'}
+
+
+def get_schema_columns(schema):
+    """Поля схемы, которые отдаются клиенту: {имя поля или data_key: (колонка, поле)}"""
+    columns = {}
+    for name, field in schema.fields.items():
+        if not field.load_only:
+            column = field.attribute or name
+            columns[name] = columns[field.data_key or name] = (column, field)
+    return columns
+
+
+def parse_fields(args, model, schema):
+    """Колонки из параметра ?fields= (имена полей схемы или их data_key)
+
+    None - параметр не задан, выбираются все колонки.
+    """
+    names = args.get('fields')
+    if not names:
+        return None
+    aliases = get_schema_columns(schema)
+    catalog = model.get_columns_catalog()
+    columns, unknown = [], []
+    for name in filter(None, map(str.strip, names.split(','))):
+        column = aliases.get(name, (None, None))[0]
+        if column is None or column not in catalog:
+            unknown.append(name)
+        elif column not in columns:
+            columns.append(column)
+    if unknown:
+        raise BadRequestResourceError(info={'fields': f'Unknown fields: {", ".join(unknown)}'})
+    return columns or None
+
+
+def parse_load(args, default='joined'):
+    """Способ загрузки связей из параметра ?load= (см. LOAD_STRATEGIES)"""
+    load = args.get('load', default)
+    if load not in LOAD_STRATEGIES:
+        raise BadRequestResourceError(info={'load': f'Must be one of: {", ".join(LOAD_STRATEGIES)}'})
+    return load
+
+
+def get_model_field(model, schema, name, param):
+    """Колонка и поле схемы по имени из запроса (только настоящие колонки модели)"""
+    column, field = get_schema_columns(schema).get(name, (None, None))
+    if column is None or column not in model.get_filter_columns():
+        raise BadRequestResourceError(info={param: f'Unknown field: {name}'})
+    return column, field
+
+
+def deserialize(field, value, param):
+    """Значение из строки запроса по типу поля схемы (без валидаторов поля)"""
+    try:
+        return type(field)().deserialize(value)
+    except ValidationError as e:
+        raise BadRequestResourceError(info={param: e.messages})
+
+
+def parse_filters(args, model, schema):
+    """Фильтры из параметров запроса: поле=значение или поле__оператор=значение
+
+    eq - равно (по умолчанию), in - через запятую, gt/gte/lt/lte - для чисел и дат,
+    range - две границы через запятую, prefix - начало строки, null - true/false.
+    :return: Список (колонка, оператор, значение) для BaseModel.get_condition
+    """
+    filters = []
+    for param in args:
+        if param in RESERVED_ARGS:
+            continue
+        name, _, operator = param.partition('__')
+        operator = operator or 'eq'
+        column, field = get_model_field(model, schema, name, param)
+        for value in args.getlist(param):
+            if operator == 'eq':
+                filters.append((column, 'eq', deserialize(field, value, param)))
+            elif operator == 'in':
+                values = [item for item in value.split(',') if item]
+                if not values:
+                    raise BadRequestResourceError(info={param: 'At least one value is required'})
+                filters.append((column, 'in', [deserialize(field, item, param) for item in values]))
+            elif operator in ('gt', 'gte', 'lt', 'lte', 'range'):
+                if not isinstance(field, (fields.Number, fields.Date, fields.DateTime)):
+                    raise BadRequestResourceError(info={param: 'Range filters need a number or a date field'})
+                if operator != 'range':
+                    filters.append((column, operator, deserialize(field, value, param)))
+                    continue
+                bounds = value.split(',')
+                if len(bounds) != 2:
+                    raise BadRequestResourceError(info={param: 'Range must be "from,to"'})
+                for bound, bound_operator in zip(bounds, ('gte', 'lte')):
+                    if bound:
+                        filters.append((column, bound_operator, deserialize(field, bound, param)))
+            elif operator == 'prefix':
+                if not isinstance(field, fields.String):
+                    raise BadRequestResourceError(info={param: 'Prefix filter needs a string field'})
+                filters.append((column, 'prefix', value))
+            elif operator == 'null':
+                filters.append((column, 'null', deserialize(fields.Boolean(), value, param)))
+            else:
+                raise BadRequestResourceError(info={param: f'Unknown operator: {operator}'})
+    return filters
+
+
+def parse_sort(args, model, schema):
+    """Сортировка из ?sort=поле,-поле (минус - по убыванию)
+
+    :return: Список (колонка, по убыванию) или None
+    """
+    sort = []
+    for name in filter(None, map(str.strip, args.get('sort', '').split(','))):
+        desc = name.startswith('-')
+        column, _ = get_model_field(model, schema, name.lstrip('-'), 'sort')
+        sort.append((column, desc))
+    return sort or None
@@ -1,11 +1,19 @@
-from .db import PGCursor, db_init
+from .basemodel import FILTER_OPERATORS, LOAD_STRATEGIES, prepared_statements
+from .cache import AuthCache, ReferenceCache, auth_cache, reference_cache
+from .identitymap import IdentityMap
+from .indexes import get_declared_indexes, get_unused_indexes, sync_indexes
+from .matviews import MATVIEW_MODELS, refresh_matviews, sync_matviews
+from .search import SEARCH_MODELS, sync_search
+from .db import ConnectionPool, PGCursor, PGNamedCursor, PoolTimeoutError, db_init
 from .models import (
     BuildingModel,
     ChiefModel,
     DepartmentModel,
     HallModel,
     MaterialModel,
+    SearchModel,
     TargetModel,
+    TokenRevocationModel,
     UnitModel,
     UserModel,
 )
@@ -0,0 +1,256 @@
+"""Асинхронная работа с Postgres (asyncpg)
+
+Запросы моделей собираются из psycopg2.sql, а asyncpg принимает значения только
+параметрами $1, $2... Поэтому запрос компилируется (compile_sql): литералы
+и параметры %s / %(имя)s становятся $n, значения передаются отдельно, в текст
+попадают только идентификаторы и константы моделей (basemodel.Constant). Одинаковые по форме запросы дают одинаковый
+текст - asyncpg кеширует их разбор на соединении.
+
+Синхронная версия передает часть значений строками (фильтры, курсоры keyset),
+и Postgres приводит их к типу колонки. asyncpg же требует значение точного типа,
+поэтому значения приводятся к типам параметров, которые вывел Postgres (bind_args).
+"""
+import asyncio
+import collections
+import contextlib
+import datetime as dt
+import decimal
+import re
+import threading
+
+import asyncpg
+from psycopg2 import sql
+
+from .basemodel import Constant
+from .config import PG_DB_NAME
+from .db import PoolTimeoutError
+
+# %s, %(имя)s и %% в тексте запроса (как у psycopg2 при переданных параметрах)
+PARAMETER_RE = re.compile(r'%(?:\((?P<name>[^)]*)\))?(?P<kind>.)', re.S)
+
+
+def quote_ident(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def quote_constant(value):
+    """Строковая константа модели в тексте запроса (standard_conforming_strings)"""
+    if not isinstance(value, str):
+        raise TypeError(f'Константа запроса должна быть строкой: {value!r}')
+    return "'" + value.replace("'", "''") + "'"
+
+
+def compile_sql(stmt, vars=None):
+    """Текст запроса с параметрами $1, $2... и список их значений
+
+    :param stmt: Запрос psycopg2.sql (или строка)
+    :param vars: Значения для %s (последовательность) или %(имя)s (словарь);
+                 без них знак % в тексте остается как есть (как в psycopg2)
+    """
+    parts, args, numbers = [], [], {}
+    positional = iter(()) if vars is None or isinstance(vars, dict) else iter(vars)
+
+    def bind(value):
+        args.append(value)
+        return f'${len(args)}'
+
+    def bind_var(name):
+        if not name:
+            try:
+                return bind(next(positional))
+            except StopIteration:
+                raise TypeError('Не хватает значений для параметров запроса') from None
+        # Повторяющийся именованный параметр - один и тот же $n
+        if name not in numbers:
+            numbers[name] = bind(vars[name])
+        return numbers[name]
+
+    def substitute(match):
+        if match['kind'] == '%' and match['name'] is None:
+            return '%'
+        if match['kind'] != 's':
+            raise ValueError(f'Неподдерживаемый параметр запроса: {match[0]!r}')
+        return bind_var(match['name'])
+
+    def walk(part):
+        if isinstance(part, sql.Composed):
+            for item in part.seq:
+                walk(item)
+        elif isinstance(part, sql.SQL):
+            parts.append(part.string if vars is None else PARAMETER_RE.sub(substitute, part.string))
+        elif isinstance(part, sql.Identifier):
+            parts.append('.'.join(map(quote_ident, part.strings)))
+        elif isinstance(part, Constant):
+            parts.append(quote_constant(part.wrapped))
+        elif isinstance(part, sql.Literal):
+            parts.append(bind(part.wrapped))
+        elif isinstance(part, sql.Placeholder):
+            parts.append(bind_var(part.name))
+        else:
+            raise TypeError(f'Неизвестная часть запроса: {type(part).__name__}')
+
+    walk(sql.SQL(stmt) if isinstance(stmt, str) else stmt)
+    if next(positional, None) is not None:
+        raise TypeError('Не все значения использованы в запросе')
+    return ''.join(parts), args
+
+
+def flatten(stmt):
+    """Тот же запрос с объединенными соседними кусками текста (для кешируемых скелетов)
+
+    Литералы остаются литералами - при компиляции они станут параметрами $n.
+    """
+    parts, text = [], []
+
+    def walk(part):
+        if isinstance(part, sql.Composed):
+            for item in part.seq:
+                walk(item)
+        elif isinstance(part, sql.SQL):
+            text.append(part.string)
+        elif isinstance(part, sql.Identifier):
+            text.append('.'.join(map(quote_ident, part.strings)))
+        else:
+            if text:
+                parts.append(sql.SQL(''.join(text)))
+                text.clear()
+            parts.append(part)
+
+    walk(stmt)
+    if text:
+        parts.append(sql.SQL(''.join(text)))
+    return sql.Composed(parts)
+
+
+def parse_bool(value):
+    return value.strip().lower() in ('t', 'true', 'y', 'yes', 'on', '1')
+
+
+# Приведение значения-строки к типу параметра (как это сделал бы Postgres)
+FROM_TEXT = {
+    'int2': int,
+    'int4': int,
+    'int8': int,
+    'oid': int,
+    'float4': float,
+    'float8': float,
+    'numeric': decimal.Decimal,
+    'bool': parse_bool,
+    'date': dt.date.fromisoformat,
+    'time': dt.time.fromisoformat,
+    'timestamp': dt.datetime.fromisoformat,
+    'timestamptz': dt.datetime.fromisoformat,
+}
+# Текстовые типы: значение передается строкой
+TEXT_TYPES = {'text', 'varchar', 'bpchar', 'name', 'unknown', 'regconfig'}
+
+
+def coerce(value, type_name):
+    """Значение в виде, который asyncpg примет для параметра типа type_name"""
+    if value is None:
+        return None
+    if type_name.endswith('[]'):
+        return [coerce(item, type_name[:-2]) for item in value]
+    if type_name in TEXT_TYPES:
+        return value if isinstance(value, str) else str(value)
+    if isinstance(value, str) and type_name in FROM_TEXT:
+        return FROM_TEXT[type_name](value)
+    if type_name in ('int2', 'int4', 'int8') and isinstance(value, decimal.Decimal):
+        return int(value)
+    if type_name == 'numeric' and isinstance(value, (int, float)):
+        return decimal.Decimal(str(value))
+    if type_name == 'timestamptz' and isinstance(value, dt.datetime) and value.tzinfo is None:
+        return value.astimezone()
+    return value
+
+
+class ParameterTypes:
+    """Типы параметров запросов (по тексту запроса), выведенные Postgres
+
+    Текст запроса зависит только от формы запроса, не от значений,
+    поэтому разбор (PREPARE) выполняется один раз на процесс для каждой формы.
+
+    :param maxsize: Сколько форм запросов помнить
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._types = collections.OrderedDict()
+
+    async def get(self, connection, query):
+        with self._lock:
+            types = self._types.get(query)
+            if types is not None:
+                self._types.move_to_end(query)
+                return types
+        statement = await connection.prepare(query)
+        types = tuple(param.name for param in statement.get_parameters())
+        with self._lock:
+            self._types[query] = types
+            while len(self._types) > self.maxsize:
+                self._types.popitem(last=False)
+        return types
+
+
+parameter_types = ParameterTypes()
+
+
+async def bind_args(connection, stmt, vars=None):
+    """Текст запроса и значения параметров, приведенные к их типам в запросе"""
+    query, args = compile_sql(stmt, vars)
+    if args:
+        types = await parameter_types.get(connection, query)
+        args = [coerce(value, type_name) for value, type_name in zip(args, types)]
+    return query, args
+
+
+async def init_connection(connection):
+    """Настройка нового соединения пула"""
+    # real (ts_rank) - из текста, как у psycopg2: 0.6079271, а не 0.6079270839691162
+    await connection.set_type_codec(
+        'float4', schema='pg_catalog', encoder=str, decoder=float, format='text'
+    )
+
+
+async def create_pool(dbname=PG_DB_NAME, min_size=1, max_size=10):
+    """Пул соединений asyncpg (параметры подключения - как в db.get_db)"""
+    return await asyncpg.create_pool(
+        database=dbname,
+        user='postgres',
+        password='root',
+        host='127.0.0.1',
+        port=5432,
+        min_size=min_size,
+        max_size=max_size,
+        init=init_connection,
+    )
+
+
+class AsyncPGCursor:
+    """Асинхронный аналог PGCursor: соединение из пула берется на одну транзакцию
+
+    Соединение не закрепляется за курсором, поэтому одним курсором
+    могут одновременно пользоваться несколько задач (asyncio.gather).
+
+    :param pool:    Пул asyncpg (см. create_pool)
+    :param timeout: Сколько секунд ждать свободного соединения (потом - PoolTimeoutError)
+    """
+    # Карта идентичности в асинхронной версии не используется
+    identity_map = None
+
+    def __init__(self, pool, timeout=None):
+        self.pool = pool
+        self.timeout = timeout
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        """Соединение в открытой транзакции (фиксация при выходе, откат при исключении)"""
+        try:
+            connection = await self.pool.acquire(timeout=self.timeout)
+        except asyncio.TimeoutError:
+            raise PoolTimeoutError('Нет свободного соединения в пуле')
+        try:
+            async with connection.transaction():
+                yield connection
+        finally:
+            await self.pool.release(connection)
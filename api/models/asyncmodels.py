@@ -0,0 +1,384 @@
+"""Асинхронные модели (asyncpg)
+
+Асинхронная модель - наследник обычной модели с примесью AsyncModelMixin.
+Запросы строят те же методы BaseModel (скелеты выборки, фильтры, сортировка,
+поиск, отчеты), а выполняют корутины примеси. Методы модели, которые
+просто возвращают результат execute_get_all (н-р, select_cost_report, search),
+в асинхронной модели возвращают корутину - их достаточно ожидать (await).
+
+Значения передаются параметрами $1, $2... (см. asyncdb.compile_sql): запросы
+одной формы имеют один текст, и asyncpg кеширует их разбор на соединении.
+"""
+from asyncpg.exceptions import ForeignKeyViolationError
+from psycopg2 import sql
+
+from .asyncdb import bind_args, flatten
+from .basemodel import ComposedProperty, backref
+from .cache import reference_cache
+from .models import (
+    BuildingModel,
+    ChiefModel,
+    DepartmentModel,
+    HallModel,
+    MaterialModel,
+    SearchModel,
+    TargetModel,
+    TokenRevocationModel,
+    UnitModel,
+    UserModel,
+)
+from extras import identify_error
+
+
+def as_dict(record):
+    """Строка asyncpg как словарь (как RealDictRow в синхронной версии)"""
+    return dict(record) if record is not None else None
+
+
+class AsyncModelMixin:
+    """Асинхронное выполнение запросов модели (ставится перед классом модели)"""
+    def __init__(self, connection):
+        self._connection = connection
+        # Связанные модели - тоже асинхронные (для проверки ссылок и догрузки связей)
+        self._fields = {
+            field: (
+                backref(ASYNC_MODELS[entity.reference](connection))
+                if isinstance(entity, backref) and isinstance(entity.reference, type)
+                else entity
+            )
+            for field, entity in self._fields.items()
+        }
+
+    def render(self, stmt):
+        """Скелет выборки остается запросом psycopg2.sql: его литералы - тоже параметры $n"""
+        return flatten(stmt)
+
+    async def execute(self, stmt, vars=None, is_returned=True):
+        """Провайдер выполнения запроса"""
+        async with self._connection.transaction() as pg:
+            query, args = await bind_args(pg, stmt, vars)
+            if not is_returned:
+                await pg.execute(query, *args)
+                return None
+            return as_dict(await pg.fetchrow(query, *args))
+
+    async def execute_get_one(self, stmt, vars=None):
+        """Провайдер выполнения запроса с возвратом одной строки"""
+        return await self.execute(stmt, vars)
+
+    async def execute_get_all(self, stmt, vars=None, setup=None):
+        """Провайдер выполнения запроса с возвратом всех найденных строк
+
+        :param setup: Запрос настройки (см. get_threshold_stmt) в той же транзакции
+        """
+        async with self._connection.transaction() as pg:
+            if setup is not None:
+                query, args = await bind_args(pg, setup)
+                await pg.fetch(query, *args)
+            query, args = await bind_args(pg, stmt, vars)
+            return [dict(record) for record in await pg.fetch(query, *args)]
+
+    async def execute_iter(self, stmt, vars=None, itersize=None, setup=None):
+        """Построчная выдача через курсор asyncpg (порциями по itersize строк)"""
+        async with self._connection.transaction() as pg:
+            if setup is not None:
+                query, args = await bind_args(pg, setup)
+                await pg.fetch(query, *args)
+            query, args = await bind_args(pg, stmt, vars)
+            async for record in pg.cursor(query, *args, prefetch=itersize or self._itersize):
+                yield dict(record)
+
+    async def select_by_id(self, index, only=None):
+        """Получение записи по id (справочники - через reference_cache)"""
+        if only is not None or not self._cached:
+            return await self.fetch_by_id(index, only)
+        row = reference_cache.get(self._table, ('by_id', str(index)))
+        if row is None:
+            row = await self.fetch_by_id(index)
+            if row is not None:
+                reference_cache.set(self._table, ('by_id', str(index)), row)
+        return row
+
+    async def fetch_by_id(self, index, only=None):
+        """Чтение записи по id из БД"""
+        rows = await self.execute_get_all(
+            sql.SQL('{} WHERE {}={}').format(
+                self.get_select_skeleton(only),
+                sql.Identifier(self._table, self._primary_key),
+                sql.Literal(index),
+            )
+        )
+        return rows[0] if rows else None
+
+    async def select_by_field(self, column, value, only=None):
+        """Выбор из колонки по ее содержимому"""
+        return await self.fetch_by_field(column, value, only)
+
+    async def is_unique(self, index, field):
+        """Проверка уникальности одного поля"""
+        rows = await self.select_by_field(self._unique_field, field)
+        return not rows or rows[0][self._primary_key] == index
+
+    async def check_refs(self, kwargs):
+        """Проверка существования id связанных таблиц (см. BaseModel.check_refs)"""
+        keys = [key for key in self.get_backrefs() if key in kwargs]
+        missing = [
+            key
+            for key in keys
+            if self._fields[key].reference._cached and
+            await self._fields[key].reference.select_by_id(kwargs[key]) is None
+        ]
+        stmt, vars = self.get_missing_refs_stmt({
+            key: [kwargs[key]]
+            for key in keys
+            if not self._fields[key].reference._cached
+        })
+        if stmt is not None:
+            missing.extend(row['field'] for row in await self.execute_get_all(stmt, vars))
+        return {
+            f'!error_{num}': f'Отсуствуют связанное поле "{key}" с индексом {kwargs[key]}'
+            for num, key in enumerate(missing, start=1)
+        }
+
+    async def get_refs_violation_error(self, input_fields):
+        """Ошибка записи, отклоненной внешним ключом (см. BaseModel.get_refs_violation_error)"""
+        self.forget_refs()
+        return await self.check_refs(input_fields) or {'!error': 'Отсуствуют связанные записи'}
+
+    async def create(self, **input_fields):
+        """Добавление новой записи"""
+        input_fields = self.prepare_create(input_fields, check_refs=False)
+        if identify_error(input_fields):
+            return input_fields
+        if errors := await self.check_refs(input_fields):
+            return errors
+        try:
+            row = await self.execute(self.get_create_stmt(input_fields), input_fields)
+        except ForeignKeyViolationError:
+            return await self.get_refs_violation_error(input_fields)
+        self.remember(row)
+        return row
+
+    async def update_by_id(self, index, **input_fields):
+        """Обновление данных существующей записи (см. BaseModel.update_by_id)"""
+        input_fields = self.prepare_update(input_fields, check_refs=False)
+        if identify_error(input_fields):
+            return input_fields
+        if errors := await self.check_refs(input_fields):
+            return errors
+        try:
+            row = await self.execute(self.get_update_stmt(index, input_fields), input_fields)
+        except ForeignKeyViolationError:
+            return await self.get_refs_violation_error(input_fields)
+        self.remember(row)
+        if row is None:
+            return self.not_found_error(index)
+        return row
+
+    async def delete(self, index):
+        """Удаление записи по id"""
+        deleted = await self.execute(self.get_delete_stmt(index))
+        self.remember(None)
+        if not deleted:
+            return self.not_found_error(index)
+
+    async def bulk_update(self, indexes, **input_fields):
+        """Обновление одних и тех же полей у нескольких записей одним запросом"""
+        input_fields = self.prepare_update(input_fields, check_refs=False)
+        if identify_error(input_fields):
+            return input_fields
+        if errors := await self.check_refs(input_fields):
+            return errors
+        try:
+            rows = await self.execute_get_all(
+                self.get_bulk_update_stmt(input_fields),
+                {**input_fields, '__indexes__': list(indexes)},
+            )
+        except ForeignKeyViolationError:
+            return await self.get_refs_violation_error(input_fields)
+        self.remember(None)
+        return [row[self._primary_key] for row in rows]
+
+    async def bulk_delete(self, indexes):
+        """Удаление нескольких записей одним запросом"""
+        rows = await self.execute_get_all(self.get_bulk_delete_stmt(), (list(indexes),))
+        self.remember(None)
+        return [row[self._primary_key] for row in rows]
+
+    async def select_like(self, field, key, order_by=None, only=None, threshold=None):
+        """Поиск по совпадению поля с частью содержимого поля"""
+        return await self.select_likes({field: key}, order_by, only, threshold)
+
+    def get_threshold_stmt(self, threshold):
+        """Порог похожести до конца транзакции (в SET LOCAL нельзя передать параметр $n)"""
+        super().get_threshold_stmt(threshold)
+        return sql.SQL("SELECT set_config('pg_trgm.word_similarity_threshold', {}, true)").format(
+            sql.Literal(str(float(threshold)))
+        )
+
+    async def select_likes(self, fields, order_by=None, only=None, threshold=None):
+        """Поиск по совпадению нескольких полей (порог похожести - в той же транзакции)"""
+        return await self.execute_get_all(
+            self.get_likes_stmt(fields, order_by, only, threshold),
+            setup=self.get_threshold_stmt(threshold) if threshold is not None else None,
+        )
+
+    async def load_relations(self, rows, load):
+        """Догрузить связанные записи по одному запросу на связь (load='selectin')"""
+        if load != 'selectin' or not rows:
+            return rows
+        for field, entity in self._fields.items():
+            if isinstance(entity, backref):
+                related = await entity.reference.select_in({row[field] for row in rows if row[field] is not None})
+                for row in rows:
+                    for column, value in related.get(row[field], {}).items():
+                        row.setdefault(column, value)
+        for entity in self._fields.values():
+            if isinstance(entity, ComposedProperty) and entity.composed_property['fields']:
+                for row in rows:
+                    row.setdefault(entity.composed_property['title'], entity.compute(row))
+        return rows
+
+    async def select_in(self, indexes):
+        """Записи по набору id одним запросом вместе со связями: {id: запись}"""
+        if not indexes:
+            return {}
+        if self._cached:
+            rows = [row for row in await self.select_all(load='joined') if row[self._primary_key] in indexes]
+        else:
+            rows = await self.load_relations(
+                await self.execute_get_all(
+                    sql.SQL('{} WHERE {} = ANY({})').format(
+                        self.get_select_skeleton(self.get_own_columns()),
+                        sql.Identifier(self._table, self._primary_key),
+                        sql.Literal(list(indexes)),
+                    )
+                ),
+                'selectin',
+            )
+        return {row[self._primary_key]: row for row in rows}
+
+    async def select_all(self, only=None, load='none', filters=None, sort=None):
+        """Выбрать всю таблицу (см. BaseModel.select_all)"""
+        if load == 'view':
+            return await self.get_view_model().select_all(only, 'joined', filters, sort)
+        if only is None and load != 'joined':
+            stmt = self.get_all_stmt(self.get_load_columns(only, load), filters, sort)
+            return await self.load_relations(await self.execute_get_all(stmt), load)
+        rows = None
+        cached = self._cached and only is None and not filters and not sort
+        if cached:
+            rows = reference_cache.get(self._table, ('all',))
+        if rows is None:
+            rows = await self.execute_get_all(self.get_all_stmt(only, filters, sort))
+            if cached:
+                reference_cache.set(self._table, ('all',), rows)
+        return rows
+
+    def iter_all(self, itersize=None, only=None, load='none', filters=None, sort=None):
+        """То же, что select_all, но строки выдаются по одной (асинхронный генератор)"""
+        if load == 'view':
+            return self.get_view_model().iter_all(itersize, only, 'joined', filters, sort)
+        columns = self.get_load_columns(only, load)
+        if only is None and load == 'selectin':
+            return self.iter_pages(itersize or self._itersize, load, filters, sort)
+        return self.execute_iter(self.get_all_stmt(columns, filters, sort), itersize=itersize)
+
+    async def iter_pages(self, size, load='none', filters=None, sort=None):
+        """Обход всей таблицы страницами select_page по size записей"""
+        after = None
+        while rows := await self.select_page(size, after, load=load, filters=filters, sort=sort):
+            for row in rows:
+                yield row
+            if len(rows) < size:
+                break
+            after = self.get_sort_key(rows[-1], sort)
+
+    async def select_page(self, limit, after=None, only=None, load='none', filters=None, sort=None):
+        """Выбрать страницу записей по ключу (см. BaseModel.select_page)"""
+        if load == 'view':
+            return await self.get_view_model().select_page(limit, after, only, 'joined', filters, sort)
+        columns = self.get_load_columns(only, load)
+        rows = await self.execute_get_all(self.get_query_stmt(columns, filters, sort, after, limit))
+        return rows if only is not None else await self.load_relations(rows, load)
+
+
+class AsyncUserModel(AsyncModelMixin, UserModel):
+    """Асинхронная модель пользователя"""
+    async def sign_in(self, login, password):
+        """Вход в программу (одним запросом по логину)"""
+        rows = await self.select_by_field('Login', login)
+        if not rows:
+            return {'!error': f'Пользователя с логином "{login}" не существует'}
+        if rows[0]['Password'] != self.encrypt(password):
+            return {'!error': 'Введенный пароль не совпадает'}
+        return {'id': rows[0][self._primary_key], 'is_admin': rows[0]['is_admin']}
+
+    async def create(self, **input_fields):
+        """Добавление нового пользователя"""
+        if await self.select_by_field('Login', input_fields['Login']):
+            return {'!error': f'''Пользователь с логином "{input_fields['Login']}" уже существует'''}
+        return await super().create(**input_fields)
+
+
+class AsyncMaterialModel(AsyncModelMixin, MaterialModel):
+    """."""
+
+
+class AsyncTargetModel(AsyncModelMixin, TargetModel):
+    """."""
+
+
+class AsyncDepartmentModel(AsyncModelMixin, DepartmentModel):
+    """."""
+
+
+class AsyncBuildingModel(AsyncModelMixin, BuildingModel):
+    """."""
+
+
+class AsyncHallModel(AsyncModelMixin, HallModel):
+    """."""
+
+
+class AsyncChiefModel(AsyncModelMixin, ChiefModel):
+    """."""
+
+
+class AsyncUnitModel(AsyncModelMixin, UnitModel):
+    """."""
+
+
+class AsyncSearchModel(AsyncModelMixin, SearchModel):
+    """."""
+
+
+class AsyncTokenRevocationModel(AsyncModelMixin, TokenRevocationModel):
+    """."""
+    async def ensure_table(self):
+        if not TokenRevocationModel._table_ready:
+            await self.execute(self._table_stmt, is_returned=False)
+            TokenRevocationModel._table_ready = True
+
+    async def select_active(self, now):
+        await self.ensure_table()
+        return await self.execute_get_all(self.get_select_active_stmt(), {'now': now})
+
+    async def insert_many(self, rows, now):
+        await self.ensure_table()
+        await self.execute(self.get_insert_many_stmt(), self.get_insert_many_vars(rows, now), is_returned=False)
+
+
+# Обычная модель -> асинхронная (для связей backref)
+ASYNC_MODELS = {
+    UserModel: AsyncUserModel,
+    MaterialModel: AsyncMaterialModel,
+    TargetModel: AsyncTargetModel,
+    DepartmentModel: AsyncDepartmentModel,
+    BuildingModel: AsyncBuildingModel,
+    HallModel: AsyncHallModel,
+    ChiefModel: AsyncChiefModel,
+    UnitModel: AsyncUnitModel,
+    SearchModel: AsyncSearchModel,
+    TokenRevocationModel: AsyncTokenRevocationModel,
+}
@@ -1,8 +1,95 @@
 import hashlib
-from psycopg2 import sql
+import re
+import weakref
 
-from .db import PGCursor
-from extras import identify_error, update_error_keys
+from psycopg2 import errors, sql
+from psycopg2.extras import execute_values
+
+from .cache import reference_cache
+from .db import PGCursor, PGNamedCursor
+from extras import batched, identify_error, update_error_keys
+
+
+class PreparedStatements:
+    """Реестр подготовленных на сервере (PREPARE/EXECUTE) запросов
+
+    Подготовленный запрос живет в сессии конкретного соединения, поэтому имена
+    запоминаются для каждого соединения отдельно. После переподключения
+    (новый объект соединения) запросы будут подготовлены заново.
+    """
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        # соединение -> множество имен подготовленных запросов
+        self._prepared = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+
+    def prepare(self, pg, name, stmt):
+        """Подготовить запрос в текущей сессии соединения"""
+        pg.execute(sql.SQL('PREPARE {} AS {}').format(sql.Identifier(name), stmt))
+        self._prepared.setdefault(pg.connection, set()).add(name)
+
+    def execute(self, pg, name, stmt, vars):
+        """Выполнить подготовленный запрос (подготовив его при первом обращении)
+
+        :param pg:   Курсор psycopg2
+        :param name: Имя подготовленного запроса
+        :param stmt: Запрос с параметрами вида $1, $2 ... (нужен только при подготовке)
+        :param vars: Значения параметров
+        """
+        execute_stmt = sql.SQL('EXECUTE {} ({})').format(
+            sql.Identifier(name),
+            sql.SQL(', ').join(sql.Placeholder() * len(vars))
+        )
+        if name in self._prepared.get(pg.connection, ()):
+            try:
+                pg.execute(execute_stmt, vars)
+                self.hits += 1
+                return
+            except errors.InvalidSqlStatementName:
+                # Сессия на сервере сброшена (например, DISCARD ALL) - готовим заново
+                pg.connection.rollback()
+                self._prepared[pg.connection].discard(name)
+        self.misses += 1
+        self.prepare(pg, name, stmt)
+        pg.execute(execute_stmt, vars)
+
+    def stats(self):
+        """Статистика попаданий в подготовленные запросы"""
+        return {
+            'enabled': self.enabled,
+            'hits': self.hits,
+            'misses': self.misses,
+            'connections': len(self._prepared),
+        }
+
+
+# Режим подготовленных запросов включается явно (см. PG_PREPARED_STATEMENTS в api/config.py)
+prepared_statements = PreparedStatements()
+
+# Способы загрузки связанных (backref) записей (по умолчанию в методах выборки - none,
+# связи загружаются только по явной просьбе вызывающего кода):
+# none - только своя таблица, joined - все связи через JOIN,
+# selectin - по одному дополнительному запросу WHERE pk = ANY(...) на связь,
+# view - из материализованного представления модели (_materialized_view, см. matviews.py):
+# одна таблица без JOIN, данные отстают до обновления представления; у модели
+# без представления - как joined
+LOAD_STRATEGIES = ('none', 'joined', 'selectin', 'view')
+
+# Операторы фильтров выборки (см. BaseModel.get_condition)
+FILTER_OPERATORS = ('eq', 'in', 'gt', 'gte', 'lt', 'lte', 'prefix', 'null')
+RANGE_OPERATORS = {'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<='}
+
+
+class Constant(sql.Literal):
+    """Строковая константа из описания модели (н-р, разделитель составного поля)
+
+    Для psycopg2 это обычный литерал. Асинхронная версия (asyncdb.compile_sql)
+    пишет ее в текст запроса, а не параметром $n: иначе одно и то же выражение
+    в SELECT и GROUP BY получает разные параметры и для Postgres уже не совпадает.
+    """
+# Строка, которая приводится к числу (числовые поля, хранимые строкой, см. _numeric_text_fields)
+NUMERIC_TEXT_PATTERN = r'^-?[0-9]+(\.[0-9]+)?$'
 
 
 class RequiredField:
@@ -14,11 +101,14 @@ class backref:
         self.reference = model_cls
 
     def __call__(self, pg):
-        """Возможно нам нужен только индекс ???"""
+        """Привязать ссылку к соединению
+
+        Возвращается новая ссылка, общий для класса модели backref не меняется:
+        иначе все экземпляры модели работали бы через соединение первого из них.
+        """
         if isinstance(pg, PGCursor):
-            self.reference = self.reference(pg)
-        else:
-            return self
+            return backref(self.reference(pg))
+        return self
 
     def check_id(self, index):
         """Проверить есть ли такой id"""
@@ -26,22 +116,44 @@ class backref:
 
     def select_all(self):
         """Весь список (для вывода списков в таблицах)"""
-        return self.reference.select_all()
+        return self.reference.select_all(load='joined')
 
-    def get_join(self, field, table):
-        """Добавить обратную ссылку как JOIN"""
+    def get_missing_stmt(self, field):
+        """Выбор отсутствующих id из массива-параметра (проверка только по первичному ключу)"""
+        # NOTE первичные ключи всех таблиц - serial (integer)
+        return sql.SQL(
+            'SELECT {} AS field, ref.id FROM unnest(%s::integer[]) AS ref(id) '
+            'WHERE NOT EXISTS (SELECT 1 FROM {} WHERE {} = ref.id)'
+        ).format(
+            sql.Literal(field),
+            sql.Identifier(self.reference._table),
+            sql.Identifier(self.reference._primary_key),
+        )
+
+    def get_join_clause(self, field, table):
+        """JOIN только этой ссылки (без вложенных)"""
         # Надо: JOIN {self.reference._table} ON {self.reference._table}.{self.reference._primary_key}
         # Объединять со своим Primay Key будет внешний родительский объект
-        refs = [
-            sql.Composed([
-                sql.SQL(' JOIN '),
-                sql.Identifier(self.reference._table),
-                sql.SQL(' ON '),
-                sql.Identifier(self.reference._table, self.reference._primary_key),
-                sql.SQL('='),
-                sql.Identifier(table, field)
-            ])
-        ]
+        return sql.Composed([
+            sql.SQL(' JOIN '),
+            sql.Identifier(self.reference._table),
+            sql.SQL(' ON '),
+            sql.Identifier(self.reference._table, self.reference._primary_key),
+            sql.SQL('='),
+            sql.Identifier(table, field)
+        ])
+
+    def collect_joins(self, field, table, joins):
+        """Дерево JOIN: список (таблица, родительская таблица, JOIN) в порядке get_join"""
+        joins.append((self.reference._table, table, self.get_join_clause(field, table)))
+        for title, ref in self.reference._fields.items():
+            if isinstance(ref, backref):
+                ref.collect_joins(title, self.reference._table, joins)
+        return joins
+
+    def get_join(self, field, table):
+        """Добавить обратную ссылку как JOIN"""
+        refs = [self.get_join_clause(field, table)]
         # refs = [b]
         # Это уже поиск других backref в самой ссылке backref (рекурсивно)
         # TODO слишком захламлен запрос, нужен рефакторинг рекурсивных ссылок
@@ -89,7 +201,7 @@ class ComposedProperty:
         """Получение одного SQL-скрипта для составного поля"""
         if self.composed_property['fields']:
             return sql.Composed([
-                sql.SQL(', CONCAT_WS({},').format(sql.Literal(self.composed_property['sep'])),
+                sql.SQL(', CONCAT_WS({},').format(Constant(self.composed_property['sep'])),
                 # sql.SQL(', ').join(map(lambda s: sql.Identifier(self._table, s), self.composed_property['fields'])),
                 sql.SQL(', ').join(map(self.prepare_identifier, self.composed_property['fields'])),
                 sql.SQL(') AS {} ').format(sql.Identifier(self.composed_property['title']))
@@ -98,15 +210,57 @@ class ComposedProperty:
         else:
             return sql.SQL(' ')
 
+    def get_expression(self):
+        """Выражение составного поля без алиаса (для узкой выборки)"""
+        return sql.SQL('CONCAT_WS({}, {})').format(
+            Constant(self.composed_property['sep']),
+            sql.SQL(', ').join(map(self.prepare_identifier, self.composed_property['fields'])),
+        )
+
+    def compute(self, row):
+        """Значение составного поля по уже выбранной строке (как CONCAT_WS, NULL пропускаются)"""
+        values = (row.get(field.split('.')[-1]) for field in self.composed_property['fields'])
+        return self.composed_property['sep'].join(str(value) for value in values if value is not None)
+
+    def get_tables(self):
+        """Таблицы, из которых складывается составное поле"""
+        return {
+            field.split('.')[0] if '.' in field else self._table
+            for field in self.composed_property['fields']
+        }
+
 
 class BaseModel:
+    # True - справочная таблица: select_by_id/select_all читаются через reference_cache
+    _cached = False
+    # Сколько строк за раз забирает серверный курсор в iter_all/iter_likes
+    _itersize = 2000
+    # Сколько строк проверяется и вставляется за раз в bulk_create
+    _bulk_batch_size = 500
+    # Текстовые колонки своей таблицы с поиском подстроки (триграммный индекс pg_trgm)
+    _search_fields = ()
+    # Колонки документа полнотекстового поиска из полной выборки (см. search.py), первая - заголовок
+    _fulltext_fields = ()
+    # Сколько разных узких выборок (наборов колонок) хранится на класс модели
+    _projections_maxsize = 256
+    # Материализованное представление с колонками полной выборки (см. matviews.py),
+    # из него читается load='view'; None - представления нет
+    _materialized_view = None
+    # Числовые поля, которые хранятся в БД строкой (VARCHAR): диапазоны и сортировка
+    # по ним считаются по числу, а не по строке (иначе '10' < '9')
+    _numeric_text_fields = ()
 
     def __init__(self, connection):
         self._connection = connection
-        # Инициализировать модели в обратных ссылках
-        for field, entity in self._fields.items():
-            if isinstance(entity, backref) and isinstance(entity.reference, type):
+        # Инициализировать модели в обратных ссылках (для этого экземпляра)
+        self._fields = {
+            field: (
                 entity(self._connection)
+                if isinstance(entity, backref) and isinstance(entity.reference, type)
+                else entity
+            )
+            for field, entity in self._fields.items()
+        }
 
     def encrypt(self, password):
         """Шифрование, н-р, пароля"""
@@ -128,6 +282,13 @@ class BaseModel:
             row = pg.fetchone()
         return row
 
+    def execute_prepared_get_one(self, name, stmt, vars):
+        """Провайдер выполнения подготовленного запроса с возвратом одной строки"""
+        with self._connection as pg:
+            prepared_statements.execute(pg, name, stmt, vars)
+            row = pg.fetchone()
+        return row
+
     def execute_get_all(self, stmt, vars=None):
         """Провайдер выполнения запроса с возвратом всех найденных строк"""
         with self._connection as pg:
@@ -135,6 +296,27 @@ class BaseModel:
             rows = pg.fetchall()
         return rows
 
+    def execute_copy(self, stmt, file):
+        """Провайдер выполнения COPY ... TO STDOUT в файловый объект (массовая выгрузка)"""
+        with self._connection as pg:
+            pg.copy_expert(stmt, file)
+
+    def execute_iter(self, stmt, vars=None, itersize=None, setup=None):
+        """Провайдер выполнения запроса с построчной выдачей через серверный курсор
+
+        Строки забираются с сервера порциями по itersize, поэтому в памяти
+        не бывает больше одной порции. Пока генератор не исчерпан, транзакция
+        открыта: другие запросы через это же соединение до конца обхода
+        выполнять нельзя (их фиксация закроет курсор).
+        """
+        with PGNamedCursor(self._connection, itersize or self._itersize) as pg:
+            if setup is not None:
+                # Настройка (SET LOCAL) в той же транзакции, что и курсор
+                with pg.connection.cursor() as setup_cursor:
+                    setup_cursor.execute(setup)
+            pg.execute(stmt, vars)
+            yield from pg
+
     def clean_fields(self, kwargs):
         """Очистить kwargs от данных, которых нет в списке полей, и от ComposedProperty (это не нужно писать в БД)"""
         return {
@@ -151,8 +333,12 @@ class BaseModel:
             if isinstance(value, RequiredField)
         }
 
-    def for_create(self, kwargs):
-        """Подготовка инициализации полей"""
+    def for_create(self, kwargs, check_refs=True):
+        """Подготовка инициализации полей
+
+        :param check_refs: Проверять ли существование id связанных таблиц
+                           (массовая вставка проверяет их сама сразу для пачки)
+        """
         kwargs = self.clean_fields(kwargs)
         # Добавить поля, заданные по умолчанию, если они не переданы
         for key, value in self._fields.items():
@@ -163,7 +349,7 @@ class BaseModel:
                     (not value and not isinstance(kwargs[key], type(value)))
                 ):
                     kwargs[key] = value
-        missing_fields = self.get_required() - set(kwargs.keys())
+        missing_fields = (self.get_required() | self.get_backrefs()) - set(kwargs.keys())
         if missing_fields:
             return {
                 '!error': 'Отсуствуют обязательные поля: {}'.format(
@@ -171,18 +357,15 @@ class BaseModel:
                 )
             }
         # Только проверка существования id из другой таблицы
-        for key, entity in self._fields.items():
-            if isinstance(entity, backref):
-                # проверить, есть ли backref с таким id
-                row = entity.check_id(kwargs[key])
-                if not row:
-                    return {
-                        '!error': f'Отсуствуют связанное поле "{key}" с индексом {kwargs[key]}'
-                    }
+        if check_refs and (errors := self.check_refs(kwargs)):
+            return errors
         return kwargs
 
-    def for_update(self, kwargs):
-        """Подготовка обновления полей БД"""
+    def for_update(self, kwargs, check_refs=True):
+        """Подготовка обновления полей БД
+
+        :param check_refs: Проверять ли существование id связанных таблиц
+        """
         # Только выкинуть отсутствующие поля и зашифровать пароль
         if not kwargs:
             return {
@@ -201,57 +384,180 @@ class BaseModel:
                 ):
                     kwargs[key] = self._fields[key]
         # Только проверка существования id из другой таблицы
-        for key, entity in self._fields.items():
-            if isinstance(entity, backref):
-                # NOTE правка для веб-версии
-                if key not in kwargs:
-                    continue
-                # проверить, есть ли backref с таким id
-                row = entity.check_id(kwargs[key])
-                if not row:
-                    return {
-                        '!error': f'Отсуствуют связанное поле "{key}" с индексом {kwargs[key]}'
-                    }
+        # NOTE правка для веб-версии: проверяются только переданные ссылки
+        if check_refs and (errors := self.check_refs(kwargs)):
+            return errors
         return kwargs
 
-    def select_by_id(self, index):
-        """Получение записи по id"""
-        stmt = sql.SQL('SELECT *{}{}FROM {}{} WHERE {}={}').format(
-            self.get_backref_composed(),
-            self.get_composed_properties(),
-            sql.Identifier(self._table),
-            self.get_all_join(),
-            sql.Identifier(self._primary_key),
+    def get_backrefs(self):
+        """Названия колонок - ссылок на другие таблицы"""
+        return {
+            key
+            for key, value in self._fields.items()
+            if isinstance(value, backref)
+        }
+
+    def get_missing_refs_stmt(self, refs):
+        """Один запрос на проверку всех ссылок: какие id отсутствуют в связанных таблицах
+
+        :param refs: Словарь {поле-ссылка: список id}
+        :return: Пара (запрос, параметры) или (None, None), если проверять нечего;
+                 запрос возвращает строки (field, id) для отсутствующих записей
+        """
+        refs = {key: list(indexes) for key, indexes in refs.items() if indexes}
+        if not refs:
+            return None, None
+        stmt = sql.SQL(' UNION ALL ').join(
+            self._fields[key].get_missing_stmt(key)
+            for key in refs
+        )
+        return stmt, list(refs.values())
+
+    def check_refs(self, kwargs):
+        """Проверка существования id связанных таблиц (только по первичным ключам, одним запросом)
+
+        Ссылки на справочники (_cached) проверяются через кеш справочника.
+        """
+        keys = [key for key in self.get_backrefs() if key in kwargs]
+        missing = [
+            key
+            for key in keys
+            if self._fields[key].reference._cached and
+            self._fields[key].reference.select_by_id(kwargs[key]) is None
+        ]
+        stmt, vars = self.get_missing_refs_stmt({
+            key: [kwargs[key]]
+            for key in keys
+            if not self._fields[key].reference._cached
+        })
+        if stmt is not None:
+            missing.extend(row['field'] for row in self.execute_get_all(stmt, vars))
+        return {
+            f'!error_{num}': f'Отсуствуют связанное поле "{key}" с индексом {kwargs[key]}'
+            for num, key in enumerate(missing, start=1)
+        }
+
+    def forget_refs(self):
+        """Сбросить кеш справочников, на которые ссылается модель"""
+        for key in self.get_backrefs():
+            reference = self._fields[key].reference
+            if reference._cached:
+                reference_cache.invalidate(reference._table)
+
+    def get_refs_violation_error(self, input_fields):
+        """Ошибка записи, отклоненной внешним ключом (как у check_refs, а не 500)
+
+        Ссылка на справочник могла пройти проверку по устаревшей записи кеша
+        (строку удалили в обход приложения или в другом процессе): кеш справочников
+        сбрасывается, и ссылки проверяются заново по БД.
+        """
+        self.forget_refs()
+        return self.check_refs(input_fields) or {'!error': 'Отсуствуют связанные записи'}
+
+    def get_identity_map(self):
+        """Карта идентичности текущего соединения (None, если не используется)"""
+        return getattr(self._connection, 'identity_map', None)
+
+    def remember(self, row):
+        """Сбросить устаревшие строки таблицы (кеш справочника, карта идентичности) и запомнить новую"""
+        if self._cached:
+            reference_cache.invalidate(self._table)
+        if (identity_map := self.get_identity_map()) is not None:
+            identity_map.invalidate(self._table)
+            if row is not None and not identify_error(row):
+                identity_map.add(self, row)
+
+    def get_joined_tables(self):
+        """Таблица модели и все таблицы, присоединяемые к ней через backref (рекурсивно)"""
+        tables = {self._table}
+        for entity in self._fields.values():
+            if isinstance(entity, backref):
+                tables |= entity.reference.get_joined_tables()
+        return tables
+
+    def select_by_id(self, index, only=None):
+        """Получение записи по id (повторно в пределах запроса - из карты идентичности)
+
+        :param only: Список колонок для узкой выборки (None - все колонки).
+                     Узкая выборка идет мимо карты идентичности и кеша справочников
+        """
+        if only is not None:
+            return self.fetch_by_id(index, only)
+        identity_map = self.get_identity_map()
+        if identity_map is not None and (row := identity_map.get(self._table, index)) is not None:
+            return row
+        if self._cached:
+            row = reference_cache.get_or_load(
+                self._table, ('by_id', str(index)), lambda: self.fetch_by_id(index)
+            )
+        else:
+            row = self.fetch_by_id(index)
+        if identity_map is not None and row is not None:
+            identity_map.add(self, row)
+        return row
+
+    def fetch_by_id(self, index, only=None):
+        """Чтение записи по id из БД"""
+        if prepared_statements.enabled and only is None:
+            return self.execute_prepared_get_one(
+                f'{self._table}_select_by_id',
+                sql.SQL('{} WHERE {}=$1').format(
+                    self.get_select_skeleton(),
+                    sql.Identifier(self._primary_key)
+                ),
+                (index,)
+            )
+        stmt = sql.SQL('{} WHERE {}={}').format(
+            self.get_select_skeleton(only),
+            sql.Identifier(self._table, self._primary_key),
             sql.Literal(index)
         )
         # print(stmt.as_string(self._connection.connection))
         return self.execute_get_one(stmt)
 
-
-    def select_by_field(self, column, value):
+    def select_by_field(self, column, value, only=None):
         """Выбор из колонки по ее содержимому"""
-        stmt = sql.SQL('SELECT *{}{}FROM {}{} WHERE {}={}').format(
-            self.get_backref_composed(),
-            self.get_composed_properties(),
-            sql.Identifier(self._table),
-            self.get_all_join(),
+        if only is not None:
+            return self.fetch_by_field(column, value, only)
+        identity_map = self.get_identity_map()
+        if identity_map is not None and (rows := identity_map.get_by_field(self._table, column, value)) is not None:
+            return rows
+        rows = self.fetch_by_field(column, value)
+        if identity_map is not None:
+            identity_map.add_by_field(self, column, value, rows)
+        return rows
+
+    def fetch_by_field(self, column, value, only=None):
+        """Чтение записей по значению колонки из БД"""
+        stmt = sql.SQL('{} WHERE {}={}').format(
+            self.get_select_skeleton(only, self.get_where_tables((column,), only)),
             sql.Identifier(column),
             sql.Literal(value)
         )
         return self.execute_get_all(stmt)
 
+    def not_found_error(self, index):
+        """Ошибка: записи с таким id нет (ключ !not_found позволяет отличить ее от прочих)"""
+        return {
+            '!error': f'{self._entity_name} с номером {index} не существует',
+            '!not_found': True,
+        }
+
     def delete(self, index):
-        """Удаление записи по id"""
-        if not self.select_by_id(index):
-            return {
-                '!error': f'{self._entity_name} с номером {index} не существует'
-            }
-        stmt = sql.SQL('DELETE FROM {} WHERE {}={}').format(
+        """Удаление записи по id (отсутствие записи определяется по RETURNING, без чтения)"""
+        deleted = self.execute(self.get_delete_stmt(index))
+        self.remember(None)
+        if not deleted:
+            return self.not_found_error(index)
+
+    def get_delete_stmt(self, index):
+        """Запрос удаления записи по id"""
+        return sql.SQL('DELETE FROM {} WHERE {}={} RETURNING {}').format(
             sql.Identifier(self._table),
             sql.Identifier(self._primary_key),
-            sql.Literal(index)
+            sql.Literal(index),
+            sql.Identifier(self._primary_key)
         )
-        self.execute(stmt, is_returned=False)
 
     def clean_input_fields(self, input_fields):
         """Очистить входные поля"""
@@ -268,52 +574,269 @@ class BaseModel:
     def create(self, **input_fields):
         """Добавление новой записи"""
         # подготовка данных
+        input_fields = self.prepare_create(input_fields)
+        if identify_error(input_fields):
+            return input_fields
+        # print(input_fields)
+        try:
+            row = self.execute(self.get_create_stmt(input_fields), input_fields)
+        except errors.ForeignKeyViolation:
+            return self.get_refs_violation_error(input_fields)
+        self.remember(row)
+        return row
+
+    def prepare_create(self, input_fields, check_refs=True):
+        """Поля новой записи: очистка, значения по умолчанию, проверки, шифрование пароля"""
         input_fields = self.clean_input_fields(input_fields)
-        input_fields = self.for_create(input_fields)
+        input_fields = self.for_create(input_fields, check_refs)
         if identify_error(input_fields):
             return input_fields
         if errors := self.validate(input_fields):
             return errors
         if 'Password' in input_fields:
             input_fields['Password'] = self.encrypt(input_fields['Password'])
-        stmt = sql.SQL('INSERT INTO {} ({}) VALUES ({}) RETURNING *').format(
+        return input_fields
+
+    def get_create_stmt(self, input_fields):
+        """Запрос добавления записи (значения - именованные параметры) с полной выборкой"""
+        return self.with_joined_returning(
+            sql.SQL('INSERT INTO {} ({}) VALUES ({}) RETURNING *').format(
+                sql.Identifier(self._table),
+                sql.SQL(', ').join(map(sql.Identifier, input_fields.keys())),
+                sql.SQL(', ').join(map(sql.Placeholder, input_fields.keys()))
+            )
+        )
+
+    def with_joined_returning(self, write_stmt):
+        """Обернуть INSERT/UPDATE ... RETURNING * в CTE и вернуть ту же проекцию, что select_by_id
+
+        CTE называется так же, как таблица, поэтому скомпилированный скелет
+        SELECT (JOIN и составные поля) читает уже измененную строку:
+        вся запись со ссылками получается тем же запросом, без повторного чтения.
+        """
+        return sql.SQL('WITH {} AS ({}) {}').format(
             sql.Identifier(self._table),
-            sql.SQL(', ').join(map(sql.Identifier, input_fields.keys())),
-            sql.SQL(', ').join(map(sql.Placeholder, input_fields.keys()))
+            write_stmt,
+            self.get_select_skeleton()
         )
-        # print(stmt.as_string(pg))
-        # print(input_fields)
-        return self.execute(stmt, input_fields)
+
+    def get_columns(self):
+        """Колонки таблицы, которые записываются в БД (без первичного ключа и ComposedProperty)"""
+        return [
+            key
+            for key, value in self._fields.items()
+            if not isinstance(value, ComposedProperty)
+        ]
+
+    def prepare_bulk_row(self, input_fields):
+        """Подготовка одной строки массовой вставки (без обращений к БД)"""
+        if identify_error(input_fields):
+            return input_fields
+        return self.for_create(self.clean_input_fields(input_fields), check_refs=False)
+
+    def check_bulk_batch(self, pg, batch):
+        """Проверка пачки строк: валидация, ссылки на другие таблицы, уникальность
+
+        :param batch: Список пар (номер строки, подготовленная строка)
+        :return: Словарь {номер строки: ошибки}
+        """
+        errors = {}
+        valid = [(index, row) for index, row in batch if not identify_error(row)]
+        errors.update(
+            (index, row) for index, row in batch if identify_error(row)
+        )
+        # marshmallow: одна схема на всю пачку
+        schema_errors = self.__class__.ValidateSchema().validate(
+            [row for _, row in valid], many=True
+        )
+        for position, messages in schema_errors.items():
+            errors[valid[position][0]] = update_error_keys(messages)
+        valid = [(index, row) for index, row in valid if index not in errors]
+        # Один запрос на все ссылки всей пачки
+        stmt, vars = self.get_missing_refs_stmt({
+            key: {row[key] for _, row in valid}
+            for key in self.get_backrefs()
+        })
+        if stmt is None:
+            return errors
+        pg.execute(stmt, vars)
+        missing = {(ref['field'], ref['id']) for ref in pg.fetchall()}
+        for index, row in valid:
+            row_errors = [
+                f'Отсуствуют связанное поле "{key}" с индексом {row[key]}'
+                for key in self.get_backrefs()
+                if (key, row[key]) in missing
+            ]
+            if row_errors:
+                errors[index] = {
+                    f'!error_{num}': message
+                    for num, message in enumerate(row_errors, start=1)
+                }
+        return errors
+
+    def check_bulk_unique(self, pg, batch, seen):
+        """Проверка уникального поля (_unique_field) в БД и среди уже переданных строк"""
+        unique_field = getattr(self, '_unique_field', None)
+        if unique_field is None or not batch:
+            return {}
+        pg.execute(
+            sql.SQL('SELECT {field} FROM {} WHERE {field} = ANY(%s)').format(
+                sql.Identifier(self._table),
+                field=sql.Identifier(unique_field),
+            ),
+            (list({row[unique_field] for _, row in batch}),)
+        )
+        existing = {ref[unique_field] for ref in pg.fetchall()}
+        errors = {}
+        for index, row in batch:
+            value = row[unique_field]
+            if value in existing or value in seen:
+                errors[index] = {'!error': f'Значение "{value}" поля {unique_field} уже существует'}
+            seen.add(value)
+        return errors
+
+    def bulk_create(self, rows, batch_size=None):
+        """Массовое добавление записей в одной транзакции
+
+        Строки проверяются пачками по batch_size и вставляются одним
+        многострочным INSERT (execute_values) на пачку. Если хоть одна строка
+        ошибочна, транзакция откатывается и не добавляется ничего.
+
+        :param rows: Итерируемый набор словарей полей; словарь с ключом '!error...'
+                     считается уже ошибочной строкой (н-р, не прошел схему API)
+        :return: Список id добавленных записей или {'!errors': {номер строки: ошибки}}
+        """
+        batch_size = batch_size or self._bulk_batch_size
+        columns = self.get_columns()
+        stmt = sql.SQL('INSERT INTO {} ({}) VALUES %s RETURNING {}').format(
+            sql.Identifier(self._table),
+            sql.SQL(', ').join(map(sql.Identifier, columns)),
+            sql.Identifier(self._primary_key),
+        )
+        errors = {}
+        created = []
+        seen = set()
+        with self._connection as pg:
+            for batch in batched(enumerate(rows), batch_size):
+                batch = [(index, self.prepare_bulk_row(row)) for index, row in batch]
+                batch_errors = self.check_bulk_batch(pg, batch)
+                batch = [(index, row) for index, row in batch if index not in batch_errors]
+                batch_errors.update(self.check_bulk_unique(pg, batch, seen))
+                errors.update(batch_errors)
+                # После первой ошибки строки только проверяются, чтобы сообщить обо всех
+                if errors:
+                    continue
+                values = []
+                for _, row in batch:
+                    if 'Password' in row:
+                        row['Password'] = self.encrypt(row['Password'])
+                    values.append(tuple(row[column] for column in columns))
+                created.extend(
+                    row[self._primary_key]
+                    for row in execute_values(pg, stmt, values, page_size=batch_size, fetch=True)
+                )
+            if errors:
+                pg.connection.rollback()
+                return {'!errors': errors}
+        self.remember(None)
+        return created
 
     def update_by_id(self, index, **input_fields):
-        """Обновление данных существующей записи"""
-        if not self.select_by_id(index):
-            return {
-                '!error': f'{self._entity_name} с номером {index} не существует'
-            }
+        """Обновление данных существующей записи
+
+        Существование записи не проверяется отдельным запросом:
+        если UPDATE ничего не вернул, записи нет.
+        """
+        input_fields = self.prepare_update(input_fields)
+        if identify_error(input_fields):
+            return input_fields
+        try:
+            row = self.execute(self.get_update_stmt(index, input_fields), input_fields)
+        except errors.ForeignKeyViolation:
+            return self.get_refs_violation_error(input_fields)
+        self.remember(row)
+        if row is None:
+            return self.not_found_error(index)
+        return row
+
+    def prepare_update(self, input_fields, check_refs=True):
+        """Изменяемые поля: очистка, проверки, шифрование пароля"""
         input_fields = self.clean_input_fields(input_fields)
-        input_fields = self.for_update(input_fields)
+        input_fields = self.for_update(input_fields, check_refs)
         if identify_error(input_fields):
             return input_fields
         if errors := self.validate(input_fields, partial=True):
             return errors
         if 'Password' in input_fields:
             input_fields['Password'] = self.encrypt(input_fields['Password'])
-        stmt = sql.SQL('UPDATE {} SET {} WHERE {}={} RETURNING *').format(
+        return input_fields
+
+    def get_update_stmt(self, index, input_fields):
+        """Запрос обновления записи по id с полной выборкой измененной записи"""
+        return self.with_joined_returning(
+            sql.SQL('UPDATE {} SET {} WHERE {}={} RETURNING *').format(
+                sql.Identifier(self._table),
+                self.get_set_stmt(input_fields),
+                sql.Identifier(self._primary_key),
+                sql.Literal(index)
+            )
+        )
+
+    def get_set_stmt(self, input_fields):
+        """Часть SET запроса UPDATE (значения передаются именованными параметрами)"""
+        return sql.SQL(', ').join(
+            map(
+                lambda key: sql.SQL('=').join(
+                    (sql.Identifier(key), sql.Placeholder(key))
+                ),
+                input_fields
+            )
+        )
+
+    def bulk_update(self, indexes, **input_fields):
+        """Обновление одних и тех же полей у нескольких записей одним запросом
+
+        :param indexes: Список id обновляемых записей
+        :return: Список id, которые действительно были обновлены
+        """
+        input_fields = self.prepare_update(input_fields)
+        if identify_error(input_fields):
+            return input_fields
+        try:
+            rows = self.execute_get_all(
+                self.get_bulk_update_stmt(input_fields),
+                {**input_fields, '__indexes__': list(indexes)},
+            )
+        except errors.ForeignKeyViolation:
+            return self.get_refs_violation_error(input_fields)
+        self.remember(None)
+        return [row[self._primary_key] for row in rows]
+
+    def get_bulk_update_stmt(self, input_fields):
+        """Запрос обновления записей из массива id (параметр __indexes__)"""
+        return sql.SQL('UPDATE {} SET {} WHERE {pk} = ANY({}) RETURNING {pk}').format(
             sql.Identifier(self._table),
-            sql.SQL(', ').join(
-                map(
-                    lambda key: sql.SQL('=').join(
-                        (sql.Identifier(key), sql.Placeholder(key))
-                    ),
-                    input_fields
-                )
-            ),
-            sql.Identifier(self._primary_key),
-            sql.Literal(index)
+            self.get_set_stmt(input_fields),
+            sql.Placeholder('__indexes__'),
+            pk=sql.Identifier(self._primary_key),
+        )
+
+    def bulk_delete(self, indexes):
+        """Удаление нескольких записей одним запросом
+
+        :param indexes: Список id удаляемых записей
+        :return: Список id, которые действительно были удалены
+        """
+        rows = self.execute_get_all(self.get_bulk_delete_stmt(), (list(indexes),))
+        self.remember(None)
+        return [row[self._primary_key] for row in rows]
+
+    def get_bulk_delete_stmt(self):
+        """Запрос удаления записей из массива id (позиционный параметр)"""
+        return sql.SQL('DELETE FROM {} WHERE {pk} = ANY(%s) RETURNING {pk}').format(
+            sql.Identifier(self._table),
+            pk=sql.Identifier(self._primary_key),
         )
-        # print(stmt.as_string(pg))
-        return self.execute(stmt, input_fields)
 
     def is_unique(self, index, field):
         """Проверка уникальности одного поля"""
@@ -323,56 +846,74 @@ class BaseModel:
         return False
 
 # ---------------------------- Эти можно оставить ---------------------------- #
-    def select_like(self, field, key, order_by=None):
+    def select_like(self, field, key, order_by=None, only=None, threshold=None):
         """Поиск по совпадению поля с частью содержимого поля
         
         :param field: Колонка таблицы, в которой нужно искать значение
         :param key:   Ключ, по которому производится поиск
         :param order_by: Поле, по которому сортируется
+        :param only: Список колонок для узкой выборки (None - все колонки)
+        :param threshold: Порог похожести 0..1 для нечеткого поиска (см. get_and_stmt)
         """
-        stmt = sql.SQL('SELECT *{}{}FROM {}{} WHERE {} {} ORDER BY {}').format(
-            self.get_backref_composed(),
-            self.get_composed_properties(),
-            sql.Identifier(self._table),
-            self.get_all_join(),
-            sql.Identifier(*field.split('.')),
-            self.get_and_stmt(key),
-            sql.Identifier(self._primary_key if order_by is None else order_by)
-        )
-        # print(stmt.as_string(self._connection.connection))
-        return self.execute_get_all(stmt)
+        return self.select_likes({field: key}, order_by, only, threshold)
 
-    def get_and_stmt(self, key):
-        """Объединение поиска для нескольких условий через AND"""
-        return (
-                sql.Composed([sql.SQL('= '), sql.Literal(key)])
-                if key.isdigit() else
-                sql.Composed([sql.SQL('LIKE '), sql.Literal(f'%{key}%')])
-            )
+    def get_and_stmt(self, key, threshold=None):
+        """Условие поиска по одному полю
+
+        Число ищется точным совпадением, строка - как подстрока без учета регистра
+        (ILIKE использует триграммный GIN-индекс). С порогом threshold поиск нечеткий:
+        word_similarity ключа и поля не меньше порога (оператор %> pg_trgm).
+        """
+        if key.isdigit():
+            return sql.Composed([sql.SQL('= '), sql.Literal(key)])
+        if threshold is not None:
+            return sql.Composed([sql.SQL('%> '), sql.Literal(key)])
+        return sql.Composed([sql.SQL('ILIKE '), sql.Literal(f'%{key}%')])
+
+    def get_threshold_stmt(self, threshold):
+        """Установка порога похожести для операторов pg_trgm (до конца транзакции)"""
+        if not 0 <= threshold <= 1:
+            raise ValueError('Порог похожести должен быть от 0 до 1')
+        return sql.SQL('SET LOCAL pg_trgm.word_similarity_threshold = {}').format(
+            sql.Literal(float(threshold))
+        )
 
-    def select_likes(self, fields, order_by=None):
+    def select_likes(self, fields, order_by=None, only=None, threshold=None):
         """Поиск по совпадению нескольких полей с частью содержимого этих полей
         
         :param fields: Словарь, где ключ - поле, где искать, а значение - ключ поиска это поля
         :param order_by: Поле, по которому сортируется
+        :param only: Список колонок для узкой выборки (None - все колонки)
+        :param threshold: Порог похожести 0..1 для нечеткого поиска (см. get_and_stmt)
         """
-        stmt = sql.SQL('SELECT *{}{}FROM {}{} WHERE {} ORDER BY {}').format(
-            self.get_backref_composed(),
-            self.get_composed_properties(),
-            sql.Identifier(self._table),
-            self.get_all_join(),
+        stmt = self.get_likes_stmt(fields, order_by, only, threshold)
+        if threshold is not None:
+            stmt = sql.SQL('{}; {}').format(self.get_threshold_stmt(threshold), stmt)
+        # print(stmt.as_string(self._connection.connection))
+        return self.execute_get_all(stmt)
+
+    def iter_likes(self, fields, order_by=None, itersize=None, only=None, threshold=None):
+        """То же, что select_likes, но строки выдаются по одной (серверный курсор)"""
+        return self.execute_iter(
+            self.get_likes_stmt(fields, order_by, only, threshold),
+            itersize=itersize,
+            setup=self.get_threshold_stmt(threshold) if threshold is not None else None,
+        )
+
+    def get_likes_stmt(self, fields, order_by=None, only=None, threshold=None):
+        """Запрос поиска по нескольким полям (см. select_likes)"""
+        return sql.SQL('{} WHERE {} ORDER BY {}').format(
+            self.get_select_skeleton(only, self.get_where_tables(fields, only)),
             sql.SQL(' AND ').join(
                 map(
                     lambda item: sql.SQL(' ').join(
-                        (sql.Identifier(*item[0].split('.')), self.get_and_stmt(item[1]))
+                        (sql.Identifier(*item[0].split('.')), self.get_and_stmt(item[1], threshold))
                     ),
                     fields.items()
                 )
             ),
             sql.Identifier(self._primary_key if order_by is None else order_by)
         )
-        # print(stmt.as_string(self._connection.connection))
-        return self.execute_get_all(stmt)
 
     def get_all_join(self):
         """Скомпоновать все JOIN"""
@@ -405,18 +946,425 @@ class BaseModel:
         )
         return query if query else sql.SQL(' ')
 
-    def select_all(self):
-        """Выбрать всю таблицу"""
-        stmt = sql.SQL('SELECT *{}{}FROM {}{} ORDER BY {}').format(
+    def compile_select_skeleton(self):
+        """Собрать часть запроса SELECT ... FROM ... JOIN (без WHERE/ORDER BY/LIMIT)"""
+        return sql.SQL('SELECT *{}{}FROM {}{}').format(
             self.get_backref_composed(),
             self.get_composed_properties(),
             sql.Identifier(self._table),
             self.get_all_join(),
-            sql.Identifier(self._primary_key),
         )
+
+    def get_columns_catalog(self):
+        """Все колонки полной выборки: {имя: (выражение SQL, нужные таблицы)}, один на класс"""
+        cls = self.__class__
+        if '_columns_catalog' not in cls.__dict__:
+            catalog = {}
+            self.collect_columns(catalog)
+            cls._columns_catalog = catalog
+        return cls._columns_catalog
+
+    def collect_columns(self, catalog):
+        """Добавить в каталог свои колонки и колонки ссылочных моделей (рекурсивно)"""
+        # Как и в SELECT * по JOIN, имена колонок в таблицах не повторяются
+        catalog.setdefault(
+            self._primary_key,
+            (sql.Identifier(self._table, self._primary_key), {self._table})
+        )
+        for field, entity in self._fields.items():
+            if isinstance(entity, ComposedProperty):
+                if entity.composed_property['fields']:
+                    catalog.setdefault(
+                        entity.composed_property['title'],
+                        (entity.get_expression(), entity.get_tables())
+                    )
+            else:
+                catalog.setdefault(field, (sql.Identifier(self._table, field), {self._table}))
+        for entity in self._fields.values():
+            if isinstance(entity, backref):
+                entity.reference.collect_columns(catalog)
+        return catalog
+
+    def get_join_tree(self):
+        """Все JOIN полной выборки: список (таблица, родительская таблица, JOIN)"""
+        joins = []
+        for field, entity in self._fields.items():
+            if isinstance(entity, backref):
+                entity.collect_joins(field, self._table, joins)
+        return joins
+
+    def get_own_columns(self):
+        """Колонки, которые выбираются без JOIN (только своя таблица)"""
+        return [
+            column
+            for column, (_, tables) in self.get_columns_catalog().items()
+            if tables == {self._table}
+        ]
+
+    def get_load_columns(self, only, load):
+        """Колонки выборки с учетом способа загрузки связей (None - полный SELECT)"""
+        if load not in LOAD_STRATEGIES:
+            raise ValueError(f'Неизвестный способ загрузки связей: {load}')
+        if only is None and load != 'joined':
+            return self.get_own_columns()
+        return only
+
+    def load_relations(self, rows, load):
+        """Догрузить связанные записи по одному запросу на связь (load='selectin')
+
+        Поля связанных записей добавляются в строку так же, как их дал бы JOIN,
+        составные поля считаются уже по собранной строке.
+        """
+        if load != 'selectin' or not rows:
+            return rows
+        for field, entity in self._fields.items():
+            if isinstance(entity, backref):
+                related = entity.reference.select_in({row[field] for row in rows if row[field] is not None})
+                for row in rows:
+                    for column, value in related.get(row[field], {}).items():
+                        row.setdefault(column, value)
+        for entity in self._fields.values():
+            if isinstance(entity, ComposedProperty) and entity.composed_property['fields']:
+                for row in rows:
+                    row.setdefault(entity.composed_property['title'], entity.compute(row))
+        return rows
+
+    def select_in(self, indexes):
+        """Записи по набору id одним запросом (WHERE pk = ANY) вместе со связями: {id: запись}"""
+        if not indexes:
+            return {}
+        if self._cached:
+            # Справочник небольшой и уже лежит в кеше целиком
+            rows = [row for row in self.select_all(load='joined') if row[self._primary_key] in indexes]
+        else:
+            stmt = sql.SQL('{} WHERE {} = ANY(%s)').format(
+                self.get_select_skeleton(self.get_own_columns()),
+                sql.Identifier(self._table, self._primary_key),
+            )
+            rows = self.load_relations(self.execute_get_all(stmt, (list(indexes),)), 'selectin')
+        return {row[self._primary_key]: row for row in rows}
+
+    def get_where_tables(self, columns, only):
+        """Таблицы, нужные условию WHERE по этим колонкам (только для узкой выборки)"""
+        if only is None:
+            return ()
+        catalog = self.get_columns_catalog()
+        tables = set()
+        for column in columns:
+            if '.' in column:
+                tables.add(column.split('.')[0])
+            elif column in catalog:
+                tables |= catalog[column][1]
+        return tables
+
+    def compile_projection_skeleton(self, only, tables=()):
+        """Собрать SELECT только нужных колонок и JOIN только нужных таблиц
+
+        :param only:   Список колонок (первичный ключ выбирается всегда)
+        :param tables: Таблицы, которые нужны помимо колонок (например, для WHERE)
+        """
+        catalog = self.get_columns_catalog()
+        columns = [self._primary_key] + [column for column in only if column != self._primary_key]
+        return sql.SQL('SELECT {} {}').format(
+            sql.SQL(', ').join(
+                sql.SQL('{} AS {}').format(catalog[column][0], sql.Identifier(column))
+                for column in columns
+            ),
+            self.get_from_stmt(columns, tables),
+        )
+
+    def get_from_stmt(self, columns, tables=()):
+        """FROM своей таблицы и JOIN только тех таблиц, которые нужны колонкам columns"""
+        catalog = self.get_columns_catalog()
+        needed = set(tables)
+        for column in columns:
+            needed |= catalog[column][1]
+        joins = self.get_join_tree()
+        parents = {table: parent for table, parent, _ in joins}
+        # Таблица присоединяется через родительскую, поэтому нужна вся цепочка до базовой
+        for table in list(needed):
+            while table in parents:
+                table = parents[table]
+                needed.add(table)
+        return sql.SQL('FROM {}{}').format(
+            sql.Identifier(self._table),
+            sql.SQL('').join(clause for table, _, clause in joins if table in needed),
+        )
+
+    def render(self, stmt):
+        """Скелет выборки для кеша: текст запроса с подставленными значениями"""
+        return sql.SQL(stmt.as_string(self._connection.connection))
+
+    def get_select_skeleton(self, only=None, tables=()):
+        """Скомпилированный SELECT ... FROM ... JOIN, один на класс модели
+
+        Рекурсивный обход backref и сборка составных полей выполняются один раз,
+        результат сохраняется в атрибуте класса уже в виде готовой строки SQL.
+        При каждом запросе меняются только WHERE/ORDER BY/LIMIT.
+
+        :param only:   Список колонок для узкой выборки (None - SELECT * по всем JOIN).
+                       Неизвестная колонка - KeyError
+        :param tables: Дополнительно нужные узкой выборке таблицы
+        """
+        cls = self.__class__
+        if only is not None:
+            if '_projection_skeletons' not in cls.__dict__:
+                cls._projection_skeletons = {}
+            key = (tuple(only), frozenset(tables))
+            if key not in cls._projection_skeletons:
+                # Наборы колонок приходят от клиента - кеш ограничен
+                if len(cls._projection_skeletons) >= cls._projections_maxsize:
+                    cls._projection_skeletons.clear()
+                cls._projection_skeletons[key] = self.render(
+                    self.compile_projection_skeleton(only, tables)
+                )
+            return cls._projection_skeletons[key]
+        # Проверка именно __dict__ класса, чтобы наследник не взял скелет родителя
+        if '_select_skeleton' not in cls.__dict__:
+            cls._select_skeleton = self.render(self.compile_select_skeleton())
+        return cls._select_skeleton
+
+    def get_view_model(self):
+        """Модель чтения из материализованного представления (без него - сама модель)
+
+        Класс строится один раз: наследник модели, у которого таблица - представление,
+        а поля - все колонки полной выборки. Поэтому все выборки, фильтры, сортировка
+        и отчеты модели работают с ним как с одной таблицей, без JOIN.
+        Данные в представлении обновляются с задержкой (см. matviews.py).
+        """
+        if self._materialized_view is None:
+            return self
+        cls = self.__class__
+        if '_view_model' not in cls.__dict__:
+            cls._view_model = type(f'{cls.__name__}View', (cls,), {
+                '_table': self._materialized_view,
+                '_materialized_view': None,
+                '_cached': False,
+                '_search_fields': (),
+                '_fulltext_fields': (),
+                '_fields': {
+                    column: None
+                    for column in self.get_columns_catalog()
+                    if column != self._primary_key
+                },
+            })
+        return cls._view_model(self._connection)
+
+    def select_all(self, only=None, load='none', filters=None, sort=None):
+        """Выбрать всю таблицу
+
+        :param only: Список колонок для узкой выборки (None - все колонки)
+        :param load: Способ загрузки связей (см. LOAD_STRATEGIES), при only не учитывается
+                     (кроме view - чтение из материализованного представления)
+        :param filters: Фильтры [(колонка, оператор, значение)] (см. get_condition)
+        :param sort: Сортировка [(колонка, по убыванию)], в конце всегда первичный ключ
+        """
+        if load == 'view':
+            return self.get_view_model().select_all(only, 'joined', filters, sort)
+        if only is None and load != 'joined':
+            stmt = self.get_all_stmt(self.get_load_columns(only, load), filters, sort)
+            return self.load_relations(self.execute_get_all(stmt), load)
+        stmt = self.get_all_stmt(only, filters, sort)
         # print(stmt.as_string(self._connection.connection))
+        if self._cached and only is None and not filters and not sort:
+            return reference_cache.get_or_load(
+                self._table, ('all',), lambda: self.execute_get_all(stmt)
+            )
         return self.execute_get_all(stmt)
 
+    def iter_all(self, itersize=None, only=None, load='none', filters=None, sort=None):
+        """То же, что select_all, но строки выдаются по одной (серверный курсор)"""
+        if load == 'view':
+            return self.get_view_model().iter_all(itersize, only, 'joined', filters, sort)
+        columns = self.get_load_columns(only, load)
+        if only is None and load == 'selectin':
+            # Догружающие запросы зафиксировали бы транзакцию и закрыли серверный курсор,
+            # поэтому таблица обходится страницами по ключу
+            return self.iter_pages(itersize or self._itersize, load, filters, sort)
+        return self.execute_iter(self.get_all_stmt(columns, filters, sort), itersize=itersize)
+
+    def iter_pages(self, size, load='none', filters=None, sort=None):
+        """Обход всей таблицы страницами select_page по size записей"""
+        after = None
+        while rows := self.select_page(size, after, load=load, filters=filters, sort=sort):
+            yield from rows
+            if len(rows) < size:
+                break
+            after = self.get_sort_key(rows[-1], sort)
+
+    def get_all_stmt(self, only=None, filters=None, sort=None):
+        """Запрос всей таблицы (см. select_all)"""
+        return self.get_query_stmt(only, filters, sort)
+
+    def get_filter_columns(self):
+        """Колонки, по которым можно фильтровать и сортировать (не составные поля)"""
+        return {
+            column
+            for column, (expression, _) in self.get_columns_catalog().items()
+            if isinstance(expression, sql.Identifier)
+        }
+
+    def get_numeric_text_columns(self):
+        """Числовые поля-строки своей таблицы и всех ссылочных (рекурсивно)"""
+        columns = set(self._numeric_text_fields)
+        for entity in self._fields.values():
+            if isinstance(entity, backref):
+                columns |= entity.reference.get_numeric_text_columns()
+        return columns
+
+    def get_sort_expression(self, column):
+        """Выражение колонки для диапазонов, сортировки и ключа страницы
+
+        Обычно это сама колонка. Числовое поле-строка (_numeric_text_fields)
+        приводится к numeric, нечисловая строка дает NULL (как неизвестное значение).
+        """
+        expression = self.get_columns_catalog()[column][0]
+        if column not in self.get_numeric_text_columns():
+            return expression
+        return sql.SQL('(CASE WHEN {column} ~ {pattern} THEN {column}::numeric END)').format(
+            column=expression, pattern=Constant(NUMERIC_TEXT_PATTERN)
+        )
+
+    def get_sort_value(self, column, value):
+        """Значение ключа страницы в том виде, в котором его сравнивает get_sort_expression"""
+        if (
+            value is not None and column in self.get_numeric_text_columns() and
+            not re.fullmatch(NUMERIC_TEXT_PATTERN, str(value))
+        ):
+            return None
+        return value
+
+    def get_condition(self, column, operator, value):
+        """Условие WHERE для одного фильтра
+
+        Колонка сравнивается как есть (без функций над ней), поэтому условие
+        может использовать индекс по колонке; только диапазоны по числовым
+        полям-строкам идут через get_sort_expression:
+        eq - равно, in - одно из списка, gt/gte/lt/lte - границы диапазона,
+        prefix - начало строки (LIKE 'начало%'), null - IS NULL (True) / IS NOT NULL (False).
+        """
+        expression = self.get_columns_catalog()[column][0]
+        if operator == 'eq':
+            return sql.SQL('{} = {}').format(expression, self.get_literal(value))
+        if operator == 'in':
+            return sql.SQL('{} IN ({})').format(
+                expression, sql.SQL(', ').join(map(self.get_literal, value))
+            )
+        if operator in RANGE_OPERATORS:
+            return sql.SQL('{} {} {}').format(
+                self.get_sort_expression(column), sql.SQL(RANGE_OPERATORS[operator]), self.get_literal(value)
+            )
+        if operator == 'prefix':
+            escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            return sql.SQL('{} LIKE {}').format(expression, sql.Literal(f'{escaped}%'))
+        if operator == 'null':
+            return sql.SQL('{} IS NULL' if value else '{} IS NOT NULL').format(expression)
+        raise ValueError(f'Неизвестный оператор фильтра: {operator}')
+
+    def get_literal(self, value):
+        """Значение для сравнения с колонкой
+
+        Передается нетипизированной строкой: Postgres сам приводит ее к типу
+        колонки, так что сравнение не требует приведения самой колонки.
+        """
+        return sql.Literal(value if value is None or isinstance(value, str) else str(value))
+
+    def get_order(self, sort=None):
+        """Порядок выборки [(колонка, по убыванию)], первичный ключ - последним (однозначность)"""
+        order = []
+        for column, desc in sort or ():
+            order.append((column, desc))
+            if column == self._primary_key:
+                # После уникального ключа остальные колонки порядок не меняют
+                return order
+        return order + [(self._primary_key, False)]
+
+    def get_sort_key(self, row, sort=None):
+        """Ключ записи для продолжения выборки после нее (параметр after)"""
+        order = self.get_order(sort)
+        if len(order) == 1:
+            return row[self._primary_key]
+        return [row[column] for column, _ in order]
+
+    def get_after_condition(self, order, after):
+        """Условие "строго после ключа after" для порядка order (keyset)
+
+        NULL в ASC идут последними, в DESC - первыми (как по умолчанию в Postgres).
+        """
+        after = [self.get_sort_value(column, value) for (column, _), value in zip(order, after)]
+        parts = []
+        for position, (column, desc) in enumerate(order):
+            expression, value = self.get_sort_expression(column), after[position]
+            equal = [
+                sql.SQL('{} IS NOT DISTINCT FROM {}').format(
+                    self.get_sort_expression(previous), self.get_literal(after[number])
+                )
+                for number, (previous, _) in enumerate(order[:position])
+            ]
+            if column == self._primary_key:
+                step = sql.SQL('{} {} {}').format(expression, sql.SQL('<' if desc else '>'), self.get_literal(value))
+            elif desc:
+                step = (
+                    sql.SQL('{} IS NOT NULL').format(expression)
+                    if value is None else
+                    sql.SQL('{} < {}').format(expression, self.get_literal(value))
+                )
+            elif value is None:
+                # После NULL в порядке ASC по этой колонке ничего нет
+                continue
+            else:
+                step = sql.SQL('({} > {} OR {} IS NULL)').format(expression, self.get_literal(value), expression)
+            parts.append(sql.SQL('({})').format(sql.SQL(' AND ').join(equal + [step])))
+        return sql.SQL('({})').format(sql.SQL(' OR ').join(parts)) if parts else sql.SQL('FALSE')
+
+    def get_query_stmt(self, columns=None, filters=None, sort=None, after=None, limit=None):
+        """SELECT с фильтрами, сортировкой и, для страницы, ключом after и LIMIT
+
+        :param columns: Колонки узкой выборки (None - все колонки по всем JOIN)
+        :param after:   Ключ последней записи предыдущей страницы (см. get_sort_key)
+        """
+        filters = list(filters or ())
+        order = self.get_order(sort)
+        if columns is not None:
+            # Колонки сортировки нужны в строке для ключа следующей страницы
+            columns = list(columns) + [
+                column for column, _ in order if column not in columns and column != self._primary_key
+            ]
+        conditions = [self.get_condition(*item) for item in filters]
+        if after is not None:
+            conditions.append(self.get_after_condition(order, after if len(order) > 1 else [after]))
+        return sql.SQL('{} {} ORDER BY {}{}').format(
+            self.get_select_skeleton(
+                columns,
+                self.get_where_tables([column for column, _, _ in filters], columns)
+            ),
+            sql.SQL('WHERE {}').format(sql.SQL(' AND ').join(conditions)) if conditions else sql.SQL(''),
+            sql.SQL(', ').join(
+                sql.SQL('{} {}').format(self.get_sort_expression(column), sql.SQL('DESC' if desc else 'ASC'))
+                for column, desc in order
+            ),
+            sql.SQL(' LIMIT {}').format(sql.Literal(limit)) if limit is not None else sql.SQL(''),
+        )
+
+    def select_page(self, limit, after=None, only=None, load='none', filters=None, sort=None):
+        """Выбрать страницу записей по ключу (keyset, без OFFSET)
+
+        :param limit: Количество записей на странице
+        :param after: Ключ последней записи предыдущей страницы (см. get_sort_key):
+                      первичный ключ или, при sort, список значений колонок сортировки
+                      и первичного ключа (None - первая страница)
+        :param only:  Список колонок для узкой выборки (None - все колонки)
+        :param load:  Способ загрузки связей (см. LOAD_STRATEGIES), при only не учитывается
+        :param filters: Фильтры [(колонка, оператор, значение)] (см. get_condition)
+        :param sort: Сортировка [(колонка, по убыванию)]
+        """
+        if load == 'view':
+            return self.get_view_model().select_page(limit, after, only, 'joined', filters, sort)
+        columns = self.get_load_columns(only, load)
+        stmt = self.get_query_stmt(columns, filters, sort, after, limit)
+        rows = self.execute_get_all(stmt)
+        return rows if only is not None else self.load_relations(rows, load)
+
     def validate(self, input_fields, partial=None):
         """Проверка полей ввода с помощью marshmallow"""
         errors = self.__class__.ValidateSchema().validate(input_fields, partial=partial)
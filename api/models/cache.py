@@ -0,0 +1,170 @@
+import collections
+import hashlib
+import hmac
+import os
+import threading
+import time
+
+
+def copy_rows(value):
+    """Копия строки или списка строк: у каждого читателя кеша свои словари"""
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, (list, tuple)):
+        return [copy_rows(row) for row in value]
+    return value
+
+
+class ReferenceCache:
+    """Кеш справочных таблиц (сквозное чтение) с ограничением по времени и размеру
+
+    Используется моделями с _cached = True. Записи через модель (create,
+    update_by_id, delete и массовые операции) сбрасывают кеш своей таблицы;
+    изменения в обход приложения станут видны не позже чем через ttl секунд.
+    Строки сохраняются и выдаются копиями: изменение полученной строки
+    не меняет кеш для остальных.
+
+    :param ttl:     Время жизни записи в секундах
+    :param maxsize: Максимальное количество записей (старые вытесняются первыми)
+    """
+    def __init__(self, ttl=300.0, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        # (таблица, ключ) -> (время устаревания, значение)
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, table, key):
+        """Значение из кеша или None"""
+        with self._lock:
+            entry = self._entries.get((table, key))
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop((table, key), None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end((table, key))
+            self.hits += 1
+            value = entry[1]
+        return copy_rows(value)
+
+    def set(self, table, key, value):
+        value = copy_rows(value)
+        with self._lock:
+            self._entries[(table, key)] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end((table, key))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, table, key, load):
+        """Значение из кеша, а при промахе - результат load() (None не кешируется)"""
+        value = self.get(table, key)
+        if value is None:
+            value = load()
+            if value is not None:
+                self.set(table, key, value)
+        return value
+
+    def invalidate(self, table):
+        """Сбросить все записи таблицы"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == table]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Статистика попаданий"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+            }
+
+
+class AuthCache:
+    """Кеш проверенных учетных данных Basic-аутентификации: заголовок -> пользователь
+
+    Ключ - дайджест заголовка Authorization с солью процесса, сами пароли
+    в памяти не хранятся. Кешируется только успешный вход; изменение или удаление
+    пользователя через API сбрасывает его записи (invalidate_user), а в других
+    процессах изменение станет видно не позже чем через ttl секунд.
+
+    :param ttl:     Время жизни записи в секундах (0 - кеш выключен)
+    :param maxsize: Максимальное количество записей (старые вытесняются первыми)
+    """
+    def __init__(self, ttl=60.0, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._salt = os.urandom(16)
+        self._lock = threading.Lock()
+        # дайджест заголовка -> (время устаревания, пользователь)
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, header):
+        return hmac.new(self._salt, header.encode(), hashlib.sha256).digest()
+
+    def get(self, header):
+        """Пользователь ({'id', 'is_admin'}) по заголовку Authorization или None"""
+        if self.ttl <= 0:
+            return None
+        key = self.get_key(header)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, header, user):
+        if self.ttl <= 0:
+            return
+        key = self.get_key(header)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, *ids):
+        """Сбросить записи пользователей (после изменения логина, пароля, роли или удаления)"""
+        with self._lock:
+            for key in [key for key, (_, user) in self._entries.items() if user['id'] in ids]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Статистика попаданий"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+            }
+
+
+# Общий для процесса кеш справочников (настройки - REFERENCE_CACHE_* в api/config.py)
+reference_cache = ReferenceCache()
+
+# Общий для процесса кеш аутентификации (настройки - AUTH_CACHE_* в api/config.py)
+auth_cache = AuthCache()
@@ -1,2 +1,8 @@
 PG_DB_NAME = 'estate_register'
-SQL_INIT_FILE = 'initdb/estate_register.sql'
\ No newline at end of file
+SQL_INIT_FILE = 'initdb/estate_register.sql'
+# init-db: триггеры на таблицах моделей добавляют работу каждой записи (INSERT/UPDATE/DELETE),
+# поэтому ставятся только для используемых возможностей (флаги init-db важнее настроек):
+# полнотекстовый поиск /api/search (таблица документов и триггеры, см. search.py)
+SEARCH_DOCUMENTS = False
+# уведомления об изменениях для команды flask matviews (см. matviews.py)
+MATVIEW_TRIGGERS = False
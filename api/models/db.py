@@ -1,10 +1,16 @@
+import collections
+import threading
+import time
+import uuid
+
 import click
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 
-from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT, TRANSACTION_STATUS_IDLE
 
-from .config import PG_DB_NAME, SQL_INIT_FILE
+from .config import MATVIEW_TRIGGERS, PG_DB_NAME, SEARCH_DOCUMENTS, SQL_INIT_FILE
 
 
 def get_db(dbname='postgres'):
@@ -51,11 +57,69 @@ def db_fill(sql_file, db_name):
     with conn.cursor() as cursor:
         cursor.execute(open(sql_file, 'r', encoding='utf-8').read())
 
+def trigger_exists(cursor, trigger):
+    """Проверка существования триггера (не внутреннего) с таким именем"""
+    cursor.execute('SELECT 1 FROM pg_trigger WHERE tgname = %s AND NOT tgisinternal', (trigger,))
+    return cursor.fetchone() is not None
+
+def db_indexes(db_name, concurrently=True, indexes_only=False, search=None, matview_triggers=None):
+    """Создать недостающие индексы моделей и сообщить о неиспользуемых
+
+    Без indexes_only - еще материализованные представления, поиск и триггеры
+    обновления представлений (по умолчанию - по SEARCH_DOCUMENTS и MATVIEW_TRIGGERS).
+    search, matview_triggers: True - включить, False - удалить триггеры,
+    None - по настройке (при indexes_only - не трогать).
+    """
+    # Модели сами импортируют этот модуль, поэтому импорт здесь, а не в начале
+    from .indexes import enable_trigram, get_unused_indexes, sync_indexes
+    from .matviews import sync_matviews
+    from .search import drop_search, sync_search
+    if not indexes_only:
+        search = SEARCH_DOCUMENTS if search is None else search
+        matview_triggers = MATVIEW_TRIGGERS if matview_triggers is None else matview_triggers
+    conn = get_db(db_name)
+    try:
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            if not enable_trigram(cursor):
+                click.echo('Расширение pg_trgm недоступно: индексы поиска по подстроке не созданы')
+        if search:
+            for table in sync_search(conn):
+                click.echo(f'Включен полнотекстовый поиск по таблице {table}')
+        elif search is not None:
+            for table in drop_search(conn):
+                click.echo(f'Выключен полнотекстовый поиск по таблице {table}')
+        if not indexes_only or matview_triggers is not None:
+            for view in sync_matviews(conn, triggers=matview_triggers):
+                click.echo(f'Создано материализованное представление {view}')
+        created = set()
+        for index in sync_indexes(conn, concurrently):
+            created.add(index.name)
+            click.echo(f'Создан индекс {index.name} ({index.table}.{index.column})')
+        # У только что созданных индексов еще не может быть сканирований
+        for name, table, size in get_unused_indexes(conn):
+            if name not in created:
+                click.echo(f'Не используется индекс {name} ({table}, {size})')
+    finally:
+        conn.close()
+
 @click.command('init-db')
 @click.option('--sql-file', '-f', default=SQL_INIT_FILE, help='название SQL-файла')
 @click.option('--db-name', '-db', default=PG_DB_NAME, help='имя базы данных')
-def db_init(sql_file, db_name):
+@click.option('--indexes-only', '-i', is_flag=True, help='только индексы существующей БД (без пересоздания)')
+@click.option('--search/--no-search', default=None,
+              help='полнотекстовый поиск: таблица документов и триггеры (по умолчанию - SEARCH_DOCUMENTS)')
+@click.option('--matview-triggers/--no-matview-triggers', default=None,
+              help='триггеры уведомлений для flask matviews (по умолчанию - MATVIEW_TRIGGERS)')
+def db_init(sql_file, db_name, indexes_only, search, matview_triggers):
     """Инициализация новой БД"""
+    if indexes_only:
+        if not db_exists(db_name):
+            click.echo(f"БД '{db_name}' не существует")
+            return
+        click.echo('Проверяем индексы (CREATE INDEX CONCURRENTLY)')
+        db_indexes(db_name, indexes_only=True, search=search, matview_triggers=matview_triggers)
+        return
     if db_exists(db_name):
         res = click.prompt(f"Эта процедура полностью удалит базу данных '{db_name}' и создаст новую. Вы согласны? [(д)а/(н)ет] >> ").lower()
         if res in {'да', 'д', 'yes', 'y'}:
@@ -63,20 +127,222 @@ def db_init(sql_file, db_name):
             db_delete(db_name)
             db_create(db_name)
             db_fill(sql_file, db_name)
+            db_indexes(db_name, concurrently=False, search=search, matview_triggers=matview_triggers)
         else:
             click.echo('Отмена инициализации БД')
     else:
         click.echo('Создаем новую БД и заполняем ее данными')
         db_create(db_name)
         db_fill(sql_file, db_name)
+        # Новая БД еще никем не используется - блокировки не страшны
+        db_indexes(db_name, concurrently=False, search=search, matview_triggers=matview_triggers)
+
+
+class PoolTimeoutError(psycopg2.pool.PoolError):
+    """Не дождались свободного соединения в пуле"""
+
+
+class ConnectionPool:
+    """Ограниченный потокобезопасный пул соединений
+
+    :param minconn:  Сколько соединений открыть при первой выдаче соединения
+    :param maxconn:  Максимум одновременно открытых соединений
+    :param timeout:  Сколько секунд ждать свободного соединения
+    :param check_interval: Через сколько секунд простоя проверять соединение (SELECT 1)
+    :param dbname:   Имя БД
+    """
+    def __init__(self, minconn=1, maxconn=10, timeout=5.0, check_interval=30.0, dbname=PG_DB_NAME):
+        if not 0 <= minconn <= maxconn:
+            raise ValueError('Должно выполняться 0 <= minconn <= maxconn')
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self.dbname = dbname
+        self._cond = threading.Condition()
+        # Свободные соединения: (соединение, время возврата в пул)
+        self._idle = collections.deque()
+        self._in_use = set()
+        # Открытые соединения + соединения, которые сейчас открываются
+        self._size = 0
+        self._stats = {
+            'acquired': 0,
+            'waits': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'timeouts': 0,
+            'replaced': 0,
+        }
+        # Соединения открываются при первой выдаче, а не при создании пула:
+        # создание приложения (тесты, команды CLI) не требует доступной БД
+        self._started = False
+
+    def _start(self):
+        """Открыть minconn соединений (один раз, при первой выдаче)"""
+        with self._cond:
+            if self._started:
+                return
+            self._started = True
+            count = max(self.minconn - self._size, 0)
+            self._size += count
+        opened = []
+        try:
+            for _ in range(count):
+                opened.append(connect_db(self.dbname))
+        except Exception:
+            with self._cond:
+                # При следующей выдаче - новая попытка
+                self._started = False
+                self._size -= count - len(opened)
+            raise
+        finally:
+            with self._cond:
+                self._idle.extend((connection, time.monotonic()) for connection in opened)
+                self._cond.notify_all()
+
+    def _connect(self):
+        """Открыть новое соединение под уже зарезервированное место в пуле"""
+        try:
+            return connect_db(self.dbname)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+    def _is_alive(self, connection, released_at):
+        """Проверка соединения перед выдачей"""
+        if connection.closed:
+            return False
+        if time.monotonic() - released_at < self.check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def getconn(self):
+        """Взять соединение из пула (ждет не дольше timeout)"""
+        if not self._started:
+            self._start()
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    connection, released_at = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1
+                    connection, released_at = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f'Нет свободных соединений в пуле (максимум {self.maxconn})'
+                    )
+                waited = True
+                self._cond.wait(remaining)
+        replaced = False
+        if connection is None:
+            connection = self._connect()
+        elif not self._is_alive(connection, released_at):
+            connection.close()
+            connection = self._connect()
+            replaced = True
+        with self._cond:
+            if replaced:
+                self._stats['replaced'] += 1
+            self._in_use.add(connection)
+            wait_time = time.monotonic() - start
+            self._stats['acquired'] += 1
+            if waited:
+                self._stats['waits'] += 1
+            self._stats['wait_time_total'] += wait_time
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+        return connection
+
+    def putconn(self, connection, close=False):
+        """Вернуть соединение в пул (или закрыть, если оно испорчено)"""
+        if not connection.closed and not close:
+            try:
+                # Незавершенная транзакция не должна перейти к следующему владельцу
+                if connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except psycopg2.Error:
+                close = True
+        with self._cond:
+            if connection not in self._in_use:
+                return
+            self._in_use.discard(connection)
+            if connection.closed or close:
+                self._size -= 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+            self._cond.notify()
+        if close and not connection.closed:
+            connection.close()
+
+    def closeall(self):
+        """Закрыть все свободные соединения"""
+        with self._cond:
+            while self._idle:
+                connection, _ = self._idle.pop()
+                connection.close()
+                self._size -= 1
+
+    def stats(self):
+        """Статистика пула"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update(
+                size=self._size,
+                in_use=len(self._in_use),
+                idle=len(self._idle),
+                maxconn=self.maxconn,
+            )
+        stats['wait_time_avg'] = (
+            stats['wait_time_total'] / stats['acquired'] if stats['acquired'] else 0.0
+        )
+        return stats
 
 
 class PGCursor:
     """Курсор работы с Postgres"""
-    def __init__(self, connection=None):
-        self.connection = connection or connect_db()
+    def __init__(self, connection=None, pool=None, identity_map=None):
+        self.pool = pool
+        if connection is None:
+            connection = pool.getconn() if pool is not None else connect_db()
+        self.connection = connection
+        # Необязательная карта идентичности строк (см. identitymap.py)
+        self.identity_map = identity_map
+
+    def reconnect(self):
+        """Заменить потерянное соединение новым"""
+        if self.pool is not None:
+            self.pool.putconn(self.connection, close=True)
+            self.connection = self.pool.getconn()
+        else:
+            self.connection = connect_db()
+
+    def close(self):
+        """Вернуть соединение в пул (или закрыть, если пула нет)"""
+        if self.identity_map is not None:
+            self.identity_map.clear()
+        if self.pool is not None:
+            self.pool.putconn(self.connection)
+        else:
+            self.connection.close()
 
     def __enter__(self):
+        # Соединение могло быть потеряно (н-р, перезапуск сервера) - переподключиться
+        if self.connection.closed:
+            self.reconnect()
         self.cursor = self.connection.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
         return self.cursor
 
@@ -89,6 +355,37 @@ class PGCursor:
             self.connection.commit()
 
 
+class PGNamedCursor:
+    """Серверный (именованный) курсор Postgres для построчного чтения больших выборок
+
+    :param pg_cursor: PGCursor, соединение которого используется
+    :param itersize:  Сколько строк забирать с сервера за одно обращение
+    """
+    def __init__(self, pg_cursor, itersize=2000):
+        self.pg_cursor = pg_cursor
+        self.itersize = itersize
+        self.cursor = None
+
+    def __enter__(self):
+        if self.pg_cursor.connection.closed:
+            self.pg_cursor.reconnect()
+        self.cursor = self.pg_cursor.connection.cursor(
+            name=f'iter_{uuid.uuid4().hex}',
+            cursor_factory=psycopg2.extras.RealDictCursor
+        )
+        self.cursor.itersize = self.itersize
+        return self.cursor
+
+    def __exit__(self, ext_type, exc_value, traceback):
+        connection = self.pg_cursor.connection
+        if self.cursor and not self.cursor.closed and not connection.closed:
+            self.cursor.close()
+        if isinstance(exc_value, Exception):
+            connection.rollback()
+        else:
+            connection.commit()
+
+
 if __name__ == '__main__':
     # pg_cursor = PGCursor()
     # print(pg_cursor.connection)
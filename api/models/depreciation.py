@@ -0,0 +1,168 @@
+"""Амортизация и списание имущества (units) одним векторным проходом NumPy
+
+Линейная амортизация: стоимость Cost равномерно списывается с даты DateStart
+за срок службы Period (лет). По истечении срока имущество подлежит списанию.
+Period хранится строкой (VARCHAR): нечисловой срок считается неизвестным,
+у такой записи нет даты списания, а остаточная стоимость равна Cost.
+"""
+import datetime as dt
+import io
+
+import click
+import numpy as np
+from psycopg2 import sql
+
+from .db import PGCursor
+from .models import UnitModel
+
+
+# Выгрузка одним COPY: только числа, даты - днями от 1970-01-01, неизвестный срок - -1
+UNITS_COPY_STMT = sql.SQL('''
+    COPY (
+        SELECT "IDUnit",
+            "DateStart" - DATE '1970-01-01',
+            "Cost",
+            CASE WHEN "Period" ~ '^[0-9]+$' THEN "Period"::integer ELSE -1 END
+        FROM {}
+    ) TO STDOUT WITH (FORMAT csv)
+''')
+
+
+def parse_units_csv(data):
+    """Массив (N, 4) из выгрузки UNITS_COPY_STMT (байты CSV)"""
+    if not data.strip():
+        return np.empty((0, 4))
+    # Разбор всего текста парсером NumPy (без объектов Python на каждое число)
+    return np.loadtxt(io.BytesIO(data), dtype=np.float64, delimiter=',', ndmin=2)
+
+
+def load_units(model):
+    """Колонки имущества массивами NumPy: id, start (datetime64[D]), cost, period (лет, -1 - неизвестен)"""
+    buffer = io.BytesIO()
+    model.execute_copy(UNITS_COPY_STMT.format(sql.Identifier(model._table)), buffer)
+    data = parse_units_csv(buffer.getvalue())
+    return {
+        'id': data[:, 0].astype(np.int64),
+        'start': data[:, 1].astype(np.int64).astype('datetime64[D]'),
+        'cost': data[:, 2],
+        'period': data[:, 3].astype(np.int64),
+    }
+
+
+def add_years(start, years):
+    """Дата через years лет (29 февраля в невисокосном году -> 28 февраля)"""
+    month = start.astype('datetime64[M]')
+    shifted_month = month + years * 12
+    shifted = shifted_month.astype('datetime64[D]') + (start - month.astype('datetime64[D]'))
+    month_end = (shifted_month + 1).astype('datetime64[D]') - 1
+    return np.minimum(shifted, month_end)
+
+
+def compute_depreciation(units, on_date):
+    """Остаточная стоимость, амортизация на дату и дата списания для всех записей сразу
+
+    :param units:   Массивы из load_units
+    :param on_date: Дата расчета (datetime.date)
+    :return: Словарь массивов: id, cost, residual, depreciation, write_off (NaT - срок неизвестен)
+    """
+    on_date = np.datetime64(on_date, 'D')
+    known = units['period'] >= 0
+    write_off = np.full(units['start'].shape, np.datetime64('NaT'), dtype='datetime64[D]')
+    write_off[known] = add_years(units['start'][known], units['period'][known])
+    service_days = (write_off - units['start']).astype(np.float64)
+    elapsed_days = (on_date - units['start']).astype(np.float64)
+    # Нулевой срок - списывается сразу; неизвестный срок - не амортизируется
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = np.where(service_days > 0, elapsed_days / service_days, 1.0)
+    share = np.where(known, np.clip(share, 0.0, 1.0), 0.0)
+    depreciation = np.round(units['cost'] * share, 2)
+    return {
+        'id': units['id'],
+        'cost': units['cost'],
+        'residual': np.round(units['cost'] - depreciation, 2),
+        'depreciation': depreciation,
+        'write_off': write_off,
+    }
+
+
+def summarize(result, on_date, months=12):
+    """Итоги по всему имуществу и график списания по месяцам
+
+    :param months: На сколько месяцев вперед (включая месяц даты расчета) строить график
+    :return: (итоги, [{month, count, cost, residual}]); просроченное списание - в итогах (overdue)
+    """
+    on_date = np.datetime64(on_date, 'D')
+    write_off = result['write_off']
+    known = ~np.isnat(write_off)
+    overdue = known & (write_off <= on_date)
+    totals = {
+        'count': int(write_off.size),
+        'cost': round(float(result['cost'].sum()), 2),
+        'residual': round(float(result['residual'].sum()), 2),
+        'depreciation': round(float(result['depreciation'].sum()), 2),
+        'unknown_period': int((~known).sum()),
+        'overdue': int(overdue.sum()),
+        'overdue_cost': round(float(result['cost'][overdue].sum()), 2),
+    }
+    first_month = on_date.astype('datetime64[M]')
+    # Номер месяца графика для каждой записи; вне графика - отбрасываются
+    index = (write_off[known & ~overdue].astype('datetime64[M]') - first_month).astype(np.int64)
+    in_range = index < months
+    index = index[in_range]
+    due = known & ~overdue
+    counts = np.bincount(index, minlength=months)
+    costs = np.bincount(index, weights=result['cost'][due][in_range], minlength=months)
+    residuals = np.bincount(index, weights=result['residual'][due][in_range], minlength=months)
+    schedule = [
+        {
+            'month': str(first_month + number),
+            'count': int(counts[number]),
+            'cost': round(float(costs[number]), 2),
+            'residual': round(float(residuals[number]), 2),
+        }
+        for number in range(months)
+    ]
+    return totals, schedule
+
+
+def iter_depreciation(result):
+    """Построчный результат расчета (для выгрузки по записям)"""
+    write_off = result['write_off'].astype(object)
+    for number in range(result['id'].size):
+        yield {
+            'id': int(result['id'][number]),
+            'cost': float(result['cost'][number]),
+            'residual': float(result['residual'][number]),
+            'depreciation': float(result['depreciation'][number]),
+            'write_off': write_off[number],
+        }
+
+
+@click.command('depreciation')
+@click.option('--date', '-d', 'on_date', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='дата расчета (по умолчанию - сегодня)')
+@click.option('--months', '-m', default=12, show_default=True, help='на сколько месяцев строить график списания')
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default=None,
+              help='CSV-файл с расчетом по каждой записи')
+def depreciation_command(on_date, months, output):
+    """Амортизация имущества и график списания по месяцам"""
+    on_date = on_date.date() if on_date else dt.date.today()
+    result = compute_depreciation(load_units(UnitModel(PGCursor())), on_date)
+    totals, schedule = summarize(result, on_date, months)
+    click.echo(f'Расчет на {on_date}: записей {totals["count"]}')
+    click.echo(f'Стоимость {totals["cost"]:.2f}, остаточная {totals["residual"]:.2f}, '
+               f'амортизация {totals["depreciation"]:.2f}')
+    click.echo(f'Просрочено списание: {totals["overdue"]} (стоимость {totals["overdue_cost"]:.2f}), '
+               f'срок неизвестен: {totals["unknown_period"]}')
+    for month in schedule:
+        click.echo(f'{month["month"]}: {month["count"]:>6} шт. на {month["cost"]:.2f}')
+    if output is not None:
+        output.write('id,cost,residual,depreciation,write_off\n')
+        for row in iter_depreciation(result):
+            output.write('{id},{cost:.2f},{residual:.2f},{depreciation:.2f},{write_off}\n'.format(
+                **{**row, 'write_off': row['write_off'] or ''}
+            ))
+
+
+if __name__ == '__main__':
+    depreciation_command()
@@ -0,0 +1,70 @@
+class IdentityMap:
+    """Карта идентичности строк моделей на время одного запроса
+
+    Строки хранятся по ключу (таблица, первичный ключ), повторное чтение той же
+    строки обходится без обращения к БД. Запись в таблицу сбрасывает ее строки
+    и строки всех таблиц, которые к ней присоединяются (JOIN через backref).
+    """
+    def __init__(self):
+        # (таблица, id) -> строка
+        self._rows = {}
+        # (таблица, колонка, значение) -> список id найденных строк
+        self._fields = {}
+        # таблица -> таблицы, чьи колонки есть в ее строках
+        self._depends = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(index):
+        # id может прийти строкой (из окон редактирования)
+        return str(index)
+
+    def get(self, table, index):
+        """Строка по id или None"""
+        row = self._rows.get((table, self.key(index)))
+        if row is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return row
+
+    def get_by_field(self, table, column, value):
+        """Строки, найденные ранее по значению колонки, или None"""
+        indexes = self._fields.get((table, column, value))
+        if indexes is None or any((table, index) not in self._rows for index in indexes):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [self._rows[(table, index)] for index in indexes]
+
+    def add(self, model, row):
+        """Запомнить строку модели"""
+        self._depends.setdefault(model._table, model.get_joined_tables())
+        self._rows[(model._table, self.key(row[model._primary_key]))] = row
+
+    def add_by_field(self, model, column, value, rows):
+        """Запомнить результат выборки по значению колонки"""
+        for row in rows:
+            self.add(model, row)
+        self._fields[(model._table, column, value)] = [
+            self.key(row[model._primary_key]) for row in rows
+        ]
+
+    def invalidate(self, table):
+        """Сбросить строки таблицы и всех таблиц, которые ее присоединяют"""
+        stale = {
+            name
+            for name, depends in self._depends.items()
+            if name == table or table in depends
+        } | {table}
+        self._rows = {key: row for key, row in self._rows.items() if key[0] not in stale}
+        self._fields = {key: rows for key, rows in self._fields.items() if key[0] not in stale}
+
+    def clear(self):
+        self._rows.clear()
+        self._fields.clear()
+
+    def stats(self):
+        """Сколько запросов сэкономлено (hits) и сколько выполнено (misses)"""
+        return {'hits': self.hits, 'misses': self.misses, 'rows': len(self._rows)}
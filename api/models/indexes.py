@@ -0,0 +1,151 @@
+"""Индексы, которые нужны запросам моделей
+
+Набор индексов не пишется руками, а выводится из описания моделей:
+внешние ключи (backref) участвуют во всех JOIN, уникальные поля (_unique_field)
+ищутся через select_by_field/is_unique, по полям поиска (_search_fields)
+select_like/select_likes ищут подстроку (триграммный GIN-индекс pg_trgm).
+"""
+from collections import namedtuple
+
+from psycopg2 import sql
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from .basemodel import backref
+from .models import (
+    BuildingModel,
+    ChiefModel,
+    DepartmentModel,
+    HallModel,
+    MaterialModel,
+    TargetModel,
+    UnitModel,
+    UserModel,
+)
+
+
+MODELS = (
+    MaterialModel,
+    TargetModel,
+    DepartmentModel,
+    BuildingModel,
+    HallModel,
+    ChiefModel,
+    UnitModel,
+    UserModel,
+)
+
+# kind: btree - обычный индекс, trgm - GIN (gin_trgm_ops) для поиска подстроки
+Index = namedtuple('Index', ('name', 'table', 'column', 'kind'))
+
+
+def get_declared_indexes(models=MODELS):
+    """Индексы по ссылкам (backref), уникальным полям и полям поиска моделей"""
+    indexes = {}
+    for model in models:
+        columns = [
+            (field, 'btree')
+            for field, entity in model._fields.items()
+            if isinstance(entity, backref)
+        ]
+        if getattr(model, '_unique_field', None):
+            columns.append((model._unique_field, 'btree'))
+        columns.extend((field, 'trgm') for field in model._search_fields)
+        for column, kind in columns:
+            name = f'ix_{model._table}_{column}{"_trgm" if kind == "trgm" else ""}'.lower()
+            indexes.setdefault(name, Index(name, model._table, column, kind))
+    return list(indexes.values())
+
+
+def enable_trigram(cursor):
+    """Подключить pg_trgm, если расширение есть на сервере (False - нет)"""
+    cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    if cursor.fetchone() is None:
+        return False
+    cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    return True
+
+
+def get_covered_columns(cursor):
+    """(таблица, колонка, вид), с которых начинается хотя бы один рабочий индекс"""
+    cursor.execute('''
+        SELECT t.relname, a.attname,
+            CASE WHEN oc.opcname = 'gin_trgm_ops' THEN 'trgm' ELSE am.amname END
+        FROM pg_index i
+        JOIN pg_class t ON t.oid = i.indrelid
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_am am ON am.oid = c.relam
+        JOIN pg_opclass oc ON oc.oid = i.indclass[0]
+        JOIN pg_namespace n ON n.oid = t.relnamespace
+        JOIN pg_attribute a ON a.attrelid = t.oid AND a.attnum = i.indkey[0]
+        WHERE n.nspname = 'public' AND i.indisvalid
+    ''')
+    return set(cursor.fetchall())
+
+
+def get_invalid_indexes(cursor):
+    """Индексы, оставшиеся нерабочими после прерванного CREATE INDEX CONCURRENTLY"""
+    cursor.execute('''
+        SELECT c.relname
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND NOT i.indisvalid
+    ''')
+    return {row[0] for row in cursor.fetchall()}
+
+
+def sync_indexes(connection, concurrently=True, models=MODELS):
+    """Создать недостающие индексы, вернуть список созданных
+
+    :param connection:   Соединение psycopg2 (переводится в autocommit:
+                         CONCURRENTLY нельзя выполнять в транзакции)
+    :param concurrently: True - не блокировать запись в таблицы на существующей БД
+    """
+    connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    created = []
+    with connection.cursor() as cursor:
+        trigram = enable_trigram(cursor)
+        covered = get_covered_columns(cursor)
+        invalid = get_invalid_indexes(cursor)
+        for index in get_declared_indexes(models):
+            if (index.table, index.column, index.kind) in covered:
+                continue
+            if index.kind == 'trgm' and not trigram:
+                continue
+            concurrently_stmt = sql.SQL(' CONCURRENTLY' if concurrently else '')
+            if index.name in invalid:
+                # IF NOT EXISTS не пересоздаст нерабочий индекс
+                cursor.execute(sql.SQL('DROP INDEX{} IF EXISTS {}').format(
+                    concurrently_stmt, sql.Identifier(index.name)
+                ))
+            cursor.execute(sql.SQL('CREATE INDEX{} IF NOT EXISTS {} ON {} {}').format(
+                concurrently_stmt,
+                sql.Identifier(index.name),
+                sql.Identifier(index.table),
+                (
+                    sql.SQL('USING gin ({} gin_trgm_ops)')
+                    if index.kind == 'trgm' else
+                    sql.SQL('({})')
+                ).format(sql.Identifier(index.column)),
+            ))
+            covered.add((index.table, index.column, index.kind))
+            created.append(index)
+    return created
+
+
+def get_unused_indexes(connection):
+    """Индексы, по которым не было ни одного сканирования с последнего сброса статистики
+
+    Индексы первичных ключей и ограничений UNIQUE не предлагаются:
+    они нужны для целостности, а не для скорости.
+    :return: Список (индекс, таблица, размер)
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('''
+            SELECT s.indexrelname, s.relname, pg_size_pretty(pg_relation_size(s.indexrelid))
+            FROM pg_stat_user_indexes s
+            JOIN pg_index i ON i.indexrelid = s.indexrelid
+            WHERE s.schemaname = 'public' AND s.idx_scan = 0 AND NOT i.indisunique
+            ORDER BY pg_relation_size(s.indexrelid) DESC, s.indexrelname
+        ''')
+        return cursor.fetchall()
@@ -0,0 +1,226 @@
+"""Материализованные представления для тяжелых списков и отчетов
+
+Представление модели (_materialized_view) хранит все колонки ее полной выборки:
+JOIN по всем backref и готовые составные поля. Чтение через него (load='view',
+см. BaseModel.get_view_model) - просмотр одной таблицы без JOIN и CONCAT_WS.
+
+Об изменениях таблиц, из которых собрано представление, сообщают триггеры
+(на оператор, а не на строку) через NOTIFY. Обработчик (команда flask matviews)
+копит уведомления и обновляет представление одним REFRESH ... CONCURRENTLY,
+когда запись в таблицы затихла: серия изменений - одно обновление.
+"""
+import select
+import time
+
+import click
+from psycopg2 import sql
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from .db import PGCursor, connect_db, trigger_exists
+from .models import HallModel, UnitModel
+
+
+MATVIEW_MODELS = (
+    HallModel,
+    UnitModel,
+)
+
+# Канал NOTIFY, в который триггеры пишут имена устаревших представлений
+REFRESH_CHANNEL = 'matview_refresh'
+
+# Аргументы триггера: представления, которые зависят от таблицы
+NOTIFY_FUNCTION_STMT = '''
+    CREATE OR REPLACE FUNCTION public.matview_notify() RETURNS trigger AS $$
+    BEGIN
+        FOR i IN 0 .. TG_NARGS - 1 LOOP
+            PERFORM pg_notify({channel}, TG_ARGV[i]);
+        END LOOP;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+'''
+
+
+def get_view_columns(cursor, view):
+    """Колонки существующего материализованного представления (пустой список - его нет)"""
+    cursor.execute('''
+        SELECT a.attname
+        FROM pg_attribute a
+        JOIN pg_class c ON c.oid = a.attrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relname = %s AND c.relkind = 'm'
+            AND a.attnum > 0 AND NOT a.attisdropped
+        ORDER BY a.attnum
+    ''', (view,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def create_view(cursor, model):
+    """(Пере)создать представление модели с уникальным индексом по первичному ключу"""
+    view = model._materialized_view
+    cursor.execute(sql.SQL('''
+        DROP MATERIALIZED VIEW IF EXISTS {view};
+        CREATE MATERIALIZED VIEW {view} AS {query};
+        CREATE UNIQUE INDEX {index} ON {view} ({pk});
+    ''').format(
+        view=sql.Identifier(view),
+        query=model.compile_projection_skeleton(list(model.get_columns_catalog())),
+        # Без уникального индекса REFRESH ... CONCURRENTLY невозможен
+        index=sql.Identifier(f'ix_{view}_pk'.lower()),
+        pk=sql.Identifier(model._primary_key),
+    ))
+
+
+def get_dependencies(models):
+    """{таблица: [представления, собранные из нее]}"""
+    dependencies = {}
+    for model in models:
+        for table in sorted(model.get_joined_tables()):
+            dependencies.setdefault(table, []).append(model._materialized_view)
+    return dependencies
+
+
+def get_trigger_name(table):
+    return f'{table}_matview_refresh'
+
+
+def sync_matviews(connection, models=MATVIEW_MODELS, triggers=True):
+    """Создать недостающие представления, функцию и триггеры уведомлений
+
+    Представление пересоздается, если набор колонок полной выборки модели изменился.
+    :param triggers: True - (пере)создать триггеры уведомлений, False - удалить их,
+                     None - не трогать (без триггеров представления обновляет flask matviews --once)
+    :return: Список созданных (пересозданных) представлений
+    """
+    connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    pg = PGCursor(connection)
+    models = [model(pg) for model in models]
+    created = []
+    with connection.cursor() as cursor:
+        for model in models:
+            columns = [model._primary_key] + [
+                column for column in model.get_columns_catalog() if column != model._primary_key
+            ]
+            if get_view_columns(cursor, model._materialized_view) != columns:
+                create_view(cursor, model)
+                created.append(model._materialized_view)
+        if triggers is None:
+            return created
+        if triggers:
+            cursor.execute(sql.SQL(NOTIFY_FUNCTION_STMT).format(channel=sql.Literal(REFRESH_CHANNEL)))
+        for table, views in get_dependencies(models).items():
+            cursor.execute(sql.SQL('DROP TRIGGER IF EXISTS {} ON {}').format(
+                sql.Identifier(get_trigger_name(table)), sql.Identifier(table)
+            ))
+            if not triggers:
+                continue
+            # Триггер пересоздается: список зависимых представлений мог измениться
+            cursor.execute(sql.SQL('''
+                CREATE TRIGGER {trigger}
+                    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                    FOR EACH STATEMENT EXECUTE FUNCTION public.matview_notify({args});
+            ''').format(
+                trigger=sql.Identifier(get_trigger_name(table)),
+                table=sql.Identifier(table),
+                args=sql.SQL(', ').join(map(sql.Literal, views)),
+            ))
+    return created
+
+
+def refresh_matviews(connection, views):
+    """Обновить представления, не блокируя чтение из них (CONCURRENTLY)
+
+    :return: {представление: время обновления, сек.}
+    """
+    connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    timings = {}
+    with connection.cursor() as cursor:
+        for view in views:
+            started = time.perf_counter()
+            cursor.execute(sql.SQL('REFRESH MATERIALIZED VIEW CONCURRENTLY {}').format(sql.Identifier(view)))
+            timings[view] = time.perf_counter() - started
+    return timings
+
+
+class RefreshDebouncer:
+    """Откладывание обновления до паузы в изменениях
+
+    :param delay:     Сколько секунд без новых изменений ждать перед обновлением
+    :param max_delay: Дольше этого (от первого изменения) обновление не откладывается,
+                      даже если запись идет без перерыва
+    """
+    def __init__(self, delay=2.0, max_delay=30.0, clock=time.monotonic):
+        self.delay = delay
+        self.max_delay = max_delay
+        self.clock = clock
+        # {представление: (время первого изменения, время последнего)}
+        self._pending = {}
+
+    def touch(self, view):
+        """Отметить изменение данных представления"""
+        now = self.clock()
+        first, _ = self._pending.get(view, (now, now))
+        self._pending[view] = (first, now)
+
+    def get_deadline(self, view):
+        first, last = self._pending[view]
+        return min(last + self.delay, first + self.max_delay)
+
+    def timeout(self):
+        """Сколько секунд до ближайшего обновления (None - обновлять нечего)"""
+        if not self._pending:
+            return None
+        return max(0.0, min(map(self.get_deadline, self._pending)) - self.clock())
+
+    def pop_due(self):
+        """Представления, которые пора обновить (отметки изменений снимаются)"""
+        now = self.clock()
+        due = [view for view in self._pending if self.get_deadline(view) <= now]
+        for view in due:
+            del self._pending[view]
+        return due
+
+
+def listen_refresh(connection, debouncer, models=MATVIEW_MODELS):
+    """Слушать уведомления и обновлять представления; выдает {представление: время}"""
+    views = {model._materialized_view for model in models}
+    connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    with connection.cursor() as cursor:
+        cursor.execute(sql.SQL('LISTEN {}').format(sql.Identifier(REFRESH_CHANNEL)))
+    while True:
+        if select.select([connection], [], [], debouncer.timeout()) != ([], [], []):
+            connection.poll()
+        # Уведомления, пришедшие во время REFRESH, тоже лежат здесь
+        while connection.notifies:
+            notify = connection.notifies.pop(0)
+            if notify.payload in views:
+                debouncer.touch(notify.payload)
+        if due := debouncer.pop_due():
+            yield refresh_matviews(connection, due)
+
+
+@click.command('matviews')
+@click.option('--once', is_flag=True, help='обновить все представления сейчас и выйти')
+@click.option('--delay', '-d', default=2.0, show_default=True,
+              help='пауза в записи (сек.), после которой представление обновляется')
+@click.option('--max-delay', '-m', default=30.0, show_default=True,
+              help='дольше этого (сек.) обновление при непрерывной записи не откладывается')
+def matviews_command(once, delay, max_delay):
+    """Обновление материализованных представлений по изменениям таблиц"""
+    connection = connect_db()
+    try:
+        if once:
+            for view, seconds in refresh_matviews(connection, [m._materialized_view for m in MATVIEW_MODELS]).items():
+                click.echo(f'Обновлено {view} за {seconds:.2f} с')
+            return
+        with connection.cursor() as cursor:
+            tables = get_dependencies([model(PGCursor(connection)) for model in MATVIEW_MODELS])
+            if not any(trigger_exists(cursor, get_trigger_name(table)) for table in tables):
+                click.echo('Триггеры уведомлений не созданы (flask init-db -i --matview-triggers): '
+                           'изменения таблиц сюда не придут')
+        click.echo(f'Ждем изменений (LISTEN {REFRESH_CHANNEL}), Ctrl+C - выход')
+        for timings in listen_refresh(connection, RefreshDebouncer(delay, max_delay)):
+            for view, seconds in timings.items():
+                click.echo(f'Обновлено {view} за {seconds:.2f} с')
+    finally:
+        connection.close()
@@ -4,7 +4,13 @@ from psycopg2 import sql
 import marshmallow as mm
 import marshmallow.validate as mmv
 
-from .basemodel import BaseModel, RequiredField, backref, ComposedProperty
+from .basemodel import (
+    BaseModel,
+    ComposedProperty,
+    RequiredField,
+    backref,
+    prepared_statements,
+)
 
 
 class UserModel(BaseModel):
@@ -27,19 +33,29 @@ class UserModel(BaseModel):
         is_admin = mm.fields.Boolean(required=True)
 
     def sign_in(self, login, password):
-        """Вход в программу"""
-        stmt = sql.SQL('SELECT * FROM {} WHERE {}={}').format(
-            sql.Identifier(self._table),
-            sql.Identifier('Login'),
-            sql.Literal(login)
-        )
-        row = self.execute_get_one(stmt)
+        """Вход в программу (одним запросом: проверка пароля и роль)"""
+        if prepared_statements.enabled:
+            row = self.execute_prepared_get_one(
+                f'{self._table}_sign_in',
+                sql.SQL('SELECT * FROM {} WHERE {}=$1').format(
+                    sql.Identifier(self._table),
+                    sql.Identifier('Login')
+                ),
+                (login,)
+            )
+        else:
+            stmt = sql.SQL('SELECT * FROM {} WHERE {}={}').format(
+                sql.Identifier(self._table),
+                sql.Identifier('Login'),
+                sql.Literal(login)
+            )
+            row = self.execute_get_one(stmt)
         if not row:
             return {'!error': f'Пользователя с логином "{login}" не существует'}
         if row['Password'] != self.encrypt(password):
             return {'!error': f'Введенный пароль не совпадает'}
 
-        return {'is_admin': row['is_admin']}
+        return {'id': row[self._primary_key], 'is_admin': row['is_admin']}
 
     def create(self, **input_fields):
         """Добавление нового пользователя"""
@@ -62,6 +78,7 @@ class MaterialModel(BaseModel):
     _entity_name = 'Материал'
     _primary_key = 'IDMaterial'
     _unique_field = 'Material'
+    _cached = True
     _fields = {
         'Material': RequiredField(),
     }
@@ -76,6 +93,7 @@ class TargetModel(BaseModel):
     _entity_name = 'Тип помещения'
     _primary_key = 'IDTarget'
     _unique_field = 'Target'
+    _cached = True
     _fields = {
         'Target': RequiredField(),
     }
@@ -89,6 +107,9 @@ class DepartmentModel(BaseModel):
     _table = 'departments'
     _entity_name = 'Кафедра'
     _primary_key = 'IDDepartment'
+    _cached = True
+    _search_fields = ('DepartmentName',)
+    _fulltext_fields = ('DepartmentName', 'Boss', 'OfficeDean')
     _fields = {
         'DepartmentName': RequiredField(),
         'Boss': RequiredField(),
@@ -108,6 +129,8 @@ class BuildingModel(BaseModel):
     _table = 'buildings'
     _entity_name = 'Здание'
     _primary_key = 'IDKadastr'
+    _search_fields = ('BuildingName', 'Address')
+    _fulltext_fields = ('BuildingName', 'Address', 'Comment')
     _fields = {
         'BuildingName': RequiredField(),
         'Land': RequiredField(),
@@ -139,6 +162,9 @@ class HallModel(BaseModel):
     _table = 'halls'
     _entity_name = 'Помещение'
     _primary_key = 'IDHall'
+    _fulltext_fields = ('HallName', 'DepartmentName', 'Address')
+    # Помещение с типом, кафедрой, зданием и готовым HallName
+    _materialized_view = 'mv_halls_labels'
     _fields = {
         'HallNumber': RequiredField(),
         'HallSquare': RequiredField(),
@@ -176,6 +202,9 @@ class ChiefModel(BaseModel):
     _table = 'chiefs'
     _entity_name = 'Ответственный'
     _primary_key = 'IDChief'
+    _cached = True
+    _search_fields = ('Chief',)
+    _fulltext_fields = ('Chief', 'AddressChief')
     _fields = {
         'Chief': RequiredField(),
         'AddressChief': RequiredField(),
@@ -193,6 +222,12 @@ class UnitModel(BaseModel):
     _table = 'units'
     _entity_name = 'Имущество'
     _primary_key = 'IDUnit'
+    _search_fields = ('UnitName',)
+    _fulltext_fields = ('UnitName',)
+    # Срок службы хранится строкой (VARCHAR), в API - число
+    _numeric_text_fields = ('Period',)
+    # Имущество вместе с помещением, зданием, кафедрой и ответственным
+    _materialized_view = 'mv_units_location'
     _fields = {
         'UnitName': RequiredField(),
         'DateStart': RequiredField(),
@@ -214,3 +249,175 @@ class UnitModel(BaseModel):
 
         class Meta:
             unknown = mm.EXCLUDE
+
+    # Измерения отчета о стоимости: имя -> (колонка-ключ, колонка-название) из каталога колонок
+    _report_dimensions = {
+        'building': ('IDKadastr', 'BuildingName'),
+        'department': ('IDDepartment', 'DepartmentName'),
+        'hall': ('IDHall', 'HallName'),
+        'chief': ('IDChief', 'Chief'),
+    }
+
+    def select_cost_report(self, dimensions, grouping_sets=False, filters=None):
+        """Количество, суммарная и остаточная стоимость и средний возраст имущества
+
+        Итоги считаются в БД одним запросом с GROUP BY:
+        ROLLUP - иерархия измерений в заданном порядке с промежуточными итогами,
+        GROUPING SETS - итоги по каждому измерению отдельно. Общий итог есть всегда.
+
+        :param dimensions: Список измерений из _report_dimensions (н-р ['building', 'hall'])
+        :param filters: Фильтры имущества [(колонка, оператор, значение)] (см. get_condition)
+        :return: Строки {<измерение>_id, <измерение>, count, cost, cost_after, avg_age, grouping};
+                 в grouping бит измерения равен 1, если строка - итог по нему
+        """
+        catalog = self.get_columns_catalog()
+        filters = list(filters or ())
+        groups = [
+            sql.SQL('({}, {})').format(catalog[key][0], catalog[title][0])
+            for key, title in map(self._report_dimensions.__getitem__, dimensions)
+        ]
+        keys = [catalog[self._report_dimensions[dimension][0]][0] for dimension in dimensions]
+        stmt = sql.SQL('''
+            SELECT {dimensions},
+                COUNT(*) AS "count",
+                SUM({cost}) AS "cost",
+                SUM({cost_after}) AS "cost_after",
+                ROUND(AVG((current_date - {date_start}) / 365.25), 2) AS "avg_age",
+                GROUPING({keys}) AS "grouping"
+            {from_stmt}
+            {where}
+            GROUP BY {group_by}
+            ORDER BY {order}
+        ''').format(
+            dimensions=sql.SQL(', ').join(
+                sql.SQL('{} AS {}, {} AS {}').format(
+                    catalog[key][0], sql.Identifier(f'{dimension}_id'),
+                    catalog[title][0], sql.Identifier(dimension),
+                )
+                for dimension, (key, title) in zip(
+                    dimensions, map(self._report_dimensions.__getitem__, dimensions)
+                )
+            ),
+            cost=catalog['Cost'][0],
+            cost_after=catalog['CostAfter'][0],
+            date_start=catalog['DateStart'][0],
+            keys=sql.SQL(', ').join(keys),
+            from_stmt=self.get_from_stmt(
+                [column for dimension in dimensions for column in self._report_dimensions[dimension]] +
+                [column for column, _, _ in filters]
+            ),
+            where=(
+                sql.SQL('WHERE {}').format(
+                    sql.SQL(' AND ').join(self.get_condition(*item) for item in filters)
+                )
+                if filters else sql.SQL('')
+            ),
+            group_by=(
+                sql.SQL('GROUPING SETS ({}, ())').format(sql.SQL(', ').join(groups))
+                if grouping_sets else
+                sql.SQL('ROLLUP ({})').format(sql.SQL(', ').join(groups))
+            ),
+            order=sql.SQL(', ').join(
+                ([sql.SQL('"grouping"')] if grouping_sets else []) +
+                [sql.SQL('{} NULLS LAST').format(key) for key in keys]
+            ),
+        )
+        return self.execute_get_all(stmt)
+
+
+class SearchModel(BaseModel):
+    """Полнотекстовый поиск по документам всех сущностей (см. search.py)"""
+    _table = 'search_documents'
+    _entity_name = 'Документ поиска'
+    _primary_key = 'id'
+    _search_config = 'russian'
+    _fields = {}
+
+    def search(self, query, limit=5, entities=None):
+        """Найденные документы, не больше limit на каждый тип сущности
+
+        :param query:    Строка поиска (синтаксис websearch_to_tsquery)
+        :param limit:    Сколько лучших по ts_rank документов вернуть на тип
+        :param entities: Список типов (таблиц) для поиска (None - все)
+        :return: Список {entity, id, title, rank} по типам, внутри - по убыванию rank
+        """
+        stmt = sql.SQL('''
+            SELECT "entity", "id", "title", "rank" FROM (
+                SELECT "entity", "id", "title", ts_rank("document", q) AS "rank",
+                    row_number() OVER (
+                        PARTITION BY "entity" ORDER BY ts_rank("document", q) DESC, "id"
+                    ) AS "place"
+                FROM {table}, websearch_to_tsquery({config}, %(query)s) AS q
+                WHERE "document" @@ q {entities}
+            ) AS found
+            WHERE "place" <= %(limit)s
+            ORDER BY "entity", "rank" DESC, "id"
+        ''').format(
+            table=sql.Identifier(self._table),
+            config=sql.Literal(self._search_config),
+            entities=sql.SQL('AND "entity" = ANY(%(entities)s)' if entities is not None else ''),
+        )
+        return self.execute_get_all(stmt, {'query': query, 'limit': limit, 'entities': entities})
+
+
+class TokenRevocationModel(BaseModel):
+    """Отзывы токенов доступа, общие для всех процессов API (см. tokens.py)
+
+    Строка отзывает один токен (jti), все токены пользователя (user_id)
+    или все токены сразу, выданные раньше moment. expires - когда строка
+    перестает быть нужна: отозванные ею токены истекли сами.
+    """
+    _table = 'token_revocations'
+    _entity_name = 'Отзыв токенов'
+    _primary_key = 'id'
+    _fields = {}
+    # Таблица создается при первом обращении процесса (в схеме БД ее нет)
+    _table_ready = False
+    _table_stmt = sql.SQL('''
+        CREATE TABLE IF NOT EXISTS public.token_revocations
+        (
+            "id" SERIAL PRIMARY KEY,
+            "jti" TEXT,
+            "user_id" INTEGER,
+            "moment" DOUBLE PRECISION NOT NULL,
+            "expires" DOUBLE PRECISION NOT NULL
+        )
+    ''')
+
+    def get_select_active_stmt(self):
+        return sql.SQL('''
+            SELECT "jti", "user_id", "moment", "expires" FROM {table}
+            WHERE "expires" >= %(now)s ORDER BY "id"
+        ''').format(table=sql.Identifier(self._table))
+
+    def get_insert_many_stmt(self):
+        # Заодно удаляются строки, которые больше не нужны
+        return sql.SQL('''
+            WITH expired AS (DELETE FROM {table} WHERE "expires" < %(now)s)
+            INSERT INTO {table} ("jti", "user_id", "moment", "expires")
+            SELECT * FROM unnest(
+                %(jti)s::text[], %(user_id)s::integer[],
+                %(moment)s::double precision[], %(expires)s::double precision[]
+            )
+        ''').format(table=sql.Identifier(self._table))
+
+    def get_insert_many_vars(self, rows, now):
+        return {
+            'now': now,
+            **{field: [row[field] for row in rows] for field in ('jti', 'user_id', 'moment', 'expires')},
+        }
+
+    def ensure_table(self):
+        if not TokenRevocationModel._table_ready:
+            self.execute(self._table_stmt, is_returned=False)
+            TokenRevocationModel._table_ready = True
+
+    def select_active(self, now):
+        """Отзывы, которые в момент now еще действуют"""
+        self.ensure_table()
+        return self.execute_get_all(self.get_select_active_stmt(), {'now': now})
+
+    def insert_many(self, rows, now):
+        """Записать отзывы (строки из TokenRevocations.revoke*)"""
+        self.ensure_table()
+        self.execute(self.get_insert_many_stmt(), self.get_insert_many_vars(rows, now), is_returned=False)
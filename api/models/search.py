@@ -0,0 +1,177 @@
+"""Полнотекстовый поиск по нескольким сущностям сразу
+
+Документы поиска лежат в одной таблице search_documents (тип сущности, id,
+заголовок, tsvector) с GIN-индексом, ищет по ней SearchModel. Строки этой
+таблицы поддерживают триггеры на таблицах моделей: колонки документа берутся
+из _fulltext_fields модели, первая из них - заголовок и самый весомый (A) текст.
+Это любые колонки полной выборки модели, в т.ч. связанных таблиц и составные
+(н-р, HallName помещения): триггер читает строку запросом по первичному ключу.
+Изменение связанной записи (н-р, названия здания) попадает в документы ссылающихся
+строк при их следующем изменении или повторной синхронизации (sync_search).
+"""
+from psycopg2 import sql
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+from .db import PGCursor, trigger_exists
+from .models import (
+    BuildingModel,
+    ChiefModel,
+    DepartmentModel,
+    HallModel,
+    SearchModel,
+    UnitModel,
+)
+
+
+SEARCH_MODELS = (
+    BuildingModel,
+    HallModel,
+    UnitModel,
+    ChiefModel,
+    DepartmentModel,
+)
+
+SEARCH_TABLE_STMT = '''
+    CREATE TABLE IF NOT EXISTS public.search_documents
+    (
+        "entity" VARCHAR(60) NOT NULL,
+        "id" INTEGER NOT NULL,
+        "title" TEXT NOT NULL,
+        "document" tsvector NOT NULL,
+        CONSTRAINT search_documents_pkey PRIMARY KEY ("entity", "id")
+    );
+    CREATE INDEX IF NOT EXISTS ix_search_documents_document
+        ON public.search_documents USING gin ("document");
+'''
+
+# Документ из заголовка (вес A) и остальных колонок (вес B): общий для триггера и дозаполнения
+SEARCH_DOCUMENT_STMT = '''
+    CREATE OR REPLACE FUNCTION public.search_document(title text, rest text) RETURNS tsvector AS $$
+        SELECT setweight(to_tsvector({config}, coalesce(title, '')), 'A') ||
+            setweight(to_tsvector({config}, rest), 'B')
+    $$ LANGUAGE sql IMMUTABLE;
+'''
+
+# Аргументы триггера: первичный ключ, запрос строки документа (см. get_document_query),
+# затем колонки документа
+SEARCH_FUNCTION_STMT = '''
+    CREATE OR REPLACE FUNCTION public.search_document_update() RETURNS trigger AS $$
+    DECLARE
+        row_data jsonb;
+        rest text := '';
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            -- TG_TABLE_NAME имеет тип name (правило сортировки "C"): без COLLATE
+            -- условие не попадает в индекс первичного ключа и каждый DELETE читает всю таблицу
+            DELETE FROM public.search_documents
+            WHERE "entity" = TG_TABLE_NAME::text COLLATE "default"
+                AND "id" = (to_jsonb(OLD) ->> TG_ARGV[0])::integer;
+            RETURN OLD;
+        END IF;
+        EXECUTE TG_ARGV[1] INTO row_data USING (to_jsonb(NEW) ->> TG_ARGV[0])::integer;
+        FOR i IN 3 .. TG_NARGS - 1 LOOP
+            rest := concat_ws(' ', rest, row_data ->> TG_ARGV[i]);
+        END LOOP;
+        INSERT INTO public.search_documents ("entity", "id", "title", "document")
+        VALUES (
+            TG_TABLE_NAME,
+            (row_data ->> TG_ARGV[0])::integer,
+            coalesce(row_data ->> TG_ARGV[2], ''),
+            public.search_document(row_data ->> TG_ARGV[2], rest)
+        )
+        ON CONFLICT ("entity", "id") DO UPDATE
+            SET "title" = EXCLUDED."title", "document" = EXCLUDED."document";
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+'''
+
+
+def get_document_source(model):
+    """Выборка колонок документа всех строк модели (с нужными JOIN)"""
+    return model.compile_projection_skeleton(list(model._fulltext_fields))
+
+
+def get_document_query(model):
+    """Запрос строки документа (jsonb) по первичному ключу $1 для триггера"""
+    return sql.SQL('SELECT to_jsonb(r) FROM ({} WHERE {} = $1) AS r').format(
+        get_document_source(model),
+        sql.Identifier(model._table, model._primary_key),
+    )
+
+
+def sync_search(connection, models=SEARCH_MODELS):
+    """Создать таблицу документов, функцию и триггеры поиска; дозаполнить документы
+
+    :return: Список таблиц, для которых триггер создан впервые
+    """
+    connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    pg = PGCursor(connection)
+    models = [model(pg) for model in models]
+    created = []
+    with connection.cursor() as cursor:
+        cursor.execute(SEARCH_TABLE_STMT)
+        cursor.execute(sql.SQL(SEARCH_DOCUMENT_STMT).format(config=sql.Literal(SearchModel._search_config)))
+        cursor.execute(SEARCH_FUNCTION_STMT)
+        for model in models:
+            trigger = f'{model._table}_search_document'
+            # Триггер пересоздается: список колонок в модели мог измениться
+            if not trigger_exists(cursor, trigger):
+                created.append(model._table)
+            cursor.execute(sql.SQL('''
+                DROP TRIGGER IF EXISTS {trigger} ON {table};
+                CREATE TRIGGER {trigger}
+                    AFTER INSERT OR UPDATE OR DELETE ON {table}
+                    FOR EACH ROW EXECUTE FUNCTION public.search_document_update({args});
+            ''').format(
+                trigger=sql.Identifier(trigger),
+                table=sql.Identifier(model._table),
+                args=sql.SQL(', ').join(map(sql.Literal, (
+                    model._primary_key,
+                    get_document_query(model).as_string(cursor),
+                    *model._fulltext_fields,
+                ))),
+            ))
+            # Записи, добавленные до появления триггера (или до изменения колонок документа):
+            # документы собираются так же, как в триггере, сами таблицы не изменяются
+            title, *rest = model._fulltext_fields
+            cursor.execute(sql.SQL('''
+                INSERT INTO public.search_documents ("entity", "id", "title", "document")
+                SELECT {entity}, (r.data ->> {pk})::integer, coalesce(r.data ->> {title}, ''),
+                    public.search_document(r.data ->> {title}, {rest})
+                FROM (SELECT to_jsonb(t) AS data FROM ({source}) AS t) AS r
+                ON CONFLICT ("entity", "id") DO UPDATE
+                    SET "title" = EXCLUDED."title", "document" = EXCLUDED."document"
+                    WHERE (search_documents."title", search_documents."document")
+                        IS DISTINCT FROM (EXCLUDED."title", EXCLUDED."document")
+            ''').format(
+                entity=sql.Literal(model._table),
+                pk=sql.Literal(model._primary_key),
+                title=sql.Literal(title),
+                # Как в триггере: concat_ws(' ', '', колонки...), без колонок - пустая строка
+                rest=sql.SQL("concat_ws(' ', '', {})").format(
+                    sql.SQL(', ').join(sql.SQL('r.data ->> {}').format(sql.Literal(column)) for column in rest)
+                ) if rest else sql.Literal(''),
+                source=get_document_source(model),
+            ))
+    return created
+
+
+def drop_search(connection, models=SEARCH_MODELS):
+    """Удалить триггеры поиска и таблицу документов (поиск выключен)
+
+    :return: Список таблиц, с которых снят триггер
+    """
+    connection.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+    dropped = []
+    with connection.cursor() as cursor:
+        for model in models:
+            trigger = f'{model._table}_search_document'
+            if trigger_exists(cursor, trigger):
+                dropped.append(model._table)
+            cursor.execute(sql.SQL('DROP TRIGGER IF EXISTS {} ON {}').format(
+                sql.Identifier(trigger), sql.Identifier(model._table)
+            ))
+        # Без триггеров документы перестали бы обновляться - устаревший поиск хуже отсутствующего
+        cursor.execute('DROP TABLE IF EXISTS public.search_documents')
+    return dropped
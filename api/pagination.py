@@ -0,0 +1,112 @@
+import base64
+import binascii
+import json
+
+from flask import url_for, current_app
+
+from .api_exceptions import BadRequestResourceError
+
+
+def encode_cursor(after):
+    """Непрозрачный курсор страницы (ключ последней записи)
+
+    Ключ - первичный ключ или, при сортировке, список значений колонок
+    сортировки и первичного ключа (даты и числа NUMERIC - строками).
+    """
+    return base64.urlsafe_b64encode(json.dumps({'after': after}, default=str).encode()).decode()
+
+
+def decode_cursor(cursor, size=1):
+    """Ключ последней записи из курсора страницы
+
+    :param size: Сколько значений в ключе (1 - только первичный ключ)
+    """
+    try:
+        after = json.loads(base64.urlsafe_b64decode(cursor.encode()))['after']
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise BadRequestResourceError(info={'cursor': 'Invalid cursor'})
+    if size == 1:
+        valid = isinstance(after, int)
+    else:
+        valid = (
+            isinstance(after, list) and len(after) == size and
+            all(value is None or isinstance(value, (str, int, float, bool)) for value in after)
+        )
+    if not valid:
+        raise BadRequestResourceError(info={'cursor': 'Invalid cursor'})
+    return after
+
+
+class KeysetPaginationHelper:
+    """Постраничная выдача коллекции по ключу (WHERE pk > last ORDER BY pk)
+
+    Параметры запроса: limit - размер страницы, cursor - курсор из ссылки next.
+    only - список колонок узкой выборки (None - все колонки),
+    load - способ загрузки связей (см. LOAD_STRATEGIES),
+    filters и sort - фильтры и сортировка выборки (см. BaseModel.select_page).
+    """
+    def __init__(
+        self, request, model, schema, key_name='results',
+        only=None, load='none', filters=None, sort=None
+    ):
+        self.request = request
+        self.model = model
+        self.schema = schema
+        self.key_name = key_name
+        self.only = only
+        self.load = load
+        self.filters = filters
+        self.sort = sort
+        config = self.get_config()
+        self.page_size = config.get('PAGINATION_PAGE_SIZE', 100)
+        self.max_page_size = config.get('PAGINATION_MAX_PAGE_SIZE', 1000)
+
+    def get_config(self):
+        return current_app.config
+
+    def url_for(self, endpoint, **values):
+        return url_for(endpoint, **values)
+
+    def get_limit(self):
+        """Размер страницы из параметра limit"""
+        limit = self.request.args.get('limit', self.page_size)
+        try:
+            limit = int(limit)
+        except (TypeError, ValueError):
+            raise BadRequestResourceError(info={'limit': 'Must be an integer'})
+        if not 1 <= limit <= self.max_page_size:
+            raise BadRequestResourceError(
+                info={'limit': f'Must be between 1 and {self.max_page_size}'}
+            )
+        return limit
+
+    def get_after(self):
+        """Ключ, после которого начинается страница"""
+        cursor = self.request.args.get('cursor')
+        return decode_cursor(cursor, len(self.model.get_order(self.sort))) if cursor else None
+
+    def next_url(self, after, limit):
+        """Ссылка на следующую страницу с теми же параметрами запроса"""
+        args = self.request.args.to_dict()
+        args.update(limit=limit, cursor=encode_cursor(after))
+        return self.url_for(self.request.endpoint, _external=True, **args)
+
+    def get_page(self, rows, limit):
+        """Сериализованная страница из limit + 1 выбранных записей"""
+        next_url = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_url = self.next_url(self.model.get_sort_key(rows[-1], self.sort), limit)
+        return {
+            self.key_name: self.schema.dump(rows, many=True),
+            'next': next_url,
+        }
+
+    def paginate(self):
+        """Сериализованная страница и ссылка на следующую"""
+        limit = self.get_limit()
+        # Лишняя запись нужна только чтобы узнать, есть ли следующая страница
+        rows = self.model.select_page(
+            limit + 1, self.get_after(), self.only, self.load, self.filters, self.sort
+        )
+        return self.get_page(rows, limit)
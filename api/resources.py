@@ -0,0 +1,246 @@
+"""Общая часть ресурсов /api синхронного (views.py) и асинхронного (asyncviews.py) приложений
+
+Здесь разбор параметров и тела запроса, проверки, роли и перевод ошибок модели
+в ответы API - все, что не обращается к БД. Ресурсы приложений только читают
+запрос, вызывают модель (синхронно или через await) и передают результат сюда.
+"""
+from marshmallow import ValidationError
+
+from .api_exceptions import (
+    BadRequestResourceError,
+    NoInputDataError,
+    NotFoundResourceError,
+    NotUniqueDataError,
+    TokensDisabledError,
+)
+from .filters import parse_fields, parse_filters, parse_load, parse_sort
+from .schemas import bulk_schema, cost_report_schema, token_revoke_schema
+from .tokens import decode_token, issue_token
+from extras import identify_error
+
+
+def get_user_role(user):
+    """Роль пользователя ({'id', 'is_admin'} из sign_in или токена)"""
+    return 'admin' if user['is_admin'] else 'user'
+
+
+def get_token_secret(config):
+    """Ключ подписи токенов (без TOKEN_SECRET_KEY в конфиге токены выключены)"""
+    secret = config.get('TOKEN_SECRET_KEY')
+    if not secret:
+        raise TokensDisabledError()
+    return secret.encode()
+
+
+def token_response(config, user):
+    """Ответ POST /api/tokens/: новый токен для пользователя Basic-аутентификации"""
+    ttl = config.get('TOKEN_TTL', 900)
+    token, expires = issue_token(get_token_secret(config), user, ttl)
+    return {'token': token, 'token_type': 'Bearer', 'expires': expires, 'expires_in': ttl}
+
+
+def revoke_tokens(config, request_dict, revocations):
+    """Отзыв по телу DELETE /api/tokens/: {"token": ...}, {"user": id} или {"all": true}
+
+    :return: Строки отзыва для записи в таблицу token_revocations
+    """
+    secret = get_token_secret(config)
+    try:
+        target = token_revoke_schema.load(request_dict or {})
+    except ValidationError as e:
+        raise BadRequestResourceError(info={'errors': e.messages})
+    if 'token' in target:
+        if (claims := decode_token(secret, target['token'])) is None:
+            raise BadRequestResourceError(info={'token': 'Invalid token'})
+        return revocations.revoke(claims)
+    if 'user' in target:
+        return revocations.revoke_user(target['user'])
+    return revocations.revoke_all()
+
+
+def return_minimal(headers):
+    """Клиент просит не возвращать тело ответа (Prefer: return=minimal)"""
+    return any(
+        preference.strip().lower() == 'return=minimal'
+        for header in headers.getlist('Prefer')
+        for preference in header.split(',')
+    )
+
+
+def error_messages(errors):
+    """Тексты ошибок модели (ключи !error...)"""
+    return [value for key, value in errors.items() if key.startswith('!error')]
+
+
+def load_entry(schema, request_dict, partial=False):
+    """Поля записи из тела запроса по схеме ресурса"""
+    if not request_dict:
+        raise NoInputDataError()
+    try:
+        return schema.load(request_dict, partial=partial)
+    except ValidationError as e:
+        raise BadRequestResourceError(
+            info={'errors': e.messages, 'valid': e.valid_data}
+        )
+
+
+def get_unique_value(unique_key, request_dict):
+    """Значение уникального поля, которое надо проверить в БД (None - проверять нечего)"""
+    if unique_key is None:
+        return None
+    return request_dict.get(unique_key)
+
+
+def check_unique(unique_key, is_unique):
+    """Результат проверки уникальности (is_unique модели) - ошибка, если значение занято"""
+    if not is_unique:
+        raise NotUniqueDataError(info={'field': unique_key})
+
+
+def check_entry(entry, id=None):
+    """Запись из create/update_by_id или ошибка API по ошибке модели"""
+    if identify_error(entry):
+        if entry.get('!not_found'):
+            raise NotFoundResourceError(info={'id': id})
+        raise BadRequestResourceError(info={'errors': error_messages(entry)})
+    return entry
+
+
+def check_found(row, id):
+    """Запись из select_by_id или 404"""
+    if not row:
+        raise NotFoundResourceError(info={'id': id})
+    return row
+
+
+def check_deleted(result, id):
+    """Результат delete модели: ошибка - записи не было"""
+    if result is not None and identify_error(result):
+        raise NotFoundResourceError(info={'id': id})
+
+
+def parse_list_args(args, model, schema, default_load):
+    """Параметры выборки коллекции: ?fields=, ?load=, фильтры, ?sort=, ?stream=
+
+    :return: Словарь {only, load, filters, sort, stream}
+    """
+    return {
+        # ?fields=a,b - только эти колонки (и только нужные им JOIN)
+        'only': parse_fields(args, model, schema),
+        # ?load=none|joined|selectin|view - как загружать связанные записи
+        'load': parse_load(args, default_load),
+        # ?cost__gte=100&unit__prefix=Шк - фильтры, ?sort=-cost,unit - сортировка
+        'filters': parse_filters(args, model, schema),
+        'sort': parse_sort(args, model, schema),
+        # ?stream=1 - вся коллекция одним массивом, передаваемым по частям
+        'stream': bool(args.get('stream', type=int)),
+    }
+
+
+def load_bulk(request_dict):
+    """Список id (и изменяемые поля) для массовых операций"""
+    try:
+        return bulk_schema.load(request_dict or {})
+    except ValidationError as e:
+        raise BadRequestResourceError(info={'errors': e.messages})
+
+
+def load_bulk_patch(schema, unique_key, request_dict):
+    """Массовое изменение {"ids": [...], "patch": {поля}}
+
+    :return: (ids, поля, значение уникального поля для проверки в БД или None)
+    """
+    bulk = load_bulk(request_dict)
+    ids, patch = bulk['ids'], bulk['patch']
+    result = load_entry(schema, patch, partial=True)
+    unique_value = get_unique_value(unique_key, patch)
+    if unique_value is not None and len(set(ids)) > 1:
+        # Одно значение уникального поля нельзя записать в несколько записей
+        raise NotUniqueDataError(info={'field': unique_key})
+    return ids, result, unique_value
+
+
+def get_bulk_delete_ids(request_dict, args):
+    """id для массового удаления: {"ids": [...]} в теле или ?ids=1,2,3"""
+    if request_dict is None and 'ids' in args:
+        request_dict = {'ids': args['ids'].split(',')}
+    return load_bulk(request_dict)['ids']
+
+
+def bulk_updated(ids, updated):
+    """Ответ массового изменения (или ошибка модели)"""
+    if isinstance(updated, dict):
+        raise BadRequestResourceError(info={'errors': error_messages(updated)})
+    return {'updated': updated, 'missing': sorted(set(ids) - set(updated))}
+
+
+def bulk_deleted(ids, deleted):
+    """Ответ массового удаления"""
+    return {'deleted': deleted, 'missing': sorted(set(ids) - set(deleted))}
+
+
+def parse_cost_report_args(args, model):
+    """Параметры отчета о стоимости: by - измерения, mode - rollup или sets, фильтры имущества
+
+    :return: (измерения, режим, параметры фильтров)
+    """
+    dimensions = [
+        name.strip()
+        for name in args.get('by', 'building').split(',')
+        if name.strip()
+    ]
+    if not dimensions or len(set(dimensions)) != len(dimensions):
+        raise BadRequestResourceError(info={'by': 'Dimensions must be unique and not empty'})
+    if unknown := [name for name in dimensions if name not in model._report_dimensions]:
+        raise BadRequestResourceError(info={'by': f'Unknown dimensions: {", ".join(unknown)}'})
+    mode = args.get('mode', 'rollup')
+    if mode not in ('rollup', 'sets'):
+        raise BadRequestResourceError(info={'mode': 'Must be one of: rollup, sets'})
+    filter_args = args.copy()
+    for param in ('by', 'mode'):
+        filter_args.pop(param, None)
+    return dimensions, mode, filter_args
+
+
+def cost_report_response(dimensions, mode, rows):
+    return {
+        'by': dimensions,
+        'mode': mode,
+        'results': cost_report_schema.dump(rows, many=True),
+    }
+
+
+def parse_search_args(args, config, types):
+    """Параметры поиска: q - строка, limit - результатов на тип, types - типы через запятую
+
+    :return: (строка поиска, limit, список типов или None - все)
+    """
+    query = args.get('q', '').strip()
+    if not query:
+        raise BadRequestResourceError(info={'q': 'Search query is required'})
+    max_limit = config.get('SEARCH_MAX_LIMIT', 50)
+    limit = args.get('limit', config.get('SEARCH_LIMIT', 5), type=int)
+    if not 1 <= limit <= max_limit:
+        raise BadRequestResourceError(info={'limit': f'Must be between 1 and {max_limit}'})
+    entities = None
+    if names := args.get('types'):
+        entities = [name.strip() for name in names.split(',') if name.strip()]
+        if unknown := [name for name in entities if name not in types]:
+            raise BadRequestResourceError(info={'types': f'Unknown types: {", ".join(unknown)}'})
+    return query, limit, entities
+
+
+def search_response(query, entities, types, rows, get_url):
+    """Ответ поиска: найденное по типам
+
+    :param get_url: Функция (тип, id) -> ссылка на запись
+    """
+    results = {entity: [] for entity in entities or types}
+    for row in rows:
+        results[row['entity']].append({
+            'id': row['id'],
+            'title': row['title'],
+            'rank': row['rank'],
+            'url': get_url(row['entity'], row['id']),
+        })
+    return {'query': query, 'results': results}
@@ -1,5 +1,5 @@
 import datetime as dt
-from marshmallow import Schema, fields, validate
+from marshmallow import Schema, ValidationError, fields, validate, validates_schema
 
 
 class UserSchema(Schema):
@@ -276,6 +276,60 @@ class UnitSchema(Schema):
         ordered = True
 
 
+class BulkSchema(Schema):
+    """Массовое изменение/удаление: список id и изменяемые поля"""
+    ids = fields.List(
+        fields.Integer(validate=validate.Range(min=1)),
+        required=True,
+        validate=validate.Length(min=1),
+    )
+    patch = fields.Dict(load_default=dict)
+
+
+class TokenRevokeSchema(Schema):
+    """Отзыв токенов: один токен, все токены пользователя или все сразу"""
+    token = fields.String()
+    user = fields.Integer(validate=validate.Range(min=1))
+    all = fields.Boolean(validate=validate.Equal(True))
+
+    @validates_schema
+    def validate_target(self, data, **kwargs):
+        if len(data) != 1:
+            raise ValidationError('Exactly one of token, user, all is required')
+
+
+class DepreciationSchema(Schema):
+    """Амортизация одной записи имущества"""
+    id = fields.Integer()
+    cost = fields.Float()
+    residual = fields.Float()
+    depreciation = fields.Float()
+    write_off = fields.Date(allow_none=True)
+
+    class Meta:
+        ordered = True
+
+
+class CostReportSchema(Schema):
+    """Строка отчета о стоимости имущества (измерения, которых нет в отчете, не выводятся)"""
+    building_id = fields.Integer()
+    building = fields.String()
+    department_id = fields.Integer()
+    department = fields.String()
+    hall_id = fields.Integer()
+    hall = fields.String()
+    chief_id = fields.Integer()
+    chief = fields.String()
+    count = fields.Integer()
+    cost = fields.Float()
+    cost_after = fields.Float()
+    avg_age = fields.Float()
+    grouping = fields.Integer()
+
+    class Meta:
+        ordered = True
+
+
 user_schema = UserSchema()
 target_schema = TargetSchema()
 material_schema = MaterialSchema()
@@ -283,4 +337,8 @@ department_schema = DepartmentSchema()
 building_schema = BuildingSchema()
 hall_schema = HallSchema()
 chief_schema = ChiefSchema()
-unit_schema = UnitSchema()
\ No newline at end of file
+unit_schema = UnitSchema()
+bulk_schema = BulkSchema()
+cost_report_schema = CostReportSchema()
+depreciation_schema = DepreciationSchema()
+token_revoke_schema = TokenRevokeSchema()
@@ -0,0 +1,146 @@
+import codecs
+import json
+import threading
+
+from flask import current_app, g, stream_with_context
+
+
+def iter_json_array(rows, schema, chunk_size=500):
+    """Построчная сериализация строк в JSON-массив
+
+    Строки сериализуются по мере поступления из курсора, наружу отдаются
+    порции примерно по chunk_size записей.
+    """
+    yield '['
+    chunk = []
+    for num, row in enumerate(rows):
+        chunk.append(('' if num == 0 else ',') + json.dumps(schema.dump(row), ensure_ascii=False))
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    chunk.append(']')
+    yield ''.join(chunk)
+
+
+async def aiter_json_array(rows, schema, chunk_size=500):
+    """То же, что iter_json_array, для асинхронного источника строк"""
+    yield '['
+    chunk = []
+    num = 0
+    async for row in rows:
+        chunk.append(('' if num == 0 else ',') + json.dumps(schema.dump(row), ensure_ascii=False))
+        num += 1
+        if len(chunk) >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+    chunk.append(']')
+    yield ''.join(chunk)
+
+
+def stream_json_array(rows, schema):
+    """Ответ с JSON-массивом, передаваемым порциями (chunked transfer encoding)
+
+    Соединение запроса (g.db) переходит к ответу: контекст приложения закрывается
+    раньше, чем прочитано тело, и teardown_db вернул бы соединение в пул, пока
+    rows еще читает из него серверный курсор. Ответ возвращает соединение сам -
+    по окончании выдачи или при закрытии ответа (обрыв связи с клиентом).
+    """
+    db = g.pop('db', None)
+    lock = threading.Lock()
+    released = False
+
+    def release():
+        nonlocal released
+        with lock:
+            if released or db is None:
+                return
+            released = True
+        db.close()
+
+    def generate():
+        try:
+            yield from iter_json_array(rows, schema, current_app.config.get('STREAM_CHUNK_SIZE', 500))
+        finally:
+            release()
+
+    response = current_app.response_class(stream_with_context(generate()), mimetype='application/json')
+    response.call_on_close(release)
+    return response
+
+
+def iter_text_chunks(stream, chunk_size=65536, encoding='utf-8'):
+    """Чтение потока байтов порциями текста (без загрузки всего тела в память)"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    while chunk := stream.read(chunk_size):
+        if text := decoder.decode(chunk):
+            yield text
+    if text := decoder.decode(b'', final=True):
+        yield text
+
+
+def iter_json_array_items(chunks):
+    """Потоковый разбор JSON-массива: элементы выдаются по мере чтения
+
+    :param chunks: Итератор порций текста, начиная с '['
+    :raises ValueError: Если текст не является JSON-массивом
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def skip_whitespace():
+        nonlocal buffer, pos, eof
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            buffer, pos = next(chunks, None), 0
+            if buffer is None:
+                buffer, eof = '', True
+
+    skip_whitespace()
+    if buffer[pos:pos + 1] != '[':
+        raise ValueError('Expected JSON array')
+    pos += 1
+    expect_item = True
+    first = True
+    while True:
+        skip_whitespace()
+        if eof and pos >= len(buffer):
+            raise ValueError('Unexpected end of JSON array')
+        if buffer[pos] == ']' and (first or not expect_item):
+            # После массива допустимы только пробельные символы
+            pos += 1
+            skip_whitespace()
+            if pos < len(buffer):
+                raise ValueError(f'Unexpected data after JSON array at position {pos}')
+            return
+        if not expect_item:
+            if buffer[pos] != ',':
+                raise ValueError(f'Expected "," at position {pos}')
+            pos += 1
+            expect_item = True
+            continue
+        # Значение разобрано надежно, только если за ним уже виден разделитель
+        # (иначе число мог оборваться на границе порции: "4." + "5")
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+                if eof or (end < len(buffer) and (buffer[end] in ',]' or buffer[end].isspace())):
+                    break
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            chunk = next(chunks, None)
+            if chunk is None:
+                eof = True
+            else:
+                buffer = buffer[pos:] + chunk
+                pos = 0
+        yield item
+        pos = end
+        expect_item = False
+        first = False
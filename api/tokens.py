@@ -0,0 +1,177 @@
+"""Подписанные токены доступа (HMAC-SHA256) вместо Basic-аутентификации на каждый запрос
+
+Токен - base64(JSON с id пользователя, ролью, временем выдачи и истечения)
+и base64(подпись) через точку. Проверка - только вычисление подписи и сравнение
+времени, без обращения к БД на каждый запрос.
+
+Отзыв (отдельный токен, все токены пользователя или все токены сразу) записывается
+в таблицу token_revocations (TokenRevocationModel), общую для всех процессов API.
+Каждый процесс держит ее копию в памяти (TokenRevocations) и перечитывает
+действующие записи не чаще раза в sync_interval секунд: в процессе, который отозвал токен,
+отзыв действует сразу, в остальных - не позже чем через sync_interval,
+после перезапуска - с первого же запроса с токеном.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import secrets
+import threading
+import time
+
+
+def b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def sign(secret, payload):
+    return hmac.new(secret, payload, hashlib.sha256).digest()
+
+
+def issue_token(secret, user, ttl):
+    """Токен для пользователя ({'id', 'is_admin'} из sign_in)
+
+    :return: (токен, время истечения - секунды эпохи)
+    """
+    now = time.time()
+    claims = {
+        'sub': user['id'],
+        'adm': bool(user['is_admin']),
+        # Округление вниз: токен, выданный до отзыва, не окажется позже момента отзыва
+        'iat': int(now * 1000) / 1000,
+        'exp': int(now + ttl),
+        'jti': secrets.token_urlsafe(12),
+    }
+    payload = json.dumps(claims, separators=(',', ':')).encode()
+    return f'{b64encode(payload)}.{b64encode(sign(secret, payload))}', claims['exp']
+
+
+def decode_token(secret, token):
+    """Содержимое токена с верной подписью, иначе None (срок и отзыв не проверяются)"""
+    try:
+        payload, signature = token.split('.')
+        payload = b64decode(payload)
+        if not hmac.compare_digest(b64decode(signature), sign(secret, payload)):
+            return None
+        claims = json.loads(payload)
+    except (ValueError, binascii.Error):
+        return None
+    if not isinstance(claims, dict) or not {'sub', 'adm', 'iat', 'exp', 'jti'} <= claims.keys():
+        return None
+    return claims
+
+
+class TokenRevocations:
+    """Отозванные токены: копия таблицы token_revocations в памяти процесса
+
+    Записи хранятся, пока отозванные ими токены не истекут сами,
+    поэтому размер ограничен числом отзывов за время жизни токена.
+    Методы revoke* применяют отзыв сразу и возвращают строки для записи
+    в таблицу, apply добавляет строки, прочитанные из нее.
+
+    :param ttl:           Время жизни токена в секундах
+    :param sync_interval: Через сколько секунд дочитывать отзывы из таблицы
+    """
+    def __init__(self, ttl=900, sync_interval=5.0):
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        # Когда таблица читалась последний раз (None - еще не читалась)
+        self._synced = None
+        # jti -> время истечения токена
+        self._tokens = {}
+        # id пользователя -> токены, выданные раньше этого времени, недействительны
+        self._users = {}
+        self._not_before = 0.0
+
+    def prune(self, now):
+        self._tokens = {jti: exp for jti, exp in self._tokens.items() if exp >= now}
+        self._users = {user: moment for user, moment in self._users.items() if moment + self.ttl >= now}
+
+    def add(self, row):
+        """Учесть строку отзыва ({jti, user_id, moment, expires}, см. TokenRevocationModel)"""
+        if row['jti'] is not None:
+            self._tokens[row['jti']] = max(self._tokens.get(row['jti'], 0), row['expires'])
+        elif row['user_id'] is not None:
+            self._users[row['user_id']] = max(self._users.get(row['user_id'], 0.0), row['moment'])
+        else:
+            self._not_before = max(self._not_before, row['moment'])
+
+    def revoke_rows(self, rows):
+        """Применить отзывы этого процесса, вернуть их для записи в таблицу"""
+        with self._lock:
+            self.prune(time.time())
+            for row in rows:
+                self.add(row)
+        return rows
+
+    def revoke(self, claims):
+        """Отозвать один токен"""
+        return self.revoke_rows([
+            {'jti': claims['jti'], 'user_id': None, 'moment': time.time(), 'expires': claims['exp']}
+        ])
+
+    def revoke_user(self, *ids):
+        """Отозвать все выданные пользователям токены"""
+        now = time.time()
+        return self.revoke_rows([
+            {'jti': None, 'user_id': user, 'moment': now, 'expires': now + self.ttl}
+            for user in ids
+        ])
+
+    def revoke_all(self):
+        """Отозвать все выданные токены"""
+        now = time.time()
+        return self.revoke_rows([
+            {'jti': None, 'user_id': None, 'moment': now, 'expires': now + self.ttl}
+        ])
+
+    def needs_sync(self):
+        """Пора перечитать отзывы из таблицы"""
+        return self._synced is None or time.monotonic() - self._synced >= self.sync_interval
+
+    def apply(self, rows):
+        """Добавить отзывы, прочитанные из таблицы
+
+        Читаются все действующие строки, а не только новые: строка с меньшим id
+        может быть зафиксирована позже уже прочитанной.
+        """
+        with self._lock:
+            self.prune(time.time())
+            for row in rows:
+                self.add(row)
+            self._synced = time.monotonic()
+
+    def is_revoked(self, claims):
+        with self._lock:
+            return (
+                claims['iat'] < self._not_before or
+                claims['iat'] < self._users.get(claims['sub'], 0.0) or
+                claims['jti'] in self._tokens
+            )
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tokens': len(self._tokens),
+                'users': len(self._users),
+                'ttl': self.ttl,
+            }
+
+
+def verify_token(secret, token, revocations):
+    """Пользователь ({'id', 'is_admin'}) по действующему токену, иначе None"""
+    claims = decode_token(secret, token)
+    if claims is None or claims['exp'] < time.time() or revocations.is_revoked(claims):
+        return None
+    return {'id': claims['sub'], 'is_admin': claims['adm']}
+
+
+# Общий для процесса список отозванных токенов
+# (время жизни и период чтения таблицы - TOKEN_TTL и TOKEN_REVOCATIONS_SYNC в api/config.py)
+token_revocations = TokenRevocations()
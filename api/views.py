@@ -1,7 +1,13 @@
+import datetime as dt
+import itertools
+import json
+import time
+
 from flask import Blueprint, request, make_response, g, current_app
 from flask_restful import Api, Resource
-from flask_httpauth import HTTPBasicAuth
+from flask_httpauth import HTTPBasicAuth, HTTPTokenAuth, MultiAuth
 from marshmallow import ValidationError
+from psycopg2 import errors as pg_errors
 
 from .models import (
     BuildingModel,
@@ -9,9 +15,14 @@ from .models import (
     DepartmentModel,
     HallModel,
     MaterialModel,
+    SearchModel,
     TargetModel,
+    TokenRevocationModel,
     UnitModel,
     UserModel,
+    auth_cache,
+    prepared_statements,
+    reference_cache,
 )
 from .schemas import (
     building_schema,
@@ -22,32 +33,96 @@ from .schemas import (
     target_schema,
     unit_schema,
     user_schema,
+    depreciation_schema,
+)
+from .db import get_db, get_pool
+from .models.depreciation import compute_depreciation, iter_depreciation, load_units, summarize
+from .filters import parse_fields, parse_filters
+from .pagination import KeysetPaginationHelper
+from .resources import (
+    bulk_deleted,
+    bulk_updated,
+    check_deleted,
+    check_entry,
+    check_found,
+    check_unique,
+    cost_report_response,
+    get_bulk_delete_ids,
+    get_token_secret,
+    get_unique_value,
+    get_user_role,
+    load_bulk_patch,
+    load_entry,
+    parse_cost_report_args,
+    parse_list_args,
+    parse_search_args,
+    return_minimal,
+    revoke_tokens,
+    search_response,
+    token_response,
 )
-from .db import get_db
+from .streaming import iter_json_array_items, iter_text_chunks, stream_json_array
+from .tokens import token_revocations, verify_token
 from .api_exceptions import (
     BadRequestResourceError,
     NoInputDataError,
-    NotFoundResourceError,
-    NotUniqueDataError,
+    SearchDisabledError,
 )
 from . import status
+from extras import identify_error, update_error_keys
 
 
-auth = HTTPBasicAuth()
+basic_auth = HTTPBasicAuth()
+# Authorization: Bearer <токен из /api/tokens/> - проверка без обращения к БД
+token_auth = HTTPTokenAuth(scheme='Bearer')
+auth = MultiAuth(basic_auth, token_auth)
 
-@auth.get_user_roles
+@token_auth.get_user_roles
+@basic_auth.get_user_roles
 def get_user_roles(user):
-    # NOTE : user - это werkzeug.dataclasses.Authorization
-    user = UserModel(get_db()).select_by_field('Login', user.username)
-    if user:
-        return 'admin' if user[0]['is_admin'] else 'user'
-    # NOTE если возвращает None, то будет отработан 403 FORBIDDEN
+    # NOTE : user - результат check_user_password или check_token ({'id', 'is_admin'})
+    return get_user_role(user)
+
+@token_auth.verify_token
+def check_token(token):
+    if not current_app.config.get('TOKEN_SECRET_KEY'):
+        # Токены выключены: заголовок Bearer не принимается
+        return None
+    if token_revocations.needs_sync():
+        # Отзывы, сделанные другими процессами
+        token_revocations.apply(TokenRevocationModel(get_db()).select_active(time.time()))
+    return verify_token(get_token_secret(current_app.config), token, token_revocations)
+
 
-@auth.verify_password
+def save_revocations(rows):
+    """Записать отзывы токенов в общую таблицу (для остальных процессов)"""
+    TokenRevocationModel(get_db()).insert_many(rows, time.time())
+
+@basic_auth.verify_password
 def check_user_password(username, password):
-    if '!error' in UserModel(get_db()).sign_in(username, password):
+    # Повторный запрос с теми же учетными данными - без БД и хеширования пароля
+    header = request.headers.get('Authorization', '')
+    if (user := auth_cache.get(header)) is not None:
+        return user
+    user = UserModel(get_db()).sign_in(username, password)
+    if '!error' in user:
         return False
-    return True
+    auth_cache.set(header, user)
+    return user
+
+
+def forget_users(*ids):
+    """Сбросить кеш аутентификации и отозвать токены пользователей (после их изменения)"""
+    auth_cache.invalidate_user(*ids)
+    if ids and current_app.config.get('TOKEN_SECRET_KEY'):
+        save_revocations(token_revocations.revoke_user(*ids))
+
+
+def minimal_response():
+    """Пустой ответ на запрос с Prefer: return=minimal"""
+    response = make_response('', status.HTTP_204_NO_CONTENT)
+    response.headers['Preference-Applied'] = 'return=minimal'
+    return response
 
 
 api_bp = Blueprint('api', __name__)
@@ -140,81 +215,109 @@ class BaseResource(UserAuthRequiredResource):
 
     def get(self, id):
         model = self._model(get_db())
-        if not (target := model.select_by_id(id)):
-            raise NotFoundResourceError(info={'id': id})
-
-        # print(target)
-        return self._schema.dump(target)
-        # print(a)
-        # return a
+        only = parse_fields(request.args, model, self._schema)
+        return self._schema.dump(check_found(model.select_by_id(id, only), id))
 
     def patch(self, id):
         model = self._model(get_db())
-        if model.select_by_id(id) is None:
-            raise NotFoundResourceError()
-
         request_dict = request.get_json()
-        if not request_dict:
-            raise NoInputDataError()
+        result = load_entry(self._schema, request_dict, partial=True)
+        if (value := get_unique_value(self._unique_key, request_dict)) is not None:
+            check_unique(self._unique_key, model.is_unique(id, value))
 
-        try:
-            result = self._schema.load(request_dict, partial=True)
-        except ValidationError as e:
-            raise BadRequestResourceError(
-                info={'errors': e.messages, 'valid': e.valid_data}
-            )
-
-        if (
-            self._unique_key is not None and
-            self._unique_key in request_dict and
-            not model.is_unique(id, request_dict[self._unique_key])
-        ):
-            raise NotUniqueDataError(info={'field': self._unique_key})
-
-        entry = model.update_by_id(id, **result)
-        # FIXME с этим пока ошибка, так как возвращает неполные данные (исправить с SQLALchemy)
+        entry = check_entry(model.update_by_id(id, **result), id)
+        if return_minimal(request.headers):
+            return minimal_response()
         return self._schema.dump(entry)
 
     def delete(self, id):
-        model = self._model(get_db())
-        if model.select_by_id(id) is None:
-            raise NotFoundResourceError(info={'id': id})
-        model.delete(id)
+        check_deleted(self._model(get_db()).delete(id), id)
         return make_response('', status.HTTP_204_NO_CONTENT)
 
 
 class BaseListResource(UserAuthRequiredResource):
-    """Базовый класс ресурса для списка (get, post)"""
+    """Базовый класс ресурса для списка (get, post, массовые patch и delete)"""
     # method_decorators = [auth.login_required(role='user')]
 
     def get(self):
-        entries = self._model(get_db()).select_all()
-        return self._schema.dump(entries, many=True)
+        model = self._model(get_db())
+        params = parse_list_args(
+            request.args, model, self._schema,
+            current_app.config.get('LIST_RELATIONS_LOAD', 'selectin'),
+        )
+        if params.pop('stream'):
+            return stream_json_array(model.iter_all(**params), self._schema)
+        return KeysetPaginationHelper(request, model, self._schema, **params).paginate()
 
     def post(self):
-        request_dict = request.get_json()
-        if not request_dict:
+        if not request.is_json:
             raise NoInputDataError()
+        # Тело читается потоком: массив разбирается по элементам, не загружаясь целиком
+        chunks = iter_text_chunks(request.stream)
+        head = ''
+        for chunk in chunks:
+            head += chunk
+            if head.strip():
+                break
+        if head.lstrip().startswith('['):
+            return self.post_many(iter_json_array_items(itertools.chain([head], chunks)))
 
         try:
-            result = self._schema.load(request_dict)
-        except ValidationError as e:
-            raise BadRequestResourceError(
-                info={'errors': e.messages, 'valid': e.valid_data}
-            )
+            request_dict = json.loads(head + ''.join(chunks)) if head.strip() else None
+        except ValueError as e:
+            raise BadRequestResourceError(info={'errors': str(e)})
+        result = load_entry(self._schema, request_dict)
 
         model = self._model(get_db())
-        if (
-            self._unique_key is not None and
-            self._unique_key in request_dict and
-            not model.is_unique(id, request_dict[self._unique_key])
-        ):
-            raise NotUniqueDataError(info={'field': self._unique_key})
-
-        entry_create = model.create(**result)
-        # FIXME с этим пока ошибка, так как возвращает неполные данные (исправить с SQLALchemy)
+        if (value := get_unique_value(self._unique_key, request_dict)) is not None:
+            check_unique(self._unique_key, model.is_unique(None, value))
+
+        entry_create = check_entry(model.create(**result))
+        if return_minimal(request.headers):
+            return minimal_response()
         return self._schema.dump(entry_create)
 
+    def post_many(self, items):
+        """Массовое создание записей из JSON-массива (одна транзакция)"""
+        def load(items):
+            for item in items:
+                try:
+                    yield self._schema.load(item)
+                except ValidationError as e:
+                    yield update_error_keys(e.messages)
+
+        try:
+            created = self._model(get_db()).bulk_create(
+                load(items),
+                current_app.config.get('BULK_BATCH_SIZE'),
+            )
+        except ValueError as e:
+            # Ошибка разбора JSON посреди потока
+            raise BadRequestResourceError(info={'errors': str(e)})
+        if isinstance(created, dict) and identify_error(created):
+            raise BadRequestResourceError(info={
+                'errors': {
+                    index: list(messages.values())
+                    for index, messages in created['!errors'].items()
+                }
+            })
+        return {'created': len(created), 'ids': created}, status.HTTP_201_CREATED
+
+    def patch(self):
+        """Массовое изменение: {"ids": [...], "patch": {поля}}"""
+        ids, result, value = load_bulk_patch(
+            self._schema, self._unique_key, request.get_json(silent=True)
+        )
+        model = self._model(get_db())
+        if value is not None:
+            check_unique(self._unique_key, model.is_unique(ids[0], value))
+        return bulk_updated(ids, model.bulk_update(ids, **result))
+
+    def delete(self):
+        """Массовое удаление: {"ids": [...]} в теле или ?ids=1,2,3"""
+        ids = get_bulk_delete_ids(request.get_json(silent=True), request.args)
+        return bulk_deleted(ids, self._model(get_db()).bulk_delete(ids))
+
 
 # ---------------------- Инициализация целевых ресурсов ---------------------- #
 class UserBaseConfig(AdminAuthRequired):
@@ -225,12 +328,33 @@ class UserBaseConfig(AdminAuthRequired):
 
 
 class UserResource(UserBaseConfig, BaseResource):
-    """."""
+    """Изменение и удаление пользователя сбрасывают кеш аутентификации и его токены"""
     # method_decorators = [auth.login_required(role='admin')]
 
+    def patch(self, id):
+        try:
+            return super().patch(id)
+        finally:
+            forget_users(id)
+
+    def delete(self, id):
+        try:
+            return super().delete(id)
+        finally:
+            forget_users(id)
+
 
 class UserListResource(UserBaseConfig, BaseListResource):
-    """."""
+    """Массовые изменение и удаление сбрасывают кеш аутентификации и токены пользователей"""
+    def patch(self):
+        result = super().patch()
+        forget_users(*result['updated'])
+        return result
+
+    def delete(self):
+        result = super().delete()
+        forget_users(*result['deleted'])
+        return result
 
 
 class TargetBaseConfig:
@@ -336,6 +460,113 @@ class UnitListResource(UnitBaseConfig, BaseListResource):
     """."""
 
 
+class StatsResource(AdminAuthRequired, Resource):
+    """Статистика пула соединений, подготовленных запросов и кеша справочников"""
+    def get(self):
+        return {
+            'pool': get_pool().stats(),
+            'prepared_statements': prepared_statements.stats(),
+            'reference_cache': reference_cache.stats(),
+            'auth_cache': auth_cache.stats(),
+            'token_revocations': token_revocations.stats(),
+        }
+
+
+class TokenResource(Resource):
+    """Токены доступа
+
+    post - обмен учетных данных Basic (любая роль) на токен Bearer;
+    delete (администратор) - отзыв: {"token": ...}, {"user": id} или {"all": true}.
+    """
+    method_decorators = {
+        'post': [basic_auth.login_required],
+        'delete': [auth.login_required(role='admin')],
+    }
+
+    def post(self):
+        return token_response(current_app.config, basic_auth.current_user())
+
+    def delete(self):
+        save_revocations(
+            revoke_tokens(current_app.config, request.get_json(silent=True), token_revocations)
+        )
+        return make_response('', status.HTTP_204_NO_CONTENT)
+
+
+class CostReportResource(UserAuthRequiredResource):
+    """Итоги стоимости имущества по зданиям, кафедрам, помещениям и ответственным
+
+    Параметры запроса: by - измерения через запятую (по умолчанию building),
+    mode - rollup (иерархия с промежуточными итогами) или sets (итоги по каждому
+    измерению отдельно), а также фильтры имущества, как у /api/units/.
+    """
+    def get(self):
+        model = UnitModel(get_db())
+        dimensions, mode, args = parse_cost_report_args(request.args, model)
+        if current_app.config.get('REPORTS_FROM_VIEWS'):
+            model = model.get_view_model()
+        rows = model.select_cost_report(
+            dimensions,
+            grouping_sets=mode == 'sets',
+            filters=parse_filters(args, model, unit_schema),
+        )
+        return cost_report_response(dimensions, mode, rows)
+
+
+class DepreciationResource(UserAuthRequiredResource):
+    """Амортизация всего имущества на дату и график списания по месяцам
+
+    Параметры запроса: date - дата расчета (по умолчанию сегодня), months - длина
+    графика, details=1 - вместо итогов расчет по каждой записи (потоком).
+    """
+    def get(self):
+        try:
+            on_date = (
+                dt.date.fromisoformat(request.args['date'])
+                if 'date' in request.args else
+                dt.date.today()
+            )
+        except ValueError:
+            raise BadRequestResourceError(info={'date': 'Must be a date YYYY-MM-DD'})
+        max_months = current_app.config.get('DEPRECIATION_MAX_MONTHS', 120)
+        months = request.args.get('months', current_app.config.get('DEPRECIATION_MONTHS', 12), type=int)
+        if not 1 <= months <= max_months:
+            raise BadRequestResourceError(info={'months': f'Must be between 1 and {max_months}'})
+
+        result = compute_depreciation(load_units(UnitModel(get_db())), on_date)
+        if request.args.get('details', type=int):
+            return stream_json_array(iter_depreciation(result), depreciation_schema)
+        totals, schedule = summarize(result, on_date, months)
+        return {'date': on_date.isoformat(), 'totals': totals, 'schedule': schedule}
+
+
+class SearchResource(UserAuthRequiredResource):
+    """Полнотекстовый поиск сразу по зданиям, помещениям, имуществу, ответственным и кафедрам
+
+    Параметры запроса: q - строка поиска, limit - результатов на тип,
+    types - типы через запятую (по умолчанию все).
+    """
+    _resources = {
+        'buildings': BuildingResource,
+        'halls': HallResource,
+        'units': UnitResource,
+        'chiefs': ChiefResource,
+        'departments': DepartmentResource,
+    }
+
+    def get(self):
+        query, limit, entities = parse_search_args(request.args, current_app.config, self._resources)
+        try:
+            rows = SearchModel(get_db()).search(query, limit, entities)
+        except pg_errors.UndefinedTable:
+            # Таблица документов создается только при включенном поиске (см. search.py)
+            raise SearchDisabledError()
+        return search_response(
+            query, entities, self._resources, rows,
+            lambda entity, id: api.url_for(self._resources[entity], id=id, _external=True),
+        )
+
+
 # --------------------------------- Маршруты --------------------------------- #
 api.add_resource(UserListResource, '/users/')
 api.add_resource(UserResource, '/users/<int:id>')
@@ -353,3 +584,8 @@ api.add_resource(ChiefListResource, '/chiefs/')
 api.add_resource(ChiefResource, '/chiefs/<int:id>')
 api.add_resource(UnitListResource, '/units/')
 api.add_resource(UnitResource, '/units/<int:id>')
+api.add_resource(StatsResource, '/stats/')
+api.add_resource(TokenResource, '/tokens/')
+api.add_resource(SearchResource, '/search')
+api.add_resource(CostReportResource, '/reports/costs')
+api.add_resource(DepreciationResource, '/reports/depreciation')
@@ -0,0 +1,2 @@
+# Замеры производительности слоя моделей.
+# Запуск из корня проекта: python -m benchmarks.<имя_модуля>
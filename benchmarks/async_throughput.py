@@ -0,0 +1,94 @@
+"""Пропускная способность синхронного (Flask) и асинхронного (Quart + asyncpg) API
+
+Оба приложения запускаются отдельными процессами на своих портах с одним и тем же
+конфигом (PG_POOL_MAX соединений). Клиент - потоки, каждый шлет запросы подряд
+в течение заданного времени; замеряются запросы в секунду, задержки и ошибки.
+Нужен пользователь tuser с паролем secret (роль user).
+"""
+import base64
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+HOST = '127.0.0.1'
+SERVERS = {
+    'sync (flask)': (5051, [
+        sys.executable, '-m', 'flask', '--app', "api.app:create_app('api.config')",
+        'run', '--host', HOST, '--port', '5051', '--with-threads', '--no-reload',
+    ]),
+    'async (quart)': (5052, [
+        sys.executable, '-m', 'hypercorn', "api.asyncapp:create_async_app('api.config')",
+        '--bind', f'{HOST}:5052',
+    ]),
+}
+PATHS = ['/api/units/1', '/api/units/?limit=20']
+AUTH = 'Basic ' + base64.b64encode(b'tuser:secret').decode()
+
+
+def request(url, auth=AUTH):
+    req = urllib.request.Request(url, headers={'Authorization': auth})
+    with urllib.request.urlopen(req, timeout=30) as response:
+        response.read()
+        return response.status
+
+
+def wait_ready(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            request(f'http://{HOST}:{port}{PATHS[0]}')
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    raise RuntimeError(f'Сервер на порту {port} не запустился')
+
+
+def worker(url, duration, auth=AUTH):
+    """Запросы подряд в течение duration секунд: (задержки, ошибки)"""
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    while (started := time.perf_counter()) < deadline:
+        try:
+            request(url, auth)
+            latencies.append(time.perf_counter() - started)
+        except (urllib.error.URLError, ConnectionError, TimeoutError):
+            errors += 1
+    return latencies, errors
+
+
+def run(url, concurrency, duration, auth=AUTH):
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(worker, [url] * concurrency, [duration] * concurrency, [auth] * concurrency))
+    latencies = [latency for result, _ in results for latency in result]
+    errors = sum(errors for _, errors in results)
+    return latencies, errors
+
+
+def main(levels=(1, 10, 50), duration=5.0):
+    env = {**os.environ, 'PYTHONPATH': os.getcwd()}
+    for name, (port, command) in SERVERS.items():
+        process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_ready(port)
+            for path in PATHS:
+                for concurrency in levels:
+                    latencies, errors = run(f'http://{HOST}:{port}{path}', concurrency, duration)
+                    quantiles = statistics.quantiles(latencies, n=20) if len(latencies) > 1 else [0] * 19
+                    print(
+                        f'{name:14} {path:22} x{concurrency:<3} '
+                        f'{len(latencies) / duration:8.1f} запр/с  '
+                        f'p50 {quantiles[9] * 1e3:7.1f} мс  p95 {quantiles[18] * 1e3:7.1f} мс  '
+                        f'ошибок {errors}'
+                    )
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Расчет амортизации по синтетическому набору имущества
+
+Массивы в формате load_units (по умолчанию 1 млн записей со случайными датами
+начала, стоимостью и сроком службы, часть сроков неизвестна) строятся в памяти,
+БД не нужна. Замеряются compute_depreciation и summarize.
+
+    python -m benchmarks.depreciation [количество записей]
+"""
+import datetime as dt
+import sys
+import timeit
+
+import numpy as np
+
+from api.models.depreciation import compute_depreciation, summarize
+
+
+def generate(count, seed=0):
+    """Синтетические массивы имущества: id, start, cost, period"""
+    rng = np.random.default_rng(seed)
+    period = rng.integers(1, 30, count)
+    period[rng.random(count) < 0.05] = -1
+    return {
+        'id': np.arange(1, count + 1, dtype=np.int64),
+        'start': np.datetime64('1990-01-01') + rng.integers(0, 365 * 35, count).astype('timedelta64[D]'),
+        'cost': np.round(rng.uniform(10, 100_000, count), 2),
+        'period': period,
+    }
+
+
+def main(count=1_000_000, number=5):
+    units = generate(count)
+    on_date = dt.date.today()
+    result = compute_depreciation(units, on_date)
+    compute = timeit.timeit(lambda: compute_depreciation(units, on_date), number=number) / number
+    summary = timeit.timeit(lambda: summarize(result, on_date, 120), number=number) / number
+    print(f'записей {count}: расчет {compute * 1e3:.1f} мс, итоги и график на 120 мес. {summary * 1e3:.1f} мс')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,54 @@
+"""Тяжелые выборки имущества через JOIN и через материализованное представление
+
+В units временно добавляется count синтетических записей (как в trigram_search),
+представления обновляются, затем сравниваются страница списка с фильтром и
+сортировкой по колонке здания, полная выборка и отчет о стоимости.
+Нужна заполненная БД с представлениями (init-db -i).
+
+    python -m benchmarks.matviews [количество записей]
+"""
+import sys
+import timeit
+
+from api.models import MATVIEW_MODELS, PGCursor, UnitModel, refresh_matviews
+from api.models.db import connect_db
+
+from .trigram_search import fill
+
+
+CASES = {
+    'страница 100, сортировка по зданию': lambda model, load: model.select_page(
+        100, load=load, filters=[('Cost', 'gt', 100)], sort=[('BuildingName', True)]
+    ),
+    'вся таблица': lambda model, load: model.select_all(load=load),
+    'отчет по зданиям и помещениям': lambda model, load: (
+        model.get_view_model() if load == 'view' else model
+    ).select_cost_report(['building', 'hall']),
+}
+
+
+def refresh():
+    connection = connect_db()
+    try:
+        return sum(refresh_matviews(connection, [m._materialized_view for m in MATVIEW_MODELS]).values())
+    finally:
+        connection.close()
+
+
+def main(count=100_000, number=3):
+    model = UnitModel(PGCursor())
+    first, last = fill(model, count)
+    try:
+        print(f'обновление представлений: {refresh() * 1e3:.1f} мс')
+        for title, case in CASES.items():
+            joined = timeit.timeit(lambda: case(model, 'joined'), number=number) / number
+            view = timeit.timeit(lambda: case(model, 'view'), number=number) / number
+            print(f'{title:36} JOIN: {joined * 1e3:8.1f} мс  представление: {view * 1e3:8.1f} мс  (x{joined / view:.1f})')
+    finally:
+        with model._connection as pg:
+            pg.execute('DELETE FROM units WHERE "IDUnit" BETWEEN %s AND %s', (first, last))
+        refresh()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,47 @@
+"""Сравнение способов загрузки связей (none / joined / selectin) на разных объемах
+
+Для замера в units временно добавляются синтетические записи (копии первой
+записи таблицы), после замера они удаляются. Нужна заполненная БД (db_fill).
+
+    python -m benchmarks.relation_loading [количество записей ...]
+"""
+import sys
+import timeit
+
+from api.models import LOAD_STRATEGIES, PGCursor, UnitModel
+
+
+SIZES = (100, 1000, 10000, 50000)
+
+
+def fill(model, count):
+    """Добавить count копий первой записи, вернуть их id"""
+    sample = model.select_page(1, load='none')[0]
+    row = {
+        column: value
+        for column, value in sample.items()
+        if column != model._primary_key
+    }
+    rows = ({**row, 'UnitName': f'benchmark {number}'} for number in range(count))
+    return model.bulk_create(rows)
+
+
+def main(sizes=SIZES, number=5):
+    model = UnitModel(PGCursor())
+    existing = len(model.select_all(load='none'))
+    created = fill(model, max(sizes) - existing) if max(sizes) > existing else []
+    try:
+        print(f'{"записей":>8} ' + ' '.join(f'{load:>12}' for load in LOAD_STRATEGIES))
+        for size in sizes:
+            timings = [
+                timeit.timeit(lambda: model.select_page(size, load=load), number=number) / number
+                for load in LOAD_STRATEGIES
+            ]
+            print(f'{size:>8} ' + ' '.join(f'{timing * 1e3:9.1f} мс' for timing in timings))
+    finally:
+        if created:
+            model.bulk_delete(created)
+
+
+if __name__ == '__main__':
+    main(tuple(map(int, sys.argv[1:])) or SIZES)
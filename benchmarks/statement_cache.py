@@ -0,0 +1,49 @@
+"""Сравнение стоимости сборки SQL-запроса до и после кеширования скелета SELECT
+
+Запрос в БД не отправляется: замеряется только построение текста запроса
+(то, что psycopg2 делает перед execute), поэтому нужен лишь доступ к соединению.
+"""
+import timeit
+
+from psycopg2 import sql
+
+from api.models import PGCursor, HallModel, UnitModel
+
+
+def build_uncached(model, index):
+    """Старый путь: рекурсивная сборка JOIN и составных полей на каждый запрос"""
+    stmt = sql.SQL('{} WHERE {}={}').format(
+        model.compile_select_skeleton(),
+        sql.Identifier(model._primary_key),
+        sql.Literal(index)
+    )
+    return stmt.as_string(model._connection.connection)
+
+
+def build_cached(model, index):
+    """Новый путь: готовый скелет класса + WHERE"""
+    stmt = sql.SQL('{} WHERE {}={}').format(
+        model.get_select_skeleton(),
+        sql.Identifier(model._primary_key),
+        sql.Literal(index)
+    )
+    return stmt.as_string(model._connection.connection)
+
+
+def main(number=2000):
+    pg = PGCursor()
+    for model_cls in (HallModel, UnitModel):
+        model = model_cls(pg)
+        assert build_uncached(model, 1) == build_cached(model, 1)
+        uncached = timeit.timeit(lambda: build_uncached(model, 1), number=number)
+        cached = timeit.timeit(lambda: build_cached(model, 1), number=number)
+        print(
+            f'{model_cls.__name__:10} '
+            f'без кеша: {uncached / number * 1e6:8.1f} мкс  '
+            f'с кешем: {cached / number * 1e6:8.1f} мкс  '
+            f'(x{uncached / cached:.1f})'
+        )
+
+
+if __name__ == '__main__':
+    main()
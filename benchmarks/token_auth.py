@@ -0,0 +1,76 @@
+"""Сравнение аутентификации Basic и токенов Bearer (/api/tokens/)
+
+1. Стоимость одной проверки в процессе: sign_in (запрос к БД + SHA1),
+   попадание в кеш аутентификации, проверка подписи токена.
+2. Нагрузочный тест синхронного сервера (см. async_throughput): одни и те же
+   запросы с заголовком Basic и с токеном.
+Нужен пользователь tuser с паролем secret (роль user). Ключ подписи токенов
+берется из API_TOKEN_SECRET_KEY (если не задан - случайный на время замера).
+"""
+import json
+import os
+import secrets
+import subprocess
+import timeit
+import urllib.request
+
+from api.models import AuthCache, PGCursor, UserModel
+from api.tokens import TokenRevocations, issue_token, verify_token
+
+from .async_throughput import AUTH, HOST, PATHS, SERVERS, run, wait_ready
+
+
+def measure_checks(number=2000):
+    model = UserModel(PGCursor())
+    user = model.sign_in('tuser', 'secret')
+    cache = AuthCache()
+    cache.set(AUTH, user)
+    secret = os.urandom(32)
+    token, _ = issue_token(secret, user, 900)
+    revocations = TokenRevocations()
+    assert verify_token(secret, token, revocations) == cache.get(AUTH) == user
+    checks = {
+        'Basic: sign_in (БД)': lambda: model.sign_in('tuser', 'secret'),
+        'Basic: кеш аутентификации': lambda: cache.get(AUTH),
+        'Bearer: подпись токена': lambda: verify_token(secret, token, revocations),
+    }
+    for name, check in checks.items():
+        seconds = timeit.timeit(check, number=number)
+        print(f'{name:28} {seconds / number * 1e6:8.1f} мкс')
+
+
+def get_token(port):
+    req = urllib.request.Request(
+        f'http://{HOST}:{port}/api/tokens/', method='POST', headers={'Authorization': AUTH}
+    )
+    with urllib.request.urlopen(req) as response:
+        return json.load(response)['token']
+
+
+def main(levels=(1, 10, 50), duration=5.0):
+    measure_checks()
+    port, command = SERVERS['sync (flask)']
+    env = {
+        'API_TOKEN_SECRET_KEY': secrets.token_hex(32),
+        **os.environ,
+        'PYTHONPATH': os.getcwd(),
+    }
+    process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port)
+        schemes = {'Basic': AUTH, 'Bearer': f'Bearer {get_token(port)}'}
+        for path in PATHS:
+            for concurrency in levels:
+                for name, auth in schemes.items():
+                    latencies, errors = run(f'http://{HOST}:{port}{path}', concurrency, duration, auth)
+                    print(
+                        f'{name:7} {path:22} x{concurrency:<3} '
+                        f'{len(latencies) / duration:8.1f} запр/с  ошибок {errors}'
+                    )
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Поиск подстроки в units с триграммным индексом и без него
+
+В units временно добавляется count синтетических записей (по умолчанию 1 млн,
+одним INSERT ... SELECT generate_series), после замера они удаляются.
+Без индекса - тот же запрос с запретом bitmap-сканирования (последовательный
+просмотр, как было с LIKE '%ключ%'). Нужны заполненная БД (db_fill) и pg_trgm.
+
+    python -m benchmarks.trigram_search [количество записей]
+"""
+import sys
+import timeit
+
+from psycopg2 import sql
+
+from api.models import PGCursor, UnitModel, sync_indexes
+from api.models.db import connect_db
+
+
+KEYS = ('шкаф', 'a1b2', 'benchmark 4242')
+
+
+def fill(model, count):
+    """Добавить count записей с различающимися названиями, вернуть границы их id"""
+    with model._connection as pg:
+        pg.execute(sql.SQL('''
+            INSERT INTO units ("UnitName", "DateStart", "Cost", "CostYear", "CostAfter", "Period", "HallID", "ChiefID")
+            SELECT 'benchmark ' || n || ' ' || md5(n::text),
+                "DateStart", "Cost", "CostYear", "CostAfter", "Period", "HallID", "ChiefID"
+            FROM (SELECT * FROM units ORDER BY "IDUnit" LIMIT 1) AS sample, generate_series(1, {}) AS n
+            RETURNING "IDUnit"
+        ''').format(sql.Literal(count)))
+        ids = [row['IDUnit'] for row in pg.fetchall()]
+        pg.execute('ANALYZE units')
+    return min(ids), max(ids)
+
+
+def search(model, key, use_index):
+    """Поиск через select_likes (в одной транзакции с настройкой планировщика)"""
+    setting = sql.SQL('SET LOCAL enable_bitmapscan = {}').format(sql.SQL('on' if use_index else 'off'))
+    stmt = sql.SQL('{}; {}').format(setting, model.get_likes_stmt({'UnitName': key}, only=['UnitName']))
+    return model.execute_get_all(stmt)
+
+
+def main(count=1_000_000, number=3):
+    model = UnitModel(PGCursor())
+    connection = connect_db()
+    try:
+        sync_indexes(connection, concurrently=False)
+    finally:
+        connection.close()
+    first, last = fill(model, count)
+    try:
+        for key in KEYS:
+            found = len(search(model, key, True))
+            assert found == len(search(model, key, False))
+            seq = timeit.timeit(lambda: search(model, key, False), number=number) / number
+            gin = timeit.timeit(lambda: search(model, key, True), number=number) / number
+            print(
+                f'{key!r:18} найдено {found:>7}  '
+                f'без индекса: {seq * 1e3:8.1f} мс  '
+                f'GIN pg_trgm: {gin * 1e3:8.1f} мс  (x{seq / gin:.1f})'
+            )
+    finally:
+        with model._connection as pg:
+            pg.execute('DELETE FROM units WHERE "IDUnit" BETWEEN %s AND %s', (first, last))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
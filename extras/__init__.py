@@ -1,4 +1,5 @@
 from .extra_funcs import (
+    batched,
     collect_message,
     identify_error,
     update_error_keys,
@@ -21,6 +21,17 @@ def update_error_keys(messages, key_prefix='!error_'):
         for num, (key, value) in enumerate(messages.items(), start=1)
     }
 
+def batched(iterable, size):
+    """Разбивает итерируемый объект на списки длиной не больше size"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
 
 if __name__ == '__main__':
     messages = {}
@@ -54,4 +65,6 @@ if __name__ == '__main__':
         'Address': 'error 3',
         'name': 'valid field',
     }
-    print(update_error_keys(messages))
\ No newline at end of file
+    print(update_error_keys(messages))
+    print('batched ' + '-'*30)
+    print(list(batched(range(7), 3)))
\ No newline at end of file
@@ -0,0 +1,103 @@
+import base64
+
+import psycopg2
+import pytest
+
+from api.app import create_app
+from api.models import PGCursor, TokenRevocationModel, UserModel
+from api.models import db as models_db
+from api.models.config import SQL_INIT_FILE
+
+
+TEST_LOGIN = 'pytest_user'
+TEST_PASSWORD = 'secret'
+TEST_ADMIN_LOGIN = 'pytest_admin'
+SCRATCH_DB = 'estate_register_pytest'
+
+
+@pytest.fixture(scope='session')
+def pg():
+    """Соединение с тестовой БД (тесты с БД пропускаются, если она недоступна)"""
+    try:
+        pg = PGCursor()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f'Postgres недоступен: {e}')
+    yield pg
+    pg.close()
+
+
+@pytest.fixture(scope='session')
+def user(pg):
+    """Временный пользователь с ролью user"""
+    model = UserModel(pg)
+    for row in model.select_by_field('Login', TEST_LOGIN):
+        model.delete(row[model._primary_key])
+    row = model.create(Login=TEST_LOGIN, Password=TEST_PASSWORD, is_admin=False)
+    yield row
+    model.delete(row[model._primary_key])
+
+
+@pytest.fixture
+def app(pg):
+    app = create_app('api.config')
+    app.config.update(TESTING=True, TOKEN_SECRET_KEY='pytest-secret')
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture(scope='session')
+def admin(pg):
+    """Временный пользователь с ролью admin"""
+    model = UserModel(pg)
+    for row in model.select_by_field('Login', TEST_ADMIN_LOGIN):
+        model.delete(row[model._primary_key])
+    row = model.create(Login=TEST_ADMIN_LOGIN, Password=TEST_PASSWORD, is_admin=True)
+    yield row
+    model.delete(row[model._primary_key])
+
+
+def basic_headers(login):
+    credentials = base64.b64encode(f'{login}:{TEST_PASSWORD}'.encode()).decode()
+    return {'Authorization': f'Basic {credentials}'}
+
+
+@pytest.fixture
+def auth_headers(user):
+    return basic_headers(TEST_LOGIN)
+
+
+@pytest.fixture
+def admin_headers(admin):
+    return basic_headers(TEST_ADMIN_LOGIN)
+
+
+@pytest.fixture
+def revocations_table(pg):
+    """Таблица отзывов токенов, очищаемая после теста"""
+    model = TokenRevocationModel(pg)
+    model.ensure_table()
+    yield model
+    with pg as cursor:
+        cursor.execute('TRUNCATE token_revocations')
+
+
+@pytest.fixture(scope='session')
+def scratch_db(pg):
+    """Отдельная БД из скрипта initdb (удаляется после тестов)"""
+    models_db.db_delete(SCRATCH_DB)
+    models_db.db_create(SCRATCH_DB)
+    models_db.db_fill(SQL_INIT_FILE, SCRATCH_DB)
+    yield SCRATCH_DB
+    models_db.db_delete(SCRATCH_DB)
+
+
+@pytest.fixture
+def scratch(scratch_db):
+    connection = models_db.get_db(scratch_db)
+    connection.autocommit = True
+    yield connection.cursor()
+    connection.close()
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from api.asyncapp import create_async_app
+
+
+@pytest.fixture
+def async_app(pg):
+    app = create_async_app('api.config')
+    app.config.update(TESTING=True, TOKEN_SECRET_KEY='pytest-secret')
+    return app
+
+
+def run_async(app, requests):
+    """Выполнить запросы к асинхронному приложению: [(метод, url, json)] -> [(код, тело)]"""
+    async def main():
+        async with app.test_app() as test_app:
+            client = test_app.test_client()
+            responses = []
+            for method, url, headers, body in requests:
+                response = await client.open(url, method=method, headers=headers, json=body)
+                responses.append((response.status_code, await response.get_json()))
+            return responses
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize('url', [
+    '/api/units/1',
+    '/api/units/999999',
+    '/api/units/?limit=3',
+    '/api/units/?limit=2&sort=-cost,unit&fields=unit,cost',
+    '/api/units/?period__gte=5&period__lt=30',
+    '/api/units/?fields=zzz',
+    '/api/units/?cursor=broken',
+    '/api/halls/?load=view&limit=2',
+    '/api/reports/costs?by=building,hall',
+    '/api/reports/costs?by=nope',
+    '/api/search',
+])
+def test_same_responses(client, async_app, auth_headers, url):
+    """Общие разбор запроса и ошибки: ответы обоих приложений совпадают"""
+    expected = client.get(url, headers=auth_headers)
+    [(code, body)] = run_async(async_app, [('GET', url, auth_headers, None)])
+    assert (code, body) == (expected.status_code, expected.get_json())
+
+
+def test_same_write_errors(client, async_app, auth_headers):
+    requests = [
+        ('POST', '/api/targets/', {}),
+        ('POST', '/api/units/', {'unit': ''}),
+        ('PATCH', '/api/targets/999999', {'target': 'pytest'}),
+        ('PATCH', '/api/targets/', {'ids': [1, 2], 'patch': {'target': 'pytest'}}),
+        ('PATCH', '/api/targets/', {'ids': [], 'patch': {'target': 'pytest'}}),
+        ('DELETE', '/api/units/999999', None),
+        ('DELETE', '/api/units/?ids=999998,999999', None),
+    ]
+    responses = run_async(async_app, [(method, url, auth_headers, body) for method, url, body in requests])
+    for (method, url, body), (code, data) in zip(requests, responses):
+        expected = client.open(url, method=method, headers=auth_headers, json=body)
+        assert (code, data) == (expected.status_code, expected.get_json() if expected.data else None), url
+
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_bearer_tokens(client, async_app, auth_headers, revocations_table):
+    """Токены асинхронного приложения принимаются синхронным и наоборот"""
+    [(code, body)] = run_async(async_app, [('POST', '/api/tokens/', auth_headers, None)])
+    assert code == 200 and body['token_type'] == 'Bearer'
+    token = client.post('/api/tokens/', headers=auth_headers).get_json()['token']
+    responses = run_async(async_app, [
+        ('GET', '/api/units/?limit=1', bearer(body['token']), None),
+        ('GET', '/api/units/?limit=1', bearer(token), None),
+        ('GET', '/api/units/?limit=1', bearer(token + 'x'), None),
+        # Токен не выдается по токену и не отзывается пользователем
+        ('POST', '/api/tokens/', bearer(token), None),
+        ('DELETE', '/api/tokens/', bearer(token), {'token': token}),
+    ])
+    assert [code for code, _ in responses] == [200, 200, 401, 401, 403]
+    assert client.get('/api/units/?limit=1', headers=bearer(body['token'])).status_code == 200
+
+
+def test_async_token_revocation(client, async_app, auth_headers, admin_headers, user, revocations_table):
+    """Отзыв токена и изменение пользователя в асинхронном приложении отзывают токены"""
+    first, second = (
+        client.post('/api/tokens/', headers=auth_headers).get_json()['token'] for _ in range(2)
+    )
+    responses = run_async(async_app, [
+        ('DELETE', '/api/tokens/', admin_headers, {'token': first}),
+        ('GET', '/api/units/?limit=1', bearer(first), None),
+        ('GET', '/api/units/?limit=1', bearer(second), None),
+        ('PATCH', f"/api/users/{user['IDUser']}", admin_headers, {'login': user['Login']}),
+        ('GET', '/api/units/?limit=1', bearer(second), None),
+        ('DELETE', '/api/tokens/', admin_headers, {'token': 'broken'}),
+    ])
+    assert [code for code, _ in responses] == [204, 401, 200, 200, 401, 400]
+    # Отзывы записаны в общую таблицу
+    rows = revocations_table.select_active(0)
+    assert [(row['jti'] is None, row['user_id']) for row in rows] == [(False, None), (True, user['IDUser'])]
+
+
+def test_async_tokens_disabled(async_app, auth_headers):
+    async_app.config['TOKEN_SECRET_KEY'] = None
+    [(code, body), (unauthorized, _)] = run_async(async_app, [
+        ('POST', '/api/tokens/', auth_headers, None),
+        ('GET', '/api/units/?limit=1', bearer('x.y'), None),
+    ])
+    assert (code, body['errors'][0]['code'], unauthorized) == (404, 'tokens-disabled', 401)
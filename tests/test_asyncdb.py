@@ -0,0 +1,83 @@
+import datetime as dt
+import decimal
+
+import pytest
+from psycopg2 import sql
+
+from api.models.asyncdb import coerce, compile_sql, flatten
+from api.models.basemodel import Constant
+
+
+def test_compile_sql_passes_values_as_parameters():
+    """Значения не попадают в текст запроса: только $n, идентификаторы - в кавычках"""
+    stmt = sql.SQL('SELECT * FROM {} WHERE {} = {} AND name ILIKE {}').format(
+        sql.Identifier('units'),
+        sql.Identifier('units', 'Unit"Name'),
+        sql.Literal(1),
+        sql.Literal("%'; DROP TABLE units; --%"),
+    )
+    query, args = compile_sql(stmt)
+    assert query == 'SELECT * FROM "units" WHERE "units"."Unit""Name" = $1 AND name ILIKE $2'
+    assert args == [1, "%'; DROP TABLE units; --%"]
+
+
+def test_compile_sql_vars():
+    """%s и %(имя)s - параметры, %% - знак процента; без vars % не обрабатывается"""
+    query, args = compile_sql(sql.SQL('a = %s AND b = %s AND c LIKE {} || %%').format(sql.Literal('x')), (1, 2))
+    assert query == 'a = $1 AND b = $2 AND c LIKE $3 || %'
+    assert args == [1, 2, 'x']
+
+    stmt = sql.SQL('a = {} OR b = %(id)s OR c = %(id)s').format(sql.Placeholder('name'))
+    assert compile_sql(stmt, {'name': 'n', 'id': 5}) == ('a = $1 OR b = $2 OR c = $2', ['n', 5])
+
+    assert compile_sql(sql.SQL('a %> {}').format(sql.Literal('x'))) == ('a %> $1', ['x'])
+
+
+def test_compile_sql_rejects_wrong_vars():
+    with pytest.raises(TypeError):
+        compile_sql('a = %s AND b = %s', (1,))
+    with pytest.raises(TypeError):
+        compile_sql('a = %s', (1, 2))
+    with pytest.raises(ValueError):
+        compile_sql('a = %d', (1,))
+
+
+def test_flatten_keeps_literals():
+    stmt = sql.SQL('SELECT {}, CONCAT_WS({}, {}) FROM {}').format(
+        sql.Identifier('t', 'a'), sql.Literal(', '), sql.Identifier('b'), sql.Identifier('t')
+    )
+    flat = flatten(stmt)
+    assert len(flat.seq) == 3
+    assert compile_sql(flat) == compile_sql(stmt) == ('SELECT "t"."a", CONCAT_WS($1, "b") FROM "t"', [', '])
+
+
+def test_constants_stay_in_text():
+    """Константа модели - в тексте запроса: SELECT и GROUP BY с ней совпадают для Postgres"""
+    expression = sql.SQL('CONCAT_WS({}, {})').format(Constant("; '%"), sql.Identifier('a'))
+    stmt = sql.SQL('SELECT {} FROM t WHERE b = %s GROUP BY {}').format(expression, expression)
+    assert compile_sql(flatten(stmt), (1,)) == (
+        """SELECT CONCAT_WS('; ''%', "a") FROM t WHERE b = $1 GROUP BY CONCAT_WS('; ''%', "a")""", [1]
+    )
+    with pytest.raises(TypeError):
+        compile_sql(Constant(1))
+
+
+@pytest.mark.parametrize('value, type_name, expected', [
+    ('5', 'int4', 5),
+    (decimal.Decimal('7'), 'int8', 7),
+    ('100.50', 'numeric', decimal.Decimal('100.50')),
+    (3, 'numeric', decimal.Decimal('3')),
+    ('0.5', 'float8', 0.5),
+    ('2020-01-02', 'date', dt.date(2020, 1, 2)),
+    ('2020-01-02T03:04:05', 'timestamp', dt.datetime(2020, 1, 2, 3, 4, 5)),
+    ('true', 'bool', True),
+    ('f', 'bool', False),
+    (5, 'text', '5'),
+    (0.3, 'regconfig', '0.3'),
+    (['1', '2'], 'int4[]', [1, 2]),
+    (None, 'int4', None),
+    (dt.date(2020, 1, 2), 'date', dt.date(2020, 1, 2)),
+])
+def test_coerce(value, type_name, expected):
+    """Значения-строки приводятся к типу параметра, как это сделал бы Postgres"""
+    assert coerce(value, type_name) == expected
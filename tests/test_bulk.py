@@ -0,0 +1,66 @@
+import pytest
+
+from api.models import UnitModel
+
+
+@pytest.fixture
+def units(pg):
+    """Два временных имущества (удаляются после теста, если еще есть)"""
+    model = UnitModel(pg)
+    unit = model.select_all()[0]
+    fields = {
+        key: unit[key]
+        for key in ('DateStart', 'Cost', 'CostYear', 'CostAfter', 'Period', 'HallID', 'ChiefID')
+    }
+    ids = [model.create(UnitName=f'pytest bulk {number}', **fields)['IDUnit'] for number in (1, 2)]
+    yield ids
+    model.bulk_delete(ids)
+
+
+def get_names(pg, ids):
+    return {row['IDUnit']: row['UnitName'] for row in UnitModel(pg).select_all() if row['IDUnit'] in ids}
+
+
+def test_bulk_patch_reports_missing(client, auth_headers, pg, units):
+    """Отсутствующие id не мешают изменить остальные и перечислены в missing"""
+    missing = [999998, 999999]
+    response = client.patch('/api/units/', headers=auth_headers, json={
+        'ids': units + missing + units[:1], 'patch': {'unit': 'pytest bulk patched'},
+    })
+    assert response.status_code == 200
+    body = response.get_json()
+    assert sorted(body['updated']) == sorted(units)
+    assert body['missing'] == missing
+    assert get_names(pg, units) == {index: 'pytest bulk patched' for index in units}
+
+
+def test_bulk_patch_only_missing(client, auth_headers):
+    response = client.patch('/api/units/', headers=auth_headers, json={
+        'ids': [999999], 'patch': {'unit': 'pytest'},
+    })
+    assert (response.status_code, response.get_json()) == (200, {'updated': [], 'missing': [999999]})
+
+
+@pytest.mark.parametrize('by_query', [False, True])
+def test_bulk_delete_reports_missing(client, auth_headers, pg, units, by_query):
+    """id удаляются из тела запроса или из ?ids=, отсутствующие - в missing"""
+    ids = units + [999999]
+    if by_query:
+        response = client.delete(f"/api/units/?ids={','.join(map(str, ids))}", headers=auth_headers)
+    else:
+        response = client.delete('/api/units/', headers=auth_headers, json={'ids': ids})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (sorted(body['deleted']), body['missing']) == (sorted(units), [999999])
+    assert get_names(pg, units) == {}
+    # Повторно - удалять уже нечего
+    response = client.delete('/api/units/', headers=auth_headers, json={'ids': units})
+    assert response.get_json() == {'deleted': [], 'missing': sorted(units)}
+
+
+def test_model_bulk_methods_return_affected_ids(pg, units):
+    model = UnitModel(pg)
+    assert sorted(model.bulk_update(units + [999999], Period='7')) == sorted(units)
+    assert model.bulk_update([999999], Period='7') == []
+    assert sorted(model.bulk_delete([999999] + units)) == sorted(units)
+    assert model.bulk_delete(units) == []
@@ -0,0 +1,130 @@
+import asyncio
+import datetime as dt
+
+import pytest
+
+from api.models import ChiefModel, HallModel, UnitModel
+from api.models import cache as cache_module
+from api.models.asyncdb import AsyncPGCursor, create_pool
+from api.models.asyncmodels import AsyncUnitModel
+from api.models.cache import ReferenceCache, reference_cache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое время для проверки ttl"""
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_ttl_expires_entries(clock):
+    cache = ReferenceCache(ttl=10, maxsize=10)
+    cache.set('t', 1, {'a': 1})
+    clock[0] += 9
+    assert cache.get('t', 1) == {'a': 1}
+    clock[0] += 2
+    assert cache.get('t', 1) is None
+    assert cache.stats()['size'] == 0
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lru_evicts_least_recently_used(clock):
+    cache = ReferenceCache(ttl=10, maxsize=2)
+    cache.set('t', 1, 'one')
+    cache.set('t', 2, 'two')
+    assert cache.get('t', 1) == 'one'
+    cache.set('t', 3, 'three')
+    assert cache.get('t', 2) is None
+    assert cache.get('t', 1) == 'one' and cache.get('t', 3) == 'three'
+
+
+def test_get_or_load_skips_none_and_invalidate():
+    cache = ReferenceCache()
+    calls = []
+
+    def load():
+        calls.append(1)
+        return None
+
+    assert cache.get_or_load('t', 1, load) is None
+    assert cache.get_or_load('t', 1, load) is None
+    assert len(calls) == 2
+    cache.set('t', 2, 'two')
+    cache.set('u', 2, 'two')
+    cache.invalidate('t')
+    assert cache.get('t', 2) is None and cache.get('u', 2) == 'two'
+
+
+def test_rows_are_copies():
+    """Изменение полученной (или переданной в кеш) строки не портит кеш"""
+    cache = ReferenceCache()
+    row = {'id': 1, 'name': 'a'}
+    cache.set('t', 'row', row)
+    row['name'] = 'changed'
+    cache.get('t', 'row')['name'] = 'changed'
+    assert cache.get('t', 'row') == {'id': 1, 'name': 'a'}
+
+    loaded = cache.get_or_load('t', 'all', lambda: [{'id': 1}, {'id': 2}])
+    loaded[0]['id'] = 100
+    rows = cache.get('t', 'all')
+    rows.append({'id': 3})
+    rows[1]['id'] = 200
+    assert cache.get('t', 'all') == [{'id': 1}, {'id': 2}]
+
+
+@pytest.fixture
+def stale_chief(pg):
+    """Ответственный, который есть в кеше справочника, но удален из БД в обход модели"""
+    model = ChiefModel(pg)
+    row = model.create(Chief='pytest stale chief', AddressChief='-', Experience=1)
+    index = row[model._primary_key]
+    assert model.select_by_id(index) is not None
+    with pg as cursor:
+        cursor.execute('DELETE FROM chiefs WHERE "IDChief" = %s', (index,))
+    assert model.select_by_id(index) is not None
+    yield index
+    reference_cache.invalidate(model._table)
+
+
+def get_unit_fields(pg, chief_id):
+    return {
+        'UnitName': 'pytest stale ref',
+        'DateStart': dt.date(2020, 1, 1),
+        'Cost': 10.0,
+        'CostYear': 2020,
+        'CostAfter': 5.0,
+        'Period': 3,
+        'HallID': HallModel(pg).select_all()[0]['IDHall'],
+        'ChiefID': chief_id,
+    }
+
+
+def test_stale_reference_is_an_error_not_500(pg, stale_chief):
+    """Устаревшая запись справочника: ошибка как у check_refs, кеш сброшен"""
+    model = UnitModel(pg)
+    result = model.create(**get_unit_fields(pg, stale_chief))
+    assert result == {'!error_1': f'Отсуствуют связанное поле "ChiefID" с индексом {stale_chief}'}
+    assert ChiefModel(pg).select_by_id(stale_chief) is None
+
+    unit = model.select_all()[0]
+    ChiefModel(pg).select_by_id(unit['ChiefID'])
+    reference_cache.set('chiefs', ('by_id', str(stale_chief)), {'IDChief': stale_chief})
+    result = model.update_by_id(unit['IDUnit'], ChiefID=stale_chief)
+    assert 'ChiefID' in result['!error_1']
+    assert model.select_by_id(unit['IDUnit'])['ChiefID'] == unit['ChiefID']
+
+    reference_cache.set('chiefs', ('by_id', str(stale_chief)), {'IDChief': stale_chief})
+    assert 'ChiefID' in model.bulk_update([unit['IDUnit']], ChiefID=stale_chief)['!error_1']
+
+
+def test_async_stale_reference_is_an_error(pg, stale_chief):
+    async def create():
+        pool = await create_pool(max_size=1)
+        try:
+            return await AsyncUnitModel(AsyncPGCursor(pool)).create(**get_unit_fields(pg, stale_chief))
+        finally:
+            await pool.close()
+
+    result = asyncio.run(create())
+    assert result == {'!error_1': f'Отсуствуют связанное поле "ChiefID" с индексом {stale_chief}'}
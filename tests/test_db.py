@@ -0,0 +1,51 @@
+import psycopg2
+import pytest
+
+from api.app import create_app
+from api.models import ConnectionPool, PoolTimeoutError
+from api.models import db as models_db
+
+
+@pytest.fixture
+def no_db(monkeypatch):
+    """Любая попытка подключения к БД - ошибка (счетчик попыток в списке)"""
+    attempts = []
+
+    def connect(*args, **kwargs):
+        attempts.append(args)
+        raise psycopg2.OperationalError('БД недоступна')
+
+    monkeypatch.setattr(models_db, 'connect_db', connect)
+    return attempts
+
+
+def test_create_app_does_not_connect(no_db):
+    app = create_app('api.config')
+    assert no_db == []
+    assert app.extensions['pg_pool'].stats()['size'] == 0
+
+
+def test_failed_start_is_retried(no_db):
+    pool = ConnectionPool(minconn=2, maxconn=3)
+    for _ in range(2):
+        with pytest.raises(psycopg2.OperationalError):
+            pool.getconn()
+        assert pool.stats()['size'] == 0
+    # Каждая выдача заново пробует открыть соединения (по одной попытке на выдачу)
+    assert len(no_db) == 2
+
+
+def test_pool_opens_minconn_on_first_use(pg):
+    pool = ConnectionPool(minconn=2, maxconn=2, timeout=0.1)
+    assert pool.stats()['size'] == 0
+    first = pool.getconn()
+    assert pool.stats()['size'] == 2 and pool.stats()['idle'] == 1
+    second = pool.getconn()
+    with pytest.raises(PoolTimeoutError):
+        pool.getconn()
+    pool.putconn(first)
+    pool.putconn(second)
+    stats = pool.stats()
+    assert stats['in_use'] == 0 and stats['idle'] == 2 and stats['timeouts'] == 1
+    pool.closeall()
+    assert pool.stats()['size'] == 0
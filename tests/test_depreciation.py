@@ -0,0 +1,89 @@
+import datetime as dt
+
+import numpy as np
+
+from api.models import UnitModel
+from api.models.depreciation import (
+    add_years,
+    compute_depreciation,
+    iter_depreciation,
+    load_units,
+    parse_units_csv,
+    summarize,
+)
+
+
+def make_units(*rows):
+    """Массивы как у load_units из кортежей (id, дата начала, стоимость, срок)"""
+    return {
+        'id': np.array([row[0] for row in rows], dtype=np.int64),
+        'start': np.array([row[1] for row in rows], dtype='datetime64[D]'),
+        'cost': np.array([row[2] for row in rows], dtype=np.float64),
+        'period': np.array([row[3] for row in rows], dtype=np.int64),
+    }
+
+
+def test_parse_units_csv():
+    data = parse_units_csv(b'1,18262,100.50,5\n2,-365,0,-1\n')
+    assert data.shape == (2, 4)
+    assert data.tolist() == [[1, 18262, 100.5, 5], [2, -365, 0, -1]]
+    assert parse_units_csv(b'').shape == (0, 4)
+
+
+def test_add_years_clamps_leap_day():
+    start = np.array(['2020-02-29', '2021-01-31', '2019-12-31'], dtype='datetime64[D]')
+    assert add_years(start, np.array([1, 3, 0])).tolist() == [
+        dt.date(2021, 2, 28), dt.date(2024, 1, 31), dt.date(2019, 12, 31)
+    ]
+
+
+def test_compute_depreciation():
+    units = make_units(
+        (1, '2020-01-01', 1000.0, 10),   # около половины срока (1827 дней из 3653)
+        (2, '2000-01-01', 500.0, 5),     # срок истек
+        (3, '2024-06-01', 300.0, -1),    # срок неизвестен
+        (4, '2025-01-01', 200.0, 0),     # нулевой срок
+        (5, '2026-01-01', 100.0, 3),     # еще не начат
+    )
+    result = compute_depreciation(units, dt.date(2025, 1, 1))
+    assert result['depreciation'].tolist() == [500.14, 500.0, 0.0, 200.0, 0.0]
+    assert result['residual'].tolist() == [499.86, 0.0, 300.0, 0.0, 100.0]
+    assert result['write_off'].astype(str).tolist() == [
+        '2030-01-01', '2005-01-01', 'NaT', '2025-01-01', '2029-01-01'
+    ]
+
+
+def test_summarize_schedule():
+    units = make_units(
+        (1, '2015-02-10', 100.0, 10),   # списание в текущем месяце графика
+        (2, '2015-04-01', 200.0, 10),   # через два месяца
+        (3, '2010-01-01', 50.0, 5),     # просрочено
+        (4, '2020-01-01', 70.0, -1),    # срок неизвестен
+        (5, '2020-01-01', 10.0, 30),    # за пределами графика
+    )
+    on_date = dt.date(2025, 2, 1)
+    totals, schedule = summarize(compute_depreciation(units, on_date), on_date, months=3)
+    assert totals['count'] == 5
+    assert totals['overdue'] == 1 and totals['overdue_cost'] == 50.0
+    assert totals['unknown_period'] == 1
+    assert [(month['month'], month['count'], month['cost']) for month in schedule] == [
+        ('2025-02', 1, 100.0), ('2025-03', 0, 0.0), ('2025-04', 1, 200.0)
+    ]
+
+
+def test_iter_depreciation_rows():
+    units = make_units((1, '2020-01-01', 100.0, 2), (2, '2020-01-01', 100.0, -1))
+    rows = list(iter_depreciation(compute_depreciation(units, dt.date(2021, 1, 1))))
+    assert rows[0]['write_off'] == dt.date(2022, 1, 1) and rows[0]['residual'] == 49.93
+    assert rows[1]['write_off'] is None and rows[1]['residual'] == 100.0
+
+
+def test_load_units_matches_table(pg):
+    units = load_units(UnitModel(pg))
+    with pg as cursor:
+        cursor.execute('SELECT "IDUnit", "DateStart", "Cost" FROM units ORDER BY "IDUnit"')
+        rows = cursor.fetchall()
+    order = np.argsort(units['id'])
+    assert units['id'][order].tolist() == [row['IDUnit'] for row in rows]
+    assert units['start'][order].tolist() == [row['DateStart'] for row in rows]
+    assert units['cost'][order].tolist() == [float(row['Cost']) for row in rows]
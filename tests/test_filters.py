@@ -0,0 +1,103 @@
+import asyncio
+import datetime as dt
+from decimal import Decimal
+
+import pytest
+
+from api.models import UnitModel
+from api.models.asyncdb import AsyncPGCursor, create_pool
+from api.models.asyncmodels import AsyncUnitModel
+
+
+def get_periods(pg):
+    """Сроки службы из таблицы: (id, число или None для нечисловой строки)"""
+    with pg as cursor:
+        cursor.execute('SELECT "IDUnit", "Period" FROM units')
+        rows = cursor.fetchall()
+    return {
+        row['IDUnit']: int(row['Period']) if row['Period'].isdigit() else None
+        for row in rows
+    }
+
+
+def fetch_all(client, headers, url):
+    """Все записи коллекции по ссылкам next"""
+    rows = []
+    while url:
+        page = client.get(url, headers=headers).get_json()
+        rows.extend(page['results'])
+        url = page['next']
+    return rows
+
+
+@pytest.fixture
+def text_period(pg):
+    """Имущество с нечисловым сроком службы (Period - VARCHAR в БД)"""
+    model = UnitModel(pg)
+    unit = model.select_all()[0]
+    with pg as cursor:
+        cursor.execute(
+            '''INSERT INTO units ("UnitName", "DateStart", "Cost", "CostYear", "CostAfter", "Period", "HallID", "ChiefID")
+            VALUES ('pytest period', %s, 1, 2020, 1, 'бессрочно', %s, %s) RETURNING "IDUnit"''',
+            (dt.date(2020, 1, 1), unit['HallID'], unit['ChiefID'])
+        )
+        index = cursor.fetchone()['IDUnit']
+    yield index
+    model.delete(index)
+
+
+def test_period_range_compares_numbers(client, auth_headers, pg, text_period):
+    """Period хранится строкой: '10' >= 5, а '5' < 9 не должно тянуть '30'"""
+    periods = get_periods(pg)
+    for query, check in (
+        ('period__gte=5', lambda value: value >= 5),
+        ('period__lt=9', lambda value: value < 9),
+        ('period__range=4,20', lambda value: 4 <= value <= 20),
+    ):
+        rows = fetch_all(client, auth_headers, f'/api/units/?limit=1000&{query}')
+        expected = {index for index, value in periods.items() if value is not None and check(value)}
+        assert {row['id'] for row in rows} == expected, query
+        assert expected
+
+
+@pytest.mark.parametrize('sort', ['period', '-period', 'period,-cost'])
+def test_period_sort_and_pages(client, auth_headers, pg, sort):
+    """Сортировка и ключ страницы (курсор) - по числу, а не по строке"""
+    periods = get_periods(pg)
+    rows = fetch_all(client, auth_headers, f'/api/units/?limit=2&sort={sort}')
+    assert sorted(row['id'] for row in rows) == sorted(periods)
+    assert [row['period'] for row in rows] == sorted(periods.values(), reverse=sort.startswith('-'))
+
+
+@pytest.mark.parametrize('desc', [False, True])
+def test_text_period_sorts_as_null(pg, text_period, desc):
+    """Нечисловой срок - как NULL: в ASC последним, в DESC первым, страницы не ломает"""
+    periods = get_periods(pg)
+    model = UnitModel(pg)
+    rows = list(model.iter_pages(2, sort=[('Period', desc), ('Cost', True)]))
+    assert sorted(row['IDUnit'] for row in rows) == sorted(periods)
+    values = [periods[row['IDUnit']] for row in rows]
+    assert values.index(None) == (0 if desc else len(values) - 1)
+    numbers = [value for value in values if value is not None]
+    assert numbers == sorted(numbers, reverse=desc)
+
+
+def test_async_period_range(pg):
+    async def select():
+        pool = await create_pool(max_size=1)
+        try:
+            model = AsyncUnitModel(AsyncPGCursor(pool))
+            return (
+                await model.select_all(filters=[('Period', 'gte', Decimal(5))]),
+                await model.select_page(100, sort=[('Period', False)]),
+            )
+        finally:
+            await pool.close()
+
+    periods = get_periods(pg)
+    filtered, page = asyncio.run(select())
+    assert {row['IDUnit'] for row in filtered} == {
+        index for index, value in periods.items() if value is not None and value >= 5
+    }
+    values = [periods[row['IDUnit']] for row in page]
+    assert values == sorted(values)
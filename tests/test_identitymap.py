@@ -0,0 +1,79 @@
+import pytest
+
+from api.models import HallModel, IdentityMap, PGCursor, TargetModel, UnitModel
+
+
+@pytest.fixture
+def mapped_pg(pg):
+    """Соединение с картой идентичности (как при IDENTITY_MAP в конфиге)"""
+    pg = PGCursor(identity_map=IdentityMap())
+    yield pg
+    pg.close()
+
+
+def test_get_and_add():
+    identity_map = IdentityMap()
+    model = TargetModel(None)
+    assert identity_map.get('targets', 1) is None
+    identity_map.add(model, {'IDTarget': 1, 'Target': 'a'})
+    # id из окон редактирования приходит строкой
+    assert identity_map.get('targets', '1') == {'IDTarget': 1, 'Target': 'a'}
+    assert identity_map.get('units', 1) is None
+    assert identity_map.stats() == {'hits': 1, 'misses': 2, 'rows': 1}
+
+
+def test_get_by_field():
+    identity_map = IdentityMap()
+    model = TargetModel(None)
+    rows = [{'IDTarget': 1, 'Target': 'a'}, {'IDTarget': 2, 'Target': 'a'}]
+    assert identity_map.get_by_field('targets', 'Target', 'a') is None
+    identity_map.add_by_field(model, 'Target', 'a', rows)
+    assert identity_map.get_by_field('targets', 'Target', 'a') == rows
+    assert identity_map.get('targets', 2) == rows[1]
+    # Пустой результат тоже запоминается
+    identity_map.add_by_field(model, 'Target', 'b', [])
+    assert identity_map.get_by_field('targets', 'Target', 'b') == []
+
+
+def test_invalidate_joined_tables(pg):
+    """Изменение помещения сбрасывает имущество (в его строках колонки помещения), но не назначения"""
+    identity_map = IdentityMap()
+    # Модели со связями (backref) - только с соединением, запросов нет
+    identity_map.add(UnitModel(pg), {'IDUnit': 1})
+    identity_map.add(HallModel(pg), {'IDHall': 2})
+    identity_map.add(TargetModel(pg), {'IDTarget': 3})
+    identity_map.add_by_field(UnitModel(pg), 'HallID', 2, [{'IDUnit': 4}])
+
+    identity_map.invalidate('halls')
+    assert identity_map.get('units', 1) is None
+    assert identity_map.get('halls', 2) is None
+    assert identity_map.get_by_field('units', 'HallID', 2) is None
+    assert identity_map.get('targets', 3) == {'IDTarget': 3}
+
+    identity_map.invalidate('units')
+    assert identity_map.get('targets', 3) == {'IDTarget': 3}
+    identity_map.clear()
+    assert identity_map.stats()['rows'] == 0
+
+
+def test_models_reuse_rows(mapped_pg):
+    """Повторное чтение строки в том же запросе - без БД, изменение - сбрасывает связанные"""
+    identity_map = mapped_pg.identity_map
+    unit = UnitModel(mapped_pg).select_all()[0]
+    first = UnitModel(mapped_pg).select_by_id(unit['IDUnit'])
+    assert identity_map.stats()['misses'] == 1
+    assert UnitModel(mapped_pg).select_by_id(str(unit['IDUnit'])) is first
+    assert UnitModel(mapped_pg).select_by_field('HallID', unit['HallID']) is not None
+    assert UnitModel(mapped_pg).select_by_field('HallID', unit['HallID']) is not None
+    assert identity_map.stats()['hits'] == 2
+
+    hall = HallModel(mapped_pg)
+    number = hall.select_by_id(unit['HallID'])['HallNumber']
+    updated = hall.update_by_id(unit['HallID'], HallNumber=number)
+    # Новая строка помещения запомнена, строки имущества с его колонками - сброшены
+    assert identity_map.get('halls', unit['HallID']) is updated
+    assert identity_map.get('units', unit['IDUnit']) is None
+    assert identity_map.get_by_field('units', 'HallID', unit['HallID']) is None
+
+    mapped_pg.close()
+    assert identity_map.stats()['rows'] == 0
@@ -0,0 +1,76 @@
+import psycopg2
+
+from api.models import db as models_db
+from api.models.indexes import enable_trigram, get_covered_columns, get_declared_indexes, sync_indexes
+from api.models.matviews import MATVIEW_MODELS
+from api.models.search import SEARCH_MODELS
+
+
+def get_triggers(cursor, suffix):
+    cursor.execute(
+        "SELECT tgname FROM pg_trigger WHERE NOT tgisinternal AND tgname LIKE %s",
+        (f'%{suffix}',),
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+def relation_exists(cursor, name):
+    cursor.execute('SELECT to_regclass(%s) IS NOT NULL', (f'public.{name}',))
+    return cursor.fetchone()[0]
+
+
+def test_indexes_only(scratch_db, scratch):
+    """--indexes-only: индексы моделей, без триггеров и представлений"""
+    models_db.db_indexes(scratch_db, indexes_only=True)
+    trigram = enable_trigram(scratch)
+    covered = get_covered_columns(scratch)
+    for index in get_declared_indexes():
+        if index.kind == 'btree' or trigram:
+            assert (index.table, index.column, index.kind) in covered, index
+    assert get_triggers(scratch, '_search_document') == set()
+    assert get_triggers(scratch, '_matview_refresh') == set()
+    assert not relation_exists(scratch, 'search_documents')
+    assert not relation_exists(scratch, MATVIEW_MODELS[0]._materialized_view)
+    # Повторный запуск ничего не создает
+    assert sync_indexes(scratch.connection) == []
+
+
+def test_defaults_create_views_without_triggers(scratch_db, scratch):
+    models_db.db_indexes(scratch_db, concurrently=False)
+    for model in MATVIEW_MODELS:
+        assert relation_exists(scratch, model._materialized_view)
+    assert get_triggers(scratch, '_matview_refresh') == set()
+    assert get_triggers(scratch, '_search_document') == set()
+
+
+def test_matview_triggers_flag(scratch_db, scratch):
+    models_db.db_indexes(scratch_db, indexes_only=True, matview_triggers=True)
+    assert get_triggers(scratch, '_matview_refresh') >= {'units_matview_refresh', 'halls_matview_refresh'}
+    models_db.db_indexes(scratch_db, indexes_only=True, matview_triggers=False)
+    assert get_triggers(scratch, '_matview_refresh') == set()
+
+
+def test_search_flag(scratch_db, scratch):
+    models_db.db_indexes(scratch_db, indexes_only=True, search=True)
+    assert get_triggers(scratch, '_search_document') == {
+        f'{model._table}_search_document' for model in SEARCH_MODELS
+    }
+    scratch.execute('SELECT count(*) FROM units')
+    units = scratch.fetchone()[0]
+    scratch.execute("SELECT count(*) FROM search_documents WHERE entity = 'units'")
+    assert scratch.fetchone()[0] == units
+
+    models_db.db_indexes(scratch_db, indexes_only=True, search=False)
+    assert get_triggers(scratch, '_search_document') == set()
+    assert not relation_exists(scratch, 'search_documents')
+
+
+def test_search_endpoint_without_search(client, auth_headers, monkeypatch):
+    """Поиск не настроен (нет таблицы документов) - 404, а не 500"""
+    def missing_table(*args, **kwargs):
+        raise psycopg2.errors.UndefinedTable('relation "search_documents" does not exist')
+
+    monkeypatch.setattr('api.views.SearchModel.search', missing_table)
+    response = client.get('/api/search?q=test', headers=auth_headers)
+    assert response.status_code == 404
+    assert response.get_json()['errors'][0]['code'] == 'search-disabled'
@@ -0,0 +1,96 @@
+import select
+
+import pytest
+
+from api.models import db as models_db
+from api.models.cache import reference_cache
+from api.models.matviews import MATVIEW_MODELS, REFRESH_CHANNEL, RefreshDebouncer, refresh_matviews, sync_matviews
+
+
+class Clock:
+    """Управляемые часы для RefreshDebouncer"""
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_debouncer_waits_for_pause():
+    clock = Clock()
+    debouncer = RefreshDebouncer(delay=2, max_delay=30, clock=clock)
+    assert debouncer.timeout() is None and debouncer.pop_due() == []
+    debouncer.touch('mv_units_location')
+    assert debouncer.timeout() == 2
+    clock.now += 1.5
+    # Новое изменение откладывает обновление
+    debouncer.touch('mv_units_location')
+    assert debouncer.pop_due() == []
+    assert debouncer.timeout() == 2
+    clock.now += 2
+    assert debouncer.timeout() == 0
+    assert debouncer.pop_due() == ['mv_units_location']
+    assert debouncer.timeout() is None
+
+
+def test_debouncer_max_delay():
+    """При непрерывной записи представление обновляется не реже раза в max_delay"""
+    clock = Clock()
+    debouncer = RefreshDebouncer(delay=2, max_delay=5, clock=clock)
+    debouncer.touch('mv_units_location')
+    debouncer.touch('mv_halls_location')
+    refreshed = []
+    for _ in range(6):
+        clock.now += 1
+        debouncer.touch('mv_units_location')
+        refreshed.extend(debouncer.pop_due())
+    assert refreshed == ['mv_halls_location', 'mv_units_location']
+
+
+@pytest.fixture
+def matview_connection(scratch_db):
+    """Соединение со scratch-БД, где есть представления и триггеры уведомлений"""
+    connection = models_db.get_db(scratch_db)
+    sync_matviews(connection, triggers=True)
+    reference_cache.clear()
+    yield connection
+    sync_matviews(connection, triggers=False)
+    reference_cache.clear()
+    connection.close()
+
+
+def count_rows(cursor, table):
+    cursor.execute(f'SELECT count(*) FROM {table}')
+    return cursor.fetchone()[0]
+
+
+def test_refresh_after_notify(matview_connection, scratch_db):
+    """Изменение таблицы - уведомление с именем представления, REFRESH - новые строки в нем"""
+    view = next(model._materialized_view for model in MATVIEW_MODELS if model._table == 'units')
+    listener = models_db.get_db(scratch_db)
+    listener.autocommit = True
+    try:
+        with listener.cursor() as cursor:
+            cursor.execute(f'LISTEN {REFRESH_CHANNEL}')
+        with matview_connection.cursor() as cursor:
+            before = count_rows(cursor, view)
+            cursor.execute('''
+                INSERT INTO units ("UnitName", "DateStart", "Cost", "CostYear", "CostAfter", "Period", "HallID", "ChiefID")
+                SELECT 'pytest matview', "DateStart", "Cost", "CostYear", "CostAfter", "Period", "HallID", "ChiefID"
+                FROM units LIMIT 1
+            ''')
+            assert count_rows(cursor, view) == before
+
+            assert select.select([listener], [], [], 5) != ([], [], [])
+            listener.poll()
+            assert view in {notify.payload for notify in listener.notifies}
+            assert {notify.channel for notify in listener.notifies} == {REFRESH_CHANNEL}
+
+            timings = refresh_matviews(matview_connection, [view])
+            assert list(timings) == [view] and timings[view] >= 0
+            assert count_rows(cursor, view) == before + 1
+            cursor.execute('DELETE FROM units WHERE "UnitName" = %s', ('pytest matview',))
+            refresh_matviews(matview_connection, [view])
+            assert count_rows(cursor, view) == before
+    finally:
+        listener.close()
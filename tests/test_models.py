@@ -0,0 +1,30 @@
+from api.models import UnitModel
+
+
+def test_select_defaults_to_own_table(pg):
+    """Без load связанные таблицы не читаются; joined и selectin дают одинаковые строки"""
+    model = UnitModel(pg)
+    own = set(model.get_own_columns())
+    rows = model.select_all()
+    assert rows and set(rows[0]) == own
+    assert set(model.select_page(2)[0]) == own
+    assert set(next(iter(model.iter_all()))) == own
+
+    joined = model.select_all(load='joined')
+    assert set(joined[0]) > own and 'HallName' in joined[0]
+    assert [dict(row) for row in model.select_all(load='selectin')] == [dict(row) for row in joined]
+
+
+def test_backref_lists_keep_relations(pg):
+    """Списки связанных записей (выбор в формах) по-прежнему с полями связей"""
+    model = UnitModel(pg)
+    halls = model._fields['HallID'].select_all()
+    assert halls and 'HallName' in halls[0]
+
+
+def test_list_endpoint_loads_relations(client, auth_headers):
+    """Списки API включают загрузку связей сами (LIST_RELATIONS_LOAD)"""
+    row = client.get('/api/units/?limit=1', headers=auth_headers).get_json()['results'][0]
+    assert row['hall'] and row['chief']
+    row = client.get('/api/units/?limit=1&load=none', headers=auth_headers).get_json()['results'][0]
+    assert 'hall' not in row
@@ -0,0 +1,92 @@
+import base64
+import json
+
+import pytest
+
+from api.api_exceptions import BadRequestResourceError
+from api.pagination import decode_cursor, encode_cursor
+
+
+def make_cursor(data):
+    """Курсор с произвольным содержимым (как подделанный клиентом)"""
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def fetch_pages(client, headers, url):
+    """Все страницы коллекции по ссылкам next"""
+    pages = []
+    while url:
+        response = client.get(url, headers=headers)
+        assert response.status_code == 200, response.get_json()
+        pages.append(response.get_json())
+        url = pages[-1]['next']
+    return pages
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(42)) == 42
+    assert decode_cursor(encode_cursor(['10.50', None, 'Шкаф', 7]), 4) == ['10.50', None, 'Шкаф', 7]
+
+
+@pytest.mark.parametrize('cursor, size', [
+    ('broken', 1),
+    ('!!!', 1),
+    (base64.urlsafe_b64encode(b'not json').decode(), 1),
+    (make_cursor([1]), 1),
+    (make_cursor({'before': 1}), 1),
+    (make_cursor({'after': '1'}), 1),
+    (make_cursor({'after': 1}), 2),
+    (make_cursor({'after': [1]}), 2),
+    (make_cursor({'after': [1, 2, 3]}), 2),
+    (make_cursor({'after': [[1], 2]}), 2),
+    (make_cursor({'after': [{'a': 1}, 2]}), 2),
+])
+def test_invalid_cursor(cursor, size):
+    with pytest.raises(BadRequestResourceError) as e:
+        decode_cursor(cursor, size)
+    assert e.value.serialize()['errors'][0]['info'] == {'cursor': 'Invalid cursor'}
+
+
+def test_pages_cover_collection(client, auth_headers):
+    """Страницы по курсору - вся коллекция без повторов, у последней нет next"""
+    everything = client.get('/api/targets/?limit=1000', headers=auth_headers).get_json()
+    assert everything['next'] is None
+    ids = [row['id'] for row in everything['results']]
+    assert len(ids) > 2
+
+    pages = fetch_pages(client, auth_headers, '/api/targets/?limit=2')
+    assert [len(page['results']) for page in pages[:-1]] == [2] * (len(pages) - 1)
+    assert [row['id'] for page in pages for row in page['results']] == sorted(ids)
+    # Страница ровно по размеру коллекции - тоже последняя
+    page = client.get(f'/api/targets/?limit={len(ids)}', headers=auth_headers).get_json()
+    assert page['next'] is None and len(page['results']) == len(ids)
+
+
+def test_cursor_after_last_row(client, auth_headers):
+    ids = [row['id'] for row in client.get('/api/targets/?limit=1000', headers=auth_headers).get_json()['results']]
+    response = client.get(f'/api/targets/?cursor={encode_cursor(max(ids))}', headers=auth_headers)
+    assert response.get_json() == {'results': [], 'next': None}
+
+
+def test_cursor_with_sort(client, auth_headers):
+    """Ключ страницы при сортировке - значения колонок сортировки и id"""
+    everything = client.get('/api/units/?limit=1000&sort=-cost,unit', headers=auth_headers).get_json()['results']
+    pages = fetch_pages(client, auth_headers, '/api/units/?limit=3&sort=-cost,unit&fields=cost,unit')
+    assert [row['id'] for page in pages for row in page['results']] == [row['id'] for row in everything]
+    costs = [row['cost'] for page in pages for row in page['results']]
+    assert costs == sorted(costs, reverse=True)
+
+
+@pytest.mark.parametrize('query', [
+    'cursor=broken',
+    f'cursor={make_cursor({"after": "1"})}',
+    # Курсор без сортировки не подходит к запросу с сортировкой и наоборот
+    f'cursor={encode_cursor(1)}&sort=-cost',
+    f'sort=cost&cursor={encode_cursor(["1", "Шкаф", 1])}',
+    'limit=0',
+    'limit=abc',
+    'limit=1001',
+])
+def test_invalid_page_args(client, auth_headers, query):
+    response = client.get(f'/api/units/?{query}', headers=auth_headers)
+    assert response.status_code == 400
@@ -0,0 +1,78 @@
+import pytest
+
+from api.models import HallModel, UnitModel
+
+
+def count_units(pg):
+    with pg as cursor:
+        cursor.execute('SELECT count(*) AS "count" FROM units')
+        return cursor.fetchone()['count']
+
+
+@pytest.fixture
+def unit_fields(pg):
+    """Поля существующего имущества (без названия)"""
+    unit = UnitModel(pg).select_all()[0]
+    return {
+        key: unit[key]
+        for key in ('DateStart', 'Cost', 'CostYear', 'CostAfter', 'Period', 'HallID', 'ChiefID')
+    }
+
+
+def test_missing_refs_stmt_skips_empty(pg):
+    model = UnitModel(pg)
+    assert model.get_missing_refs_stmt({}) == (None, None)
+    assert model.get_missing_refs_stmt({'HallID': [], 'ChiefID': set()}) == (None, None)
+
+
+def test_missing_refs_one_query(pg, unit_fields):
+    """Все ссылки всех полей - одним запросом по массивам id (unnest)"""
+    model = UnitModel(pg)
+    stmt, vars = model.get_missing_refs_stmt({
+        'HallID': [unit_fields['HallID'], 999999, 999998],
+        'ChiefID': {unit_fields['ChiefID'], 999997},
+    })
+    assert vars == [[unit_fields['HallID'], 999999, 999998], [unit_fields['ChiefID'], 999997]]
+    with pg as cursor:
+        cursor.execute(stmt, vars)
+        rows = cursor.fetchall()
+    assert {(row['field'], row['id']) for row in rows} == {
+        ('HallID', 999999), ('HallID', 999998), ('ChiefID', 999997)
+    }
+
+
+def test_check_refs(pg, unit_fields):
+    """Не кешируемые связи (помещения) проверяются запросом, справочники - через кеш"""
+    model = UnitModel(pg)
+    assert model.check_refs(unit_fields) == {}
+    errors = model.check_refs({**unit_fields, 'HallID': 999999, 'ChiefID': 999998})
+    assert sorted(errors.values()) == [
+        'Отсуствуют связанное поле "ChiefID" с индексом 999998',
+        'Отсуствуют связанное поле "HallID" с индексом 999999',
+    ]
+    hall = HallModel(pg).select_all()[0]
+    assert HallModel(pg).check_refs({'KadastrID': hall['KadastrID']}) == {}
+    assert list(HallModel(pg).check_refs({'KadastrID': 999999}).values()) == [
+        'Отсуствуют связанное поле "KadastrID" с индексом 999999'
+    ]
+
+
+def test_bulk_create_reports_missing_refs_per_row(pg, unit_fields):
+    """Ошибки ссылок - по номерам строк, при ошибке не добавляется ничего"""
+    model = UnitModel(pg)
+    before = count_units(pg)
+    result = model.bulk_create([
+        {**unit_fields, 'UnitName': 'pytest refs 0'},
+        {**unit_fields, 'UnitName': 'pytest refs 1', 'HallID': 999999},
+        {**unit_fields, 'UnitName': 'pytest refs 2'},
+        {**unit_fields, 'UnitName': 'pytest refs 3', 'HallID': 999999, 'ChiefID': 999998},
+    ], batch_size=2)
+    errors = result['!errors']
+    assert {index: sorted(messages.values()) for index, messages in errors.items()} == {
+        1: ['Отсуствуют связанное поле "HallID" с индексом 999999'],
+        3: [
+            'Отсуствуют связанное поле "ChiefID" с индексом 999998',
+            'Отсуствуют связанное поле "HallID" с индексом 999999',
+        ],
+    }
+    assert count_units(pg) == before
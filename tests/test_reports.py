@@ -0,0 +1,85 @@
+from collections import defaultdict
+from decimal import Decimal
+
+import pytest
+
+from api.models import UnitModel
+
+
+@pytest.fixture
+def units(pg):
+    return UnitModel(pg).select_all(load='joined')
+
+
+def totals(units, *keys):
+    """Количество и стоимость имущества по значениям колонок keys"""
+    result = defaultdict(lambda: [0, Decimal(0)])
+    for unit in units:
+        total = result[tuple(unit[key] for key in keys)]
+        total[0] += 1
+        total[1] += unit['Cost']
+    return {key: tuple(value) for key, value in result.items()}
+
+
+def by_grouping(rows, grouping, *keys):
+    return {
+        tuple(row[key] for key in keys): (row['count'], row['cost'])
+        for row in rows
+        if row['grouping'] == grouping
+    }
+
+
+def test_rollup(pg, units):
+    """ROLLUP (здание, помещение): помещения, итоги по зданиям и общий итог"""
+    rows = UnitModel(pg).select_cost_report(['building', 'hall'])
+    assert by_grouping(rows, 0, 'building_id', 'hall_id') == totals(units, 'IDKadastr', 'IDHall')
+    assert by_grouping(rows, 1, 'building_id') == totals(units, 'IDKadastr')
+    assert by_grouping(rows, 3) == totals(units)
+    assert {row['grouping'] for row in rows} == {0, 1, 3}
+    # Итог здания - сразу после его помещений, общий итог - последним
+    assert rows[-1]['grouping'] == 3 and rows[-1]['building_id'] is None
+    for number, row in enumerate(rows[:-1]):
+        if row['grouping'] == 1:
+            assert rows[number - 1]['building_id'] == row['building_id']
+            assert rows[number - 1]['grouping'] == 0
+
+
+def test_grouping_sets(pg, units):
+    """GROUPING SETS: итоги по каждому измерению отдельно, без сочетаний"""
+    rows = UnitModel(pg).select_cost_report(['building', 'chief'], grouping_sets=True)
+    assert by_grouping(rows, 1, 'building_id') == totals(units, 'IDKadastr')
+    assert by_grouping(rows, 2, 'chief_id') == totals(units, 'IDChief')
+    assert by_grouping(rows, 3) == totals(units)
+    assert 0 not in {row['grouping'] for row in rows}
+    assert [row['grouping'] for row in rows] == sorted(row['grouping'] for row in rows)
+
+
+def test_report_filters(pg, units):
+    cost = sorted(unit['Cost'] for unit in units)[len(units) // 2]
+    rows = UnitModel(pg).select_cost_report(['department'], filters=[('Cost', 'gte', cost)])
+    expected = [unit for unit in units if unit['Cost'] >= cost]
+    assert by_grouping(rows, 1) == totals(expected)
+    assert by_grouping(rows, 0, 'department_id') == totals(expected, 'IDDepartment')
+
+
+def test_cost_report_api(client, auth_headers, units):
+    response = client.get('/api/reports/costs?by=chief,building&mode=sets&cost__gt=0', headers=auth_headers)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['by'], body['mode']) == (['chief', 'building'], 'sets')
+    total = body['results'][-1]
+    assert total == {
+        'count': len([unit for unit in units if unit['Cost'] > 0]),
+        'cost': float(sum(unit['Cost'] for unit in units if unit['Cost'] > 0)),
+        'cost_after': total['cost_after'],
+        'avg_age': total['avg_age'],
+        'grouping': 3,
+        'chief_id': None,
+        'chief': None,
+        'building_id': None,
+        'building': None,
+    }
+    # По умолчанию - ROLLUP по зданиям
+    body = client.get('/api/reports/costs', headers=auth_headers).get_json()
+    assert (body['by'], body['mode']) == (['building'], 'rollup')
+    assert [row['grouping'] for row in body['results']][-1] == 1
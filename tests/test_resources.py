@@ -0,0 +1,80 @@
+import pytest
+from werkzeug.datastructures import Headers, MultiDict
+
+from api.api_exceptions import (
+    BadRequestResourceError,
+    NoInputDataError,
+    NotFoundResourceError,
+    NotUniqueDataError,
+)
+from api.models import UnitModel
+from api.resources import (
+    bulk_deleted,
+    bulk_updated,
+    check_entry,
+    get_bulk_delete_ids,
+    load_bulk_patch,
+    load_entry,
+    parse_cost_report_args,
+    parse_search_args,
+    return_minimal,
+)
+from api.schemas import target_schema
+
+
+def test_return_minimal():
+    assert return_minimal(Headers([('Prefer', 'respond-async, return=minimal')]))
+    assert return_minimal(Headers([('Prefer', 'x'), ('Prefer', 'Return=Minimal')]))
+    assert not return_minimal(Headers([('Prefer', 'return=representation')]))
+
+
+def test_load_entry():
+    assert load_entry(target_schema, {'target': 'a'}) == {'Target': 'a'}
+    with pytest.raises(NoInputDataError):
+        load_entry(target_schema, {})
+    with pytest.raises(BadRequestResourceError):
+        load_entry(target_schema, {'target': 1})
+
+
+def test_check_entry_maps_model_errors():
+    assert check_entry({'id': 1}) == {'id': 1}
+    with pytest.raises(NotFoundResourceError):
+        check_entry({'!error': 'нет', '!not_found': True}, 5)
+    with pytest.raises(BadRequestResourceError) as e:
+        check_entry({'!error_1': 'a', '!error_2': 'b'})
+    assert e.value.serialize()['errors'][0]['info'] == {'errors': ['a', 'b']}
+
+
+def test_bulk_helpers():
+    ids, result, value = load_bulk_patch(target_schema, 'target', {'ids': [3], 'patch': {'target': 'a'}})
+    assert (ids, result, value) == ([3], {'Target': 'a'}, 'a')
+    with pytest.raises(NotUniqueDataError):
+        load_bulk_patch(target_schema, 'target', {'ids': [1, 2], 'patch': {'target': 'a'}})
+    with pytest.raises(NoInputDataError):
+        load_bulk_patch(target_schema, 'target', {'ids': [1], 'patch': {}})
+    assert get_bulk_delete_ids(None, MultiDict({'ids': '1,2'})) == [1, 2]
+    with pytest.raises(BadRequestResourceError):
+        get_bulk_delete_ids(None, MultiDict())
+    assert bulk_updated([1, 2, 2], [2]) == {'updated': [2], 'missing': [1]}
+    assert bulk_deleted([1, 2], [1, 2]) == {'deleted': [1, 2], 'missing': []}
+    with pytest.raises(BadRequestResourceError):
+        bulk_updated([1], {'!error_1': 'a'})
+
+
+def test_parse_cost_report_args():
+    model = UnitModel(None)
+    dimensions, mode, args = parse_cost_report_args(MultiDict({'by': 'hall, chief', 'cost__gt': '1'}), model)
+    assert (dimensions, mode, dict(args)) == (['hall', 'chief'], 'rollup', {'cost__gt': '1'})
+    for args in ({'by': 'hall,hall'}, {'by': 'floor'}, {'mode': 'cube'}):
+        with pytest.raises(BadRequestResourceError):
+            parse_cost_report_args(MultiDict(args), model)
+
+
+def test_parse_search_args():
+    types = ('units', 'halls')
+    config = {'SEARCH_LIMIT': 3, 'SEARCH_MAX_LIMIT': 10}
+    assert parse_search_args(MultiDict({'q': ' шкаф '}), config, types) == ('шкаф', 3, None)
+    assert parse_search_args(MultiDict({'q': 'a', 'types': 'halls,'}), config, types) == ('a', 3, ['halls'])
+    for args in ({}, {'q': 'a', 'limit': '11'}, {'q': 'a', 'types': 'users'}):
+        with pytest.raises(BadRequestResourceError):
+            parse_search_args(MultiDict(args), config, types)
@@ -0,0 +1,78 @@
+import pytest
+
+from api.models import HallModel, PGCursor, SearchModel, UnitModel
+from api.models import db as models_db
+from api.models.cache import reference_cache
+
+
+@pytest.fixture
+def search_pg(scratch_db):
+    """Соединение со scratch-БД, где включен поиск (триггеры и документы)"""
+    models_db.db_indexes(scratch_db, indexes_only=True, search=True)
+    # Кеш справочников общий для процесса, а строки - из другой БД
+    reference_cache.clear()
+    pg = PGCursor(models_db.get_db(scratch_db))
+    yield pg
+    pg.close()
+    reference_cache.clear()
+    models_db.db_indexes(scratch_db, indexes_only=True, search=False)
+
+
+def get_document(pg, entity, index):
+    with pg as cursor:
+        cursor.execute(
+            'SELECT "title", "document"::text AS "document" FROM search_documents '
+            'WHERE "entity" = %s AND "id" = %s',
+            (entity, index),
+        )
+        return cursor.fetchone()
+
+
+def test_hall_document_has_descriptive_columns(search_pg):
+    """Заголовок помещения - HallName (номер, тип, здание), в документе - кафедра и адрес"""
+    hall = HallModel(search_pg).select_all(load='joined')[0]
+    document = get_document(search_pg, 'halls', hall['IDHall'])
+    assert document['title'] == hall['HallName']
+    assert hall['HallName'] != str(hall['HallNumber'])
+
+    found = SearchModel(search_pg).search(hall['DepartmentName'], limit=100, entities=['halls'])
+    assert hall['IDHall'] in {row['id'] for row in found}
+    found = SearchModel(search_pg).search(hall['BuildingName'], limit=100, entities=['halls'])
+    assert hall['IDHall'] in {row['id'] for row in found}
+
+
+def test_trigger_keeps_documents_in_sync(search_pg):
+    """Добавление, изменение и удаление строки меняют ее документ"""
+    model = UnitModel(search_pg)
+    unit = model.select_all()[0]
+    fields = {
+        key: unit[key]
+        for key in ('DateStart', 'Cost', 'CostYear', 'CostAfter', 'Period', 'HallID', 'ChiefID')
+    }
+    row = model.create(UnitName='Пылесос моющий', **fields)
+    index = row['IDUnit']
+    assert get_document(search_pg, 'units', index)['title'] == 'Пылесос моющий'
+    assert [found['id'] for found in SearchModel(search_pg).search('пылесосы', entities=['units'])] == [index]
+
+    model.update_by_id(index, UnitName='Полотер')
+    assert get_document(search_pg, 'units', index)['title'] == 'Полотер'
+    assert SearchModel(search_pg).search('пылесос', entities=['units']) == []
+
+    model.delete(index)
+    assert get_document(search_pg, 'units', index) is None
+
+    hall = HallModel(search_pg).select_all(load='joined')[0]
+    HallModel(search_pg).update_by_id(hall['IDHall'], HallNumber=hall['HallNumber'] + 1000)
+    title = get_document(search_pg, 'halls', hall['IDHall'])['title']
+    assert title.startswith(f"{hall['HallNumber'] + 1000}, ")
+    HallModel(search_pg).update_by_id(hall['IDHall'], HallNumber=hall['HallNumber'])
+
+
+def test_search_ranks_title_first(search_pg):
+    """Совпадение в заголовке (вес A) выше совпадения в остальном тексте (вес B)"""
+    hall = HallModel(search_pg).select_all(load='joined')[0]
+    found = SearchModel(search_pg).search(hall['BuildingName'], limit=100)
+    entities = {row['entity'] for row in found}
+    assert {'buildings', 'halls'} <= entities
+    building = next(row for row in found if row['entity'] == 'buildings')
+    assert building['title'] == hall['BuildingName']
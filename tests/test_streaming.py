@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from api.db import get_pool
+from api.models import UnitModel
+from api.streaming import iter_json_array_items
+
+
+def test_stream_keeps_connection_during_concurrent_request(app, client, auth_headers, pg, monkeypatch):
+    """Потоковая выдача не отдает свое соединение следующему запросу"""
+    with pg as cursor:
+        cursor.execute('SELECT count(*) AS count FROM units')
+        count = cursor.fetchone()['count']
+    assert count > 2
+    # Курсор дочитывает строки с сервера по 2, выдача - по одной записи
+    monkeypatch.setattr(UnitModel, '_itersize', 2)
+    app.config['STREAM_CHUNK_SIZE'] = 1
+
+    response = client.get('/api/units/?stream=1&load=none', headers=auth_headers, buffered=False)
+    chunks = iter(response.response)
+    body = next(chunks) + next(chunks) + next(chunks)
+    with app.app_context():
+        assert get_pool().stats()['in_use'] == 1
+
+    # Запрос посреди выдачи фиксирует свою транзакцию
+    assert client.get('/api/units/?limit=1', headers=auth_headers).status_code == 200
+
+    body += b''.join(chunks)
+    response.close()
+    assert len(json.loads(body)) == count
+    with app.app_context():
+        assert get_pool().stats()['in_use'] == 0
+
+
+def test_stream_closed_unread_releases_connection(app, client, auth_headers):
+    response = client.get('/api/units/?stream=1', headers=auth_headers, buffered=False)
+    response.close()
+    with app.app_context():
+        assert get_pool().stats()['in_use'] == 0
+
+
+def split(text, size):
+    return [text[pos:pos + size] for pos in range(0, len(text), size)]
+
+
+def parse(text, size):
+    return list(iter_json_array_items(split(text, size)))
+
+
+@pytest.mark.parametrize('text', [
+    '[]',
+    ' [ \n ] ',
+    '[1, 2.5, -3e2, true, false, null]',
+    '["a]b", "c,d", "e\\"f", "g\\\\", "\\u005d", "]", ","]',
+    '[{"a": [1, {"b": "]}"}], "c": {}}, [], [[]], {"d": "x,y"}]',
+    '[12345678901234567890, 4.5, "длинная строка"]',
+])
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 1000])
+def test_iter_json_array_items_matches_json_loads(text, size):
+    """Разбор по порциям любого размера совпадает с json.loads"""
+    assert parse(text, size) == json.loads(text)
+
+
+@pytest.mark.parametrize('text', [
+    '',
+    '   ',
+    '{"a": 1}',
+    '1',
+    '[1, 2',
+    '[1, 2,',
+    '[1,]',
+    '[,1]',
+    '[1 2]',
+    '["unterminated]',
+    '[1] xyz',
+    '[1]]',
+    '[1] [2]',
+])
+@pytest.mark.parametrize('size', [1, 3, 1000])
+def test_iter_json_array_items_rejects_invalid(text, size):
+    with pytest.raises(ValueError):
+        parse(text, size)
@@ -0,0 +1,187 @@
+import time
+
+import pytest
+
+from api import tokens
+from api.tokens import (
+    TokenRevocations,
+    b64decode,
+    b64encode,
+    decode_token,
+    issue_token,
+    token_revocations,
+    verify_token,
+)
+
+SECRET = b'pytest-secret'
+USER = {'id': 7, 'is_admin': False}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое время модуля токенов (секунды эпохи)"""
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(tokens.time, 'time', lambda: now[0])
+    return now
+
+
+def test_issue_and_verify():
+    token, expires = issue_token(SECRET, USER, 900)
+    claims = decode_token(SECRET, token)
+    assert claims['sub'] == 7 and claims['adm'] is False and claims['exp'] == expires
+    assert verify_token(SECRET, token, TokenRevocations()) == USER
+
+
+def test_tampered_token_is_rejected():
+    token, _ = issue_token(SECRET, USER, 900)
+    payload, signature = token.split('.')
+    # Подмена содержимого при старой подписи
+    forged = b64decode(payload).replace(b'"adm":false', b'"adm":true')
+    assert decode_token(SECRET, f'{b64encode(forged)}.{signature}') is None
+    # Испорченная подпись, чужой ключ, мусор
+    broken = b64encode(bytes(byte ^ 1 for byte in b64decode(signature)))
+    assert decode_token(SECRET, f'{payload}.{broken}') is None
+    assert decode_token(b'other-secret', token) is None
+    for garbage in ('', 'abc', 'a.b.c', f'{payload}.', f'{payload}.!!!', token + '.x'):
+        assert decode_token(SECRET, garbage) is None
+
+
+def test_signed_payload_must_have_all_claims():
+    payload = b'{"sub":7}'
+    token = f'{b64encode(payload)}.{b64encode(tokens.sign(SECRET, payload))}'
+    assert decode_token(SECRET, token) is None
+    payload = b'[1,2]'
+    token = f'{b64encode(payload)}.{b64encode(tokens.sign(SECRET, payload))}'
+    assert decode_token(SECRET, token) is None
+
+
+def test_expired_token(clock):
+    token, expires = issue_token(SECRET, USER, 60)
+    revocations = TokenRevocations(60)
+    clock[0] = expires
+    assert verify_token(SECRET, token, revocations) == USER
+    clock[0] = expires + 1
+    assert verify_token(SECRET, token, revocations) is None
+    # Подпись при этом верна
+    assert decode_token(SECRET, token) is not None
+
+
+def test_revoke_single_token(clock):
+    revocations = TokenRevocations()
+    first, _ = issue_token(SECRET, USER, 900)
+    second, _ = issue_token(SECRET, USER, 900)
+    revocations.revoke(decode_token(SECRET, first))
+    assert verify_token(SECRET, first, revocations) is None
+    assert verify_token(SECRET, second, revocations) == USER
+
+
+def test_revoke_user_sets_not_before(clock):
+    revocations = TokenRevocations()
+    old, _ = issue_token(SECRET, USER, 900)
+    other, _ = issue_token(SECRET, {'id': 8, 'is_admin': True}, 900)
+    clock[0] += 0.0005
+    revocations.revoke_user(7)
+    assert verify_token(SECRET, old, revocations) is None
+    assert verify_token(SECRET, other, revocations) == {'id': 8, 'is_admin': True}
+    # Токен, выданный после отзыва, действует
+    clock[0] += 1
+    new, _ = issue_token(SECRET, USER, 900)
+    assert verify_token(SECRET, new, revocations) == USER
+
+
+def test_revoke_all(clock):
+    revocations = TokenRevocations()
+    tokens_before = [issue_token(SECRET, {'id': user, 'is_admin': False}, 900)[0] for user in (1, 2)]
+    clock[0] += 1
+    revocations.revoke_all()
+    assert all(verify_token(SECRET, token, revocations) is None for token in tokens_before)
+    clock[0] += 1
+    token, _ = issue_token(SECRET, USER, 900)
+    assert verify_token(SECRET, token, revocations) == USER
+
+
+def test_revocations_are_pruned(clock):
+    revocations = TokenRevocations(60)
+    token, _ = issue_token(SECRET, USER, 60)
+    revocations.revoke(decode_token(SECRET, token))
+    revocations.revoke_user(7)
+    assert revocations.stats() == {'tokens': 1, 'users': 1, 'ttl': 60}
+    # Когда отозванные токены истекли сами, записи об отзыве не нужны
+    clock[0] += 120
+    revocations.revoke_user(8)
+    assert revocations.stats() == {'tokens': 0, 'users': 1, 'ttl': 60}
+
+
+def test_revocations_from_other_process(clock, monkeypatch):
+    """Строки отзыва одного процесса, примененные другим, отзывают те же токены"""
+    first, second = TokenRevocations(sync_interval=5), TokenRevocations(sync_interval=5)
+    token, _ = issue_token(SECRET, USER, 900)
+    other, _ = issue_token(SECRET, {'id': 8, 'is_admin': False}, 900)
+    clock[0] += 1
+    rows = first.revoke(decode_token(SECRET, token)) + first.revoke_user(8)
+    assert verify_token(SECRET, token, second) == USER
+    second.apply(rows)
+    assert verify_token(SECRET, token, second) is None
+    assert verify_token(SECRET, other, second) is None
+    # Повторное применение тех же строк ничего не меняет
+    second.apply(rows)
+    assert second.stats() == first.stats()
+
+    monotonic = [100.0]
+    monkeypatch.setattr(tokens.time, 'monotonic', lambda: monotonic[0])
+    assert TokenRevocations().needs_sync()
+    second.apply([])
+    monotonic[0] += 4
+    assert not second.needs_sync()
+    monotonic[0] += 1
+    assert second.needs_sync()
+
+
+def test_revocations_table(revocations_table, clock):
+    model = revocations_table
+    revocations = TokenRevocations(60)
+    token, _ = issue_token(SECRET, USER, 60)
+    model.insert_many(revocations.revoke(decode_token(SECRET, token)) + revocations.revoke_all(), clock[0])
+    rows = model.select_active(clock[0])
+    assert [(row['jti'], row['user_id']) for row in rows] == [
+        (decode_token(SECRET, token)['jti'], None), (None, None)
+    ]
+    # Истекшие строки не читаются и удаляются при следующей записи
+    clock[0] += 120
+    assert model.select_active(clock[0]) == []
+    model.insert_many(revocations.revoke_user(7), clock[0])
+    assert [row['user_id'] for row in model.select_active(0)] == [7]
+
+
+def test_bearer_token_revoked_by_other_process(client, auth_headers, revocations_table):
+    """Отзыв, записанный в таблицу другим процессом, действует после перечитывания"""
+    token = client.post('/api/tokens/', headers=auth_headers).get_json()['token']
+    bearer = {'Authorization': f'Bearer {token}'}
+    assert client.get('/api/units/?limit=1', headers=bearer).status_code == 200
+    other = TokenRevocations()
+    revocations_table.insert_many(other.revoke(decode_token(b'pytest-secret', token)), time.time())
+    # Пока не прошел интервал чтения - копия процесса старая
+    token_revocations.sync_interval = 3600
+    assert client.get('/api/units/?limit=1', headers=bearer).status_code == 200
+    token_revocations.sync_interval = 0
+    assert client.get('/api/units/?limit=1', headers=bearer).status_code == 401
+
+
+def test_bearer_token_api(client, auth_headers):
+    response = client.post('/api/tokens/', headers=auth_headers)
+    assert response.status_code == 200
+    token = response.get_json()['token']
+    bearer = {'Authorization': f'Bearer {token}'}
+    assert client.get('/api/units/?limit=1', headers=bearer).status_code == 200
+    assert client.get('/api/units/?limit=1', headers={'Authorization': f'Bearer {token}x'}).status_code == 401
+
+
+def test_tokens_disabled_without_secret(app, client, auth_headers):
+    """Без ключа в конфиге токены не выдаются и не принимаются"""
+    token, _ = issue_token(SECRET, USER, 900)
+    app.config['TOKEN_SECRET_KEY'] = None
+    response = client.post('/api/tokens/', headers=auth_headers)
+    assert response.status_code == 404
+    assert response.get_json()['errors'][0]['code'] == 'tokens-disabled'
+    assert client.get('/api/units/?limit=1', headers={'Authorization': f'Bearer {token}'}).status_code == 401
+    assert client.get('/api/units/?limit=1', headers=auth_headers).status_code == 200
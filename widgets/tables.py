@@ -20,7 +20,7 @@ class BaseTable(tk.Frame):
             self._create_table()
 
     def get_users(self):
-        return self.table_model.select_all()
+        return self.table_model.select_all(load='joined')
 
     def _create_table(self):
         """Создание таблицы договоров"""
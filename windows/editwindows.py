@@ -118,7 +118,6 @@ class BaseEditWindow:
                 self.parent.returned_entry = None
                 showerror(title, collect_message(answer))
             else:
-                answer = self.model.select_by_id(answer[self.model._primary_key])
                 self.parent.returned_entry = answer
                 showinfo(
                     f'{self._SHOWTITLE}: добавление',
@@ -131,7 +130,6 @@ class BaseEditWindow:
                 self.parent.returned_entry = None
                 showerror(title, collect_message(answer))
             else:
-                answer = self.model.select_by_id(answer[self.model._primary_key])
                 self.parent.returned_entry = answer
                 showinfo(
                     f'{self._SHOWTITLE}: обновление',
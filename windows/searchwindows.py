@@ -64,7 +64,7 @@ class BaseSearchWindow:
         self.model_table.tree.delete(*self.model_table.tree.get_children())
         search_keys = {key: value.get() for key, value in self.data.items() if value.get()}
         if not search_keys:
-            rows = self.model.select_all()
+            rows = self.model.select_all(load='joined')
         else:
             rows = self.model.select_likes(search_keys)
 